@@ -0,0 +1,32 @@
+"""
+Request helpers shared by main.py and api/routes/face_recognition.py.
+"""
+
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+
+from config.settings import FACE_DETECTOR
+from face_recognition_local.detectors import DETECTOR_BACKENDS, resolve_detector
+from face_recognition_local.upload_limits import UploadRejected, read_image_upload
+
+DETECTOR_FIELD_DESCRIPTION = f"Face detector backend: {', '.join(DETECTOR_BACKENDS)} (default: {FACE_DETECTOR})"
+
+def upload_rejected(e: UploadRejected) -> HTTPException:
+    """HTTP error answering an image over a size limit (413)"""
+    print(f"🚫 Upload rejected: {e}")
+    return HTTPException(status_code=e.status_code, detail=str(e))
+
+async def read_image_file(file: UploadFile) -> bytes:
+    """Read an uploaded image, rejecting it if it exceeds the size limits"""
+    try:
+        return await read_image_upload(file)
+    except UploadRejected as e:
+        raise upload_rejected(e)
+
+def request_detector(detector: Optional[str]) -> str:
+    """Validate a per-request detector override (None = FACE_DETECTOR)"""
+    try:
+        return resolve_detector(detector)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
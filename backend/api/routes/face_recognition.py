@@ -4,7 +4,6 @@ from sqlalchemy.orm import Session
 from typing import Optional
 import cv2
 import numpy as np
-import face_recognition
 import os
 import uuid
 from datetime import datetime
@@ -12,79 +11,33 @@ import json
 
 from config.database import get_db, User
 from models.face_recognition import FaceRegistration, FaceVerification, FaceResponse
+from face_recognition_local.encoding_cache import encoding_cache, encode_face_image_cached
+from face_recognition_local.batch_scheduler import encode_batcher
+from face_recognition_local.metrics import current_endpoint, match_distance, record_encode_profile, time_stage
+from api.dependencies import DETECTOR_FIELD_DESCRIPTION, read_image_file, request_detector, upload_rejected
+from face_recognition_local.gallery_store import get_face_gallery
+from face_recognition_local.image_writer import image_writer
+from face_recognition_local.image_store import get_image_store, save_registration_images
+from face_recognition_local.face_engine import encode_face_with_chip, locate_faces
+from face_recognition_local.detectors import detector_status
+from face_recognition_local.executor import run_face_task
+from face_recognition_local.upload_limits import UploadRejected
+from config.settings import (
+    MAX_TEMPLATES_PER_USER, TEMPLATE_AGGREGATION, FACE_MATCH_TOLERANCE, FACE_CHIPS_ENABLED, KEEP_ORIGINAL_IMAGES,
+    FACE_DETECTOR, FACE_IMAGES_DIR
+)
 
 router = APIRouter()
 
-# Directory to store face images
-FACE_IMAGES_DIR = "face_recognition/data/faces"
+# Same image store as main.py (FACE_IMAGES_DIR)
 os.makedirs(FACE_IMAGES_DIR, exist_ok=True)
+image_store = get_image_store(FACE_IMAGES_DIR)
 
-# Simple in-memory storage for demo (in production, use database)
-REGISTERED_FACES = {}  # {user_id: face_encoding}
+# Registered face encodings live in the shared memory-mapped gallery (GALLERY_PATH)
 
-def save_face_image(image_data: bytes, user_id: str) -> str:
-    """Save face image to disk and return filename"""
-    filename = f"user_{user_id}_{uuid.uuid4().hex}.jpg"
-    filepath = os.path.join(FACE_IMAGES_DIR, filename)
-    
-    with open(filepath, "wb") as f:
-        f.write(image_data)
-    
-    return filename
-
-def encode_face_image(image_data: bytes) -> Optional[np.ndarray]:
-    """Encode face from image data"""
-    try:
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            print("❌ Error: Could not decode image")
-            return None
-        
-        print(f"✅ Image decoded successfully. Shape: {image.shape}")
-        
-        # Convert BGR to RGB
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Find face locations
-        face_locations = face_recognition.face_locations(rgb_image)
-        
-        print(f"🔍 Found {len(face_locations)} face(s) in image")
-        
-        if not face_locations:
-            print("❌ No faces detected in image")
-            return None
-        
-        # Get face encodings
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
-        
-        if not face_encodings:
-            print("❌ Could not encode faces")
-            return None
-        
-        print(f"✅ Successfully encoded {len(face_encodings)} face(s)")
-        
-        # Return the first face encoding
-        return face_encodings[0]
-    
-    except ImportError as e:
-        print(f"❌ Error: face_recognition library not installed. Please run: pip install face-recognition")
-        return None
-    except Exception as e:
-        print(f"❌ Error encoding face: {e}")
-        return None
-
-def verify_face_encoding(known_encoding: np.ndarray, unknown_encoding: np.ndarray, tolerance: float = 0.6) -> bool:
-    """Verify if two face encodings match"""
-    try:
-        # Compare face encodings
-        matches = face_recognition.compare_faces([known_encoding], unknown_encoding, tolerance=tolerance)
-        return matches[0] if matches else False
-    except Exception as e:
-        print(f"Error verifying face: {e}")
-        return False
+async def save_face_image(image_data: bytes, user_id: str, face_chip: Optional[dict] = None) -> str:
+    """Save face image (and its face chip, if any) in the content-addressed image store and return filename"""
+    return (await save_registration_images(image_store, user_id, image_data, face_chip, KEEP_ORIGINAL_IMAGES))["filename"]
 
 # ============================================================================
 # 1. FACE REGISTRATION API (Simple version)
@@ -94,6 +47,7 @@ def verify_face_encoding(known_encoding: np.ndarray, unknown_encoding: np.ndarra
 async def register_face(
     file: UploadFile = File(...),
     user_id: str = Form("owner"),  # Default to "owner" for demo
+    detector: Optional[str] = Form(None, description=DETECTOR_FIELD_DESCRIPTION),
     db: Session = Depends(get_db)
 ):
     """
@@ -107,21 +61,30 @@ async def register_face(
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    detector = request_detector(detector)
+    
+    # Read image data, stopping early if it is too large
+    image_data = await read_image_file(file)
+    
     try:
-        # Read image data
-        image_data = await file.read()
-        
-        # Encode face
-        face_encoding = encode_face_image(image_data)
+        # Encode face (from its aligned chip when chips are stored)
+        face_chip = None
+        if FACE_CHIPS_ENABLED:
+            face_chip = await run_face_task(encode_face_with_chip, image_data, detector)
+            face_encoding = face_chip["encoding"] if face_chip is not None else None
+            record_encode_profile(face_chip["profile"] if face_chip is not None else None)
+        else:
+            face_encoding = await encode_face_image_cached(image_data, detector)
         
         if face_encoding is None:
             raise HTTPException(status_code=400, detail="No face detected in image. Please ensure your face is clearly visible.")
         
-        # Save face image
-        filename = save_face_image(image_data, user_id)
+        # Add the encoding as a new template (keeps the user's recent enrollments)
+        gallery = get_face_gallery()
+        gallery.add_template(user_id, face_encoding, MAX_TEMPLATES_PER_USER)
         
-        # Store face encoding in memory (in production, store in database)
-        REGISTERED_FACES[user_id] = face_encoding.tolist()
+        # Save face image (written in the background)
+        filename = await save_face_image(image_data, user_id, face_chip)
         
         print(f"✅ Face registered successfully for user: {user_id}")
         
@@ -132,6 +95,10 @@ async def register_face(
             face_image_path=filename
         )
         
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        raise upload_rejected(e)
     except Exception as e:
         print(f"❌ Error registering face: {e}")
         raise HTTPException(status_code=500, detail=f"Error registering face: {str(e)}")
@@ -144,6 +111,7 @@ async def register_face(
 async def verify_face(
     file: UploadFile = File(...),
     user_id: str = Form("owner"),  # Default to "owner" for demo
+    detector: Optional[str] = Form(None, description=DETECTOR_FIELD_DESCRIPTION),
     db: Session = Depends(get_db)
 ):
     """
@@ -157,25 +125,28 @@ async def verify_face(
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    detector = request_detector(detector)
+    
+    # Read image data, stopping early if it is too large
+    image_data = await read_image_file(file)
+    
     try:
-        # Read image data
-        image_data = await file.read()
-        
         # Encode face from uploaded image
-        unknown_face_encoding = encode_face_image(image_data)
+        unknown_face_encoding = await encode_face_image_cached(image_data, detector)
         
         if unknown_face_encoding is None:
             raise HTTPException(status_code=400, detail="No face detected in image. Please ensure your face is clearly visible.")
         
         # Check if user has registered face
-        if user_id not in REGISTERED_FACES:
+        gallery = get_face_gallery()
+        if user_id not in gallery:
             raise HTTPException(status_code=400, detail="No face registered for this user. Please register your face first.")
         
-        # Get registered face encoding
-        known_face_encoding = np.array(REGISTERED_FACES[user_id])
-        
-        # Verify faces
-        is_match = verify_face_encoding(known_face_encoding, unknown_face_encoding)
+        # Verify faces against all of the user's templates in one pass
+        with time_stage("comparison"):
+            distance = gallery.user_distance(unknown_face_encoding, user_id, TEMPLATE_AGGREGATION)
+        match_distance.observe(distance, current_endpoint.get())
+        is_match = distance <= FACE_MATCH_TOLERANCE
         
         if is_match:
             print(f"✅ Face verification successful for user: {user_id}")
@@ -194,6 +165,10 @@ async def verify_face(
                 confidence=0.0
             )
         
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        raise upload_rejected(e)
     except Exception as e:
         print(f"❌ Error verifying face: {e}")
         raise HTTPException(status_code=500, detail=f"Error verifying face: {str(e)}")
@@ -207,6 +182,7 @@ async def unlock_locker_with_face(
     file: UploadFile = File(...),
     locker_id: str = Form(...),
     user_id: str = Form("owner"),  # Default to "owner" for demo
+    detector: Optional[str] = Form(None, description=DETECTOR_FIELD_DESCRIPTION),
     db: Session = Depends(get_db)
 ):
     """
@@ -220,25 +196,28 @@ async def unlock_locker_with_face(
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    detector = request_detector(detector)
+    
+    # Read image data, stopping early if it is too large
+    image_data = await read_image_file(file)
+    
     try:
-        # Read image data
-        image_data = await file.read()
-        
         # Encode face from uploaded image
-        unknown_face_encoding = encode_face_image(image_data)
+        unknown_face_encoding = await encode_face_image_cached(image_data, detector)
         
         if unknown_face_encoding is None:
             raise HTTPException(status_code=400, detail="No face detected in image. Please ensure your face is clearly visible.")
         
         # Check if user has registered face
-        if user_id not in REGISTERED_FACES:
+        gallery = get_face_gallery()
+        if user_id not in gallery:
             raise HTTPException(status_code=400, detail="No face registered for this user. Please register your face first.")
         
-        # Get registered face encoding
-        known_face_encoding = np.array(REGISTERED_FACES[user_id])
-        
-        # Verify faces
-        is_match = verify_face_encoding(known_face_encoding, unknown_face_encoding)
+        # Verify faces against all of the user's templates in one pass
+        with time_stage("comparison"):
+            distance = gallery.user_distance(unknown_face_encoding, user_id, TEMPLATE_AGGREGATION)
+        match_distance.observe(distance, current_endpoint.get())
+        is_match = distance <= FACE_MATCH_TOLERANCE
         
         if is_match:
             print(f"🔓 Locker {locker_id} unlocked successfully for user: {user_id}")
@@ -259,6 +238,10 @@ async def unlock_locker_with_face(
                 confidence=0.0
             )
         
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        raise upload_rejected(e)
     except Exception as e:
         print(f"❌ Error unlocking locker: {e}")
         raise HTTPException(status_code=500, detail=f"Error unlocking locker: {str(e)}")
@@ -275,7 +258,13 @@ async def face_recognition_status():
         "service": "Face Recognition API",
         "face_images_dir": FACE_IMAGES_DIR,
         "available": os.path.exists(FACE_IMAGES_DIR),
-        "registered_users": list(REGISTERED_FACES.keys()),
+        "registered_users": get_face_gallery().user_ids,
+        "encoding_cache": encoding_cache.stats(),
+        "encode_batching": encode_batcher.stats(),
+        "image_writer": image_writer.stats(),
+        "image_store": image_store.stats(),
+        "face_detector": {"default": FACE_DETECTOR, "backends": detector_status()},
+        "ann_index": get_face_gallery().ann.stats() if get_face_gallery().ann is not None else None,
         "endpoints": {
             "register": "/register - Register user face",
             "verify": "/verify - Verify user face", 
@@ -286,54 +275,51 @@ async def face_recognition_status():
 
 @router.post("/debug-image")
 async def debug_image_processing(
-    file: UploadFile = File(..., description="Image file to debug")
+    file: UploadFile = File(..., description="Image file to debug"),
+    detector: Optional[str] = Form(None, description=DETECTOR_FIELD_DESCRIPTION)
 ):
     """Debug image processing without face recognition"""
     
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    detector = request_detector(detector)
+    
+    # Read image data, stopping early if it is too large
+    image_data = await read_image_file(file)
+    
     try:
-        # Read image data
-        image_data = await file.read()
+        # Decode (reduced for large images) and detect faces in the face-compute pool
+        located, profile = await run_face_task(locate_faces, image_data, detector)
+        record_encode_profile(profile)
         
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
+        if located is None:
             return {
                 "success": False,
                 "message": "Could not decode image",
                 "image_info": None
             }
         
-        # Save debug image
-        debug_filename = f"debug_image_{uuid.uuid4().hex}.jpg"
-        debug_filepath = os.path.join(FACE_IMAGES_DIR, debug_filename)
-        
-        with open(debug_filepath, "wb") as f:
-            f.write(image_data)
-        
-        # Convert BGR to RGB for face detection
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Try face detection
-        face_locations = face_recognition.face_locations(rgb_image)
+        # Save debug image (stored once however often it is debugged)
+        debug_filename = (await image_store.put("debug_images", image_data))["filename"]
         
         return {
             "success": True,
             "message": "Image processed successfully",
             "image_info": {
-                "shape": image.shape,
+                "shape": located["shape"],
                 "filename": debug_filename,
                 "file_size": len(image_data),
                 "content_type": file.content_type,
-                "faces_detected": len(face_locations),
-                "face_locations": face_locations
+                "detector": detector,
+                "detection_ms": round(profile["stages"].get("detection", 0.0) * 1000, 2),
+                "faces_detected": len(located["face_locations"]),
+                "face_locations": located["face_locations"]
             }
         }
         
+    except UploadRejected as e:
+        raise upload_rejected(e)
     except Exception as e:
         return {
             "success": False,
@@ -348,12 +334,12 @@ async def unregister_face(
 ):
     """Remove user's registered face"""
     
-    if user_id not in REGISTERED_FACES:
+    if user_id not in get_face_gallery():
         raise HTTPException(status_code=400, detail="No face registered for this user")
     
     try:
-        # Remove from memory
-        del REGISTERED_FACES[user_id]
+        # Remove from the gallery
+        get_face_gallery().remove(user_id)
         
         print(f"🗑️ Face registration removed for user: {user_id}")
         
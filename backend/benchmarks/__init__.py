@@ -0,0 +1,17 @@
+"""
+Offline benchmarks for the face service.
+
+Runs without the API server and writes machine-readable JSON:
+
+    python -m benchmarks encode  --sizes 480,720,1080 --max-sizes 0,800 --upsample 0,1
+    python -m benchmarks gallery --gallery-sizes 1,1000,100000,1000000
+    python -m benchmarks ann     --size 200000 --nprobe 1,4,16
+    python -m benchmarks load    --mix verify=6,unlock=3,register=1 --rate 20
+    python -m benchmarks all     --output results.json
+
+encode  per-stage latency (decode, resize, color convert, detection,
+        encoding) and throughput across image sizes and detector settings
+gallery 1:1 and 1:N comparison latency over synthetic galleries
+ann     recall and latency of the IVF index against exact search
+load    in-process asyncio load test of the HTTP API (see load.py)
+"""
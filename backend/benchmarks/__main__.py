@@ -0,0 +1,152 @@
+"""Command line entry point: python -m benchmarks <encode|gallery|ann|load|all>"""
+
+import argparse
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+from config.settings import FACE_WORKERS, FACE_DETECTOR
+
+def _int_list(value: str):
+    return [int(item) for item in value.split(",") if item]
+
+def _environment() -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count()
+    }
+
+def run_encode(args) -> list:
+    from benchmarks.corpus import generate_corpus, load_corpus
+    from benchmarks.encode import bench_encode
+    
+    images = load_corpus(args.corpus, args.images) if args.corpus else []
+    if not images:
+        images = generate_corpus(args.images or 16, seed=args.seed)
+        print(f"🖼️  Generated {len(images)} synthetic image(s)")
+    else:
+        print(f"🖼️  Loaded {len(images)} image(s) from {args.corpus}")
+    
+    print("⏱️  Encode benchmark")
+    return bench_encode(images, args.sizes, args.max_sizes, args.upsample, args.workers, args.repeat,
+                        args.detectors)
+
+def run_gallery(args) -> list:
+    from benchmarks.gallery import bench_gallery
+    
+    print("⏱️  Gallery benchmark")
+    return bench_gallery(args.gallery_sizes, args.queries, args.seed)
+
+def run_ann(args) -> dict:
+    from benchmarks.ann import bench_ann
+    
+    print(f"⏱️  ANN benchmark ({args.size} vectors)")
+    return bench_ann(args.size, args.queries, args.lists, args.nprobe, args.k, args.seed)
+
+def run_load_suite(args) -> dict:
+    import asyncio
+    import importlib
+    
+    from benchmarks.corpus import encode_jpeg, generate_corpus, load_corpus
+    from benchmarks.load import parse_mix, run_load
+    
+    images = load_corpus(args.corpus, args.users) if args.corpus else []
+    if not images:
+        images = generate_corpus(args.users, seed=args.seed)
+    
+    # One user per corpus image, with a few JPEG variants so repeated
+    # requests are not all answered by the encoding cache
+    user_images = {
+        f"load_user_{index}": [encode_jpeg([image], args.image_size, quality=90 - variant)[0] for variant in range(args.variants)]
+        for index, image in enumerate(images[:args.users])
+    }
+    
+    module_name, _, attribute = args.app.partition(":")
+    app = getattr(importlib.import_module(module_name), attribute or "app")
+    
+    model = f"open loop at {args.rate} req/s" if args.rate else f"closed loop with {args.concurrency} client(s)"
+    print(f"⏱️  Load test of {args.app}: {model} for {args.duration}s, {len(user_images)} user(s)")
+    report = asyncio.run(run_load(
+        app,
+        user_images,
+        parse_mix(args.mix),
+        duration=args.duration,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        max_requests=args.max_requests,
+        lockers=args.lockers,
+        seed=args.seed
+    ))
+    
+    print(f"   {report['requests']} request(s), {report['throughput_rps']} req/s, error rate {report['error_rate']:.2%}")
+    for name, row in report["operations"].items():
+        print(f"   {name:<16} p50 {row.get('p50_ms')} ms  p95 {row.get('p95_ms')} ms  p99 {row.get('p99_ms')} ms  errors {row['errors']}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Offline face service benchmarks")
+    parser.add_argument("suite", choices=["encode", "gallery", "ann", "load", "all"], nargs="?", default="all",
+                        help="Suite to run; 'all' runs encode, gallery and ann")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=200, help="Probes per gallery/ANN measurement")
+    
+    encode = parser.add_argument_group("encode")
+    encode.add_argument("--corpus", help="Directory of images for encode/load (default: generate synthetic images)")
+    encode.add_argument("--images", type=int, default=0, help="Images to load or generate (0 = all / 16)")
+    encode.add_argument("--sizes", type=_int_list, default=[480, 720, 1080, 1920], help="Image long sides")
+    encode.add_argument("--detectors", type=lambda value: [item for item in value.split(",") if item],
+                        default=[FACE_DETECTOR], help="FACE_DETECTOR backends, e.g. hog,yunet")
+    encode.add_argument("--max-sizes", type=_int_list, default=[0, 800], help="FACE_DETECTION_MAX_SIZE values")
+    encode.add_argument("--upsample", type=_int_list, default=[1], help="FACE_DETECTION_UPSAMPLE values")
+    encode.add_argument("--workers", type=int, default=1, help=f"Encode processes (service default: {FACE_WORKERS})")
+    encode.add_argument("--repeat", type=int, default=1, help="Times each image is encoded")
+    
+    gallery = parser.add_argument_group("gallery")
+    gallery.add_argument("--gallery-sizes", type=_int_list, default=[1, 100, 10000, 100000, 1000000])
+    
+    ann = parser.add_argument_group("ann")
+    ann.add_argument("--size", type=int, default=200000, help="ANN gallery size")
+    ann.add_argument("--lists", type=int, default=0, help="IVF lists (0 = 4 * sqrt(size))")
+    ann.add_argument("--nprobe", type=_int_list, default=[1, 2, 4, 8, 16, 32])
+    ann.add_argument("--k", type=int, default=5, help="Users returned per ANN query")
+    
+    load = parser.add_argument_group("load")
+    load.add_argument("--app", default="main:app", help="ASGI app under test (module:attribute)")
+    load.add_argument("--mix", default="verify=6,unlock=3,register=1",
+                      help="Operation weights: register, verify, unlock, status, list_images, locker_list, locker_get, locker_cycle")
+    load.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    load.add_argument("--concurrency", type=int, default=8, help="Closed-loop clients")
+    load.add_argument("--rate", type=float, default=0.0, help="Open-loop arrivals per second (0 = closed loop)")
+    load.add_argument("--max-requests", type=int, default=0, help="Stop after this many operations (0 = no limit)")
+    load.add_argument("--users", type=int, default=8, help="Users to enroll and probe")
+    load.add_argument("--variants", type=int, default=4, help="JPEG variants per user")
+    load.add_argument("--image-size", type=int, default=720, help="Long side of uploaded images")
+    load.add_argument("--lockers", type=int, default=20, help="Lockers seeded for locker operations")
+    args = parser.parse_args()
+    
+    report = {"environment": _environment()}
+    if args.suite in ("encode", "all"):
+        report["encode"] = run_encode(args)
+    if args.suite in ("gallery", "all"):
+        report["gallery"] = run_gallery(args)
+    if args.suite in ("ann", "all"):
+        report["ann"] = run_ann(args)
+    if args.suite == "load":
+        report["load"] = run_load_suite(args)
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to: {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
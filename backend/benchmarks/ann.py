@@ -0,0 +1,77 @@
+"""
+Recall and latency of the IVF gallery index against exact search.
+
+Trains an IVFIndex over a synthetic gallery and compares top-1/top-k
+results with exact search for several nprobe values. Use it to pick
+ANN_LISTS / ANN_NPROBE for a deployment.
+"""
+
+import time
+from typing import Sequence
+
+from benchmarks.gallery import make_gallery, make_queries
+from benchmarks.stats import summarize
+from face_recognition_local.gallery_index import GalleryIndex
+from face_recognition_local.ann_index import IVFIndex
+
+def bench_ann(size: int, queries: int = 200, lists: int = 0, nprobes: Sequence[int] = (1, 4, 16), k: int = 5, seed: int = 0) -> dict:
+    """
+    :param size: Number of gallery vectors
+    :param queries: Number of probe queries
+    :param lists: IVF lists (0 = 4 * sqrt(size))
+    :param nprobes: nprobe values to compare
+    :param k: Users returned per query
+    :param seed: Random seed
+    :return: Report with exact search latency and one row per nprobe
+    """
+    vectors = make_gallery(size, seed=seed)
+    gallery = GalleryIndex(dim=vectors.shape[1], capacity=size)
+    gallery.add_many([f"user_{i}" for i in range(size)], vectors)
+    probes = make_queries(vectors, queries, seed)
+    
+    ivf = IVFIndex(gallery, n_lists=lists, min_size=0)
+    start = time.perf_counter()
+    ivf.train(seed=seed)
+    train_seconds = time.perf_counter() - start
+    print(f"🧠 Trained {ivf.stats()['n_lists']} lists in {train_seconds:.1f}s")
+    
+    exact_results = []
+    exact_times = []
+    for probe in probes:
+        start = time.perf_counter()
+        exact_results.append(gallery.exact_search(probe, k))
+        exact_times.append(time.perf_counter() - start)
+    
+    report = {
+        "size": size,
+        "queries": queries,
+        "k": k,
+        "n_lists": ivf.stats()["n_lists"],
+        "train_seconds": round(train_seconds, 3),
+        "exact": summarize(exact_times),
+        "ivf": []
+    }
+    print(f"   exact: p50 {report['exact']['p50_ms']} ms, p95 {report['exact']['p95_ms']} ms")
+    
+    for nprobe in nprobes:
+        times = []
+        hits_at_1 = 0
+        overlap_at_k = 0
+        for probe, expected in zip(probes, exact_results):
+            start = time.perf_counter()
+            found = ivf.search(probe, k, nprobe=nprobe)
+            times.append(time.perf_counter() - start)
+            hits_at_1 += bool(found) and found[0][0] == expected[0][0]
+            overlap_at_k += len({user for user, _ in found} & {user for user, _ in expected})
+        
+        row = {
+            "nprobe": nprobe,
+            "recall_at_1": round(hits_at_1 / queries, 4),
+            f"recall_at_{k}": round(overlap_at_k / (queries * k), 4),
+            "latency": summarize(times)
+        }
+        report["ivf"].append(row)
+        print(f"   nprobe={nprobe:<4} recall@1 {row['recall_at_1']:.3f}  recall@{k} {row[f'recall_at_{k}']:.3f}  "
+              f"p50 {row['latency']['p50_ms']} ms  p95 {row['latency']['p95_ms']} ms")
+    
+    return report
@@ -0,0 +1,82 @@
+"""
+Image corpus for the encode benchmark.
+
+Images are loaded from a directory (FACE_IMAGES_DIR layout or any tree of
+images) or, when none is available, generated: a synthetic face drawn with
+OpenCV on a noisy background. Generated images exercise decode, color
+conversion and detection cost realistically even where HOG finds no face.
+"""
+
+import os
+from typing import List
+
+import cv2
+import numpy as np
+
+from face_recognition_local.bulk_import import IMAGE_EXTENSIONS
+
+def load_corpus(root: str, limit: int = 0) -> List[np.ndarray]:
+    """
+    Read every image under root
+    :param root: Directory to scan recursively
+    :param limit: Stop after this many images (0 = all)
+    :return: BGR images
+    """
+    images = []
+    for dirpath, _, filenames in sorted(os.walk(root)):
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(dirpath, filename), cv2.IMREAD_COLOR)
+            if image is not None:
+                images.append(image)
+            if limit and len(images) >= limit:
+                return images
+    return images
+
+def generate_corpus(count: int, seed: int = 0, size: int = 720) -> List[np.ndarray]:
+    """
+    Draw synthetic face-like images
+    :param count: Number of images
+    :param seed: Random seed
+    :param size: Long side of the generated images (4:3)
+    :return: BGR images
+    """
+    rng = np.random.default_rng(seed)
+    height, width = size * 3 // 4, size
+    images = []
+    for _ in range(count):
+        image = rng.integers(40, 90, (height, width, 3), dtype=np.uint8)
+        cx = int(rng.integers(width // 3, 2 * width // 3))
+        cy = int(rng.integers(height // 3, 2 * height // 3))
+        face = int(rng.integers(height // 6, height // 3))
+        skin = tuple(int(v) for v in rng.integers(120, 220, 3))
+        
+        cv2.ellipse(image, (cx, cy), (face * 3 // 4, face), 0, 0, 360, skin, -1)
+        for side in (-1, 1):
+            cv2.circle(image, (cx + side * face // 3, cy - face // 4), max(2, face // 10), (30, 30, 30), -1)
+        cv2.line(image, (cx, cy - face // 8), (cx, cy + face // 6), (90, 90, 110), max(1, face // 30))
+        cv2.ellipse(image, (cx, cy + face // 2), (face // 3, face // 8), 0, 0, 180, (60, 40, 140), max(1, face // 25))
+        images.append(image)
+    return images
+
+def resize_long_side(image: np.ndarray, long_side: int) -> np.ndarray:
+    height, width = image.shape[:2]
+    scale = long_side / max(height, width)
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    return cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=interpolation)
+
+def encode_jpeg(images: List[np.ndarray], long_side: int, quality: int = 90) -> List[bytes]:
+    """
+    Resize images and encode them as JPEG, as the app uploads them
+    :param images: BGR images
+    :param long_side: Target long side in pixels
+    :param quality: JPEG quality
+    :return: JPEG bytes per image
+    """
+    encoded = []
+    for image in images:
+        ok, buffer = cv2.imencode(".jpg", resize_long_side(image, long_side), [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok:
+            encoded.append(buffer.tobytes())
+    return encoded
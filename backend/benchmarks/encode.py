@@ -0,0 +1,102 @@
+"""
+Per-stage encode latency and throughput.
+
+Every detector setting (backend, max size, upsample) gets a fresh spawn pool whose workers read the
+setting from the environment (config.settings), exactly as the service
+would with the same variables. Each image size is then pushed through
+encode_face_profiled, and the stage timings the workers return are
+summarized next to end-to-end throughput.
+"""
+
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from benchmarks.corpus import encode_jpeg
+from benchmarks.stats import summarize
+from config.settings import FACE_DETECTOR
+from face_recognition_local.executor import init_face_worker
+from face_recognition_local.face_engine import encode_face_profiled
+
+def _detector_env(detector: str, max_size: int, upsample: int) -> Dict[str, str]:
+    return {
+        "FACE_DETECTOR": detector,
+        "FACE_DETECTION_MAX_SIZE": str(max_size),
+        "FACE_DETECTION_UPSAMPLE": str(upsample)
+    }
+
+def bench_encode(
+    images: List[np.ndarray],
+    sizes: Sequence[int],
+    max_sizes: Sequence[int],
+    upsamples: Sequence[int],
+    workers: int = 1,
+    repeat: int = 1,
+    detectors: Sequence[str] = (FACE_DETECTOR,)
+) -> List[dict]:
+    """
+    Measure encode cost for every (detector setting, image size) pair
+    :param images: BGR corpus
+    :param sizes: Long sides the corpus is resized to before JPEG encoding
+    :param max_sizes: FACE_DETECTION_MAX_SIZE values (0 = detect at full size)
+    :param upsamples: FACE_DETECTION_UPSAMPLE values
+    :param workers: Pool size; 1 gives clean per-image latency, more gives throughput
+    :param repeat: Times each image is encoded
+    :param detectors: FACE_DETECTOR backends to compare
+    :return: One result row per combination
+    """
+    rows = []
+    saved_env = {name: os.environ.get(name) for name in _detector_env("", 0, 0)}
+    try:
+        for detector, max_size in itertools.product(detectors, max_sizes):
+            for upsample in upsamples:
+                os.environ.update(_detector_env(detector, max_size, upsample))
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_face_worker
+                ) as pool:
+                    # Start (and warm up) every worker before timing
+                    wait([pool.submit(os.getpid) for _ in range(workers)])
+                    
+                    for size in sizes:
+                        corpus = encode_jpeg(images, size) * repeat
+                        start = time.perf_counter()
+                        results = list(pool.map(encode_face_profiled, corpus))
+                        elapsed = time.perf_counter() - start
+                        
+                        stage_samples: Dict[str, List[float]] = {}
+                        for _, profile in results:
+                            for stage, seconds in profile["stages"].items():
+                                stage_samples.setdefault(stage, []).append(seconds)
+                        totals = [sum(profile["stages"].values()) for _, profile in results]
+                        
+                        row = {
+                            "detector": detector,
+                            "image_long_side": size,
+                            "detection_max_size": max_size,
+                            "upsample": upsample,
+                            "workers": workers,
+                            "images": len(corpus),
+                            "mean_bytes": round(float(np.mean([len(data) for data in corpus])), 1),
+                            "faces_found_rate": round(sum(result is not None for result, _ in results) / len(results), 4),
+                            "images_per_second": round(len(corpus) / elapsed, 2),
+                            "total": summarize(totals),
+                            "stages": {stage: summarize(samples) for stage, samples in sorted(stage_samples.items())}
+                        }
+                        rows.append(row)
+                        print(f"   {detector:<10} size={size:<5} max_size={max_size:<5} upsample={upsample}  "
+                              f"p50 {row['total'].get('p50_ms')} ms  {row['images_per_second']} img/s  "
+                              f"faces {row['faces_found_rate']:.2f}")
+    finally:
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return rows
@@ -0,0 +1,78 @@
+"""
+1:1 and 1:N comparison latency over synthetic galleries.
+
+Galleries of 1 up to millions of clustered 128-d vectors (shaped roughly
+like dlib encodings) are built in a GalleryIndex, then probed with noisy
+copies of enrolled vectors.
+"""
+
+import time
+from typing import List, Sequence
+
+import numpy as np
+
+from benchmarks.stats import summarize
+from face_recognition_local.gallery_index import GalleryIndex
+
+def make_gallery(size: int, dim: int = 128, seed: int = 0) -> np.ndarray:
+    """Clustered vectors roughly shaped like dlib face encodings"""
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, size // 100)
+    centers = rng.normal(0.0, 0.1, size=(n_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, n_clusters, size)] + rng.normal(0.0, 0.05, size=(size, dim)).astype(np.float32)
+    return vectors.astype(np.float32)
+
+def make_queries(vectors: np.ndarray, count: int, seed: int = 0) -> np.ndarray:
+    """Noisy copies of random gallery vectors"""
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, vectors.shape[0], count)
+    return vectors[picks] + rng.normal(0.0, 0.02, size=(count, vectors.shape[1])).astype(np.float32)
+
+def bench_gallery(sizes: Sequence[int], queries: int = 200, seed: int = 0) -> List[dict]:
+    """
+    Measure build, 1:1, 1:N and enrollment cost per gallery size
+    :param sizes: Gallery sizes (one vector per user)
+    :param queries: Probes per size
+    :param seed: Random seed
+    :return: One result row per size
+    """
+    rows = []
+    for size in sizes:
+        vectors = make_gallery(size, seed=seed)
+        user_ids = [f"user_{i}" for i in range(size)]
+        probes = make_queries(vectors, queries, seed)
+        
+        start = time.perf_counter()
+        gallery = GalleryIndex(dim=vectors.shape[1], capacity=size)
+        gallery.add_many(user_ids, vectors)
+        build_seconds = time.perf_counter() - start
+        
+        search_times, verify_times, enroll_times = [], [], []
+        rng = np.random.default_rng(seed + 2)
+        for probe in probes:
+            start = time.perf_counter()
+            gallery.search(probe, k=1)
+            search_times.append(time.perf_counter() - start)
+            
+            claimed = user_ids[int(rng.integers(0, size))]
+            start = time.perf_counter()
+            gallery.user_distance(probe, claimed)
+            verify_times.append(time.perf_counter() - start)
+            
+            start = time.perf_counter()
+            gallery.add_template("benchmark_user", probe, 5)
+            enroll_times.append(time.perf_counter() - start)
+        
+        row = {
+            "gallery_size": size,
+            "build_seconds": round(build_seconds, 4),
+            "matrix_mb": round(vectors.nbytes / 2 ** 20, 2),
+            "search_1_to_n": summarize(search_times),
+            "verify_1_to_1": summarize(verify_times),
+            "enroll": summarize(enroll_times)
+        }
+        rows.append(row)
+        print(f"   size={size:<8} 1:N p50 {row['search_1_to_n']['p50_ms']} ms  "
+              f"1:1 p50 {row['verify_1_to_1']['p50_ms']} ms  enroll p50 {row['enroll']['p50_ms']} ms")
+        del gallery, vectors
+    return rows
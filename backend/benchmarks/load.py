@@ -0,0 +1,306 @@
+"""
+In-process asyncio load harness for the HTTP API.
+
+Requests go straight to the ASGI app through httpx.ASGITransport, so no
+server or network is involved and the numbers reflect the service itself
+(the harness shares the event loop and the face-compute pool with it).
+
+Two load models are supported:
+    closed loop  --concurrency N clients, each sending its next request as
+                 soon as the previous one finished
+    open loop    --rate R requests/s with Poisson arrivals, independent of
+                 completions; latency is measured from the scheduled
+                 arrival, so queueing delay is not hidden
+
+Every operation of the mix (--mix verify=6,unlock=3,register=1) is picked
+with its weight. Locker operations need the locker router, which is
+mounted on the app for the run with an in-memory database and a seeded
+user (see mount_locker_routes).
+"""
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.stats import summarize
+
+class LoadContext:
+    """State shared by the operations of one run"""
+
+    def __init__(self, client: httpx.AsyncClient, images: Dict[str, List[bytes]], seed: int = 0):
+        """
+        :param client: Client bound to the app under test
+        :param images: JPEG variants per user ID
+        :param seed: Random seed for operation and image picks
+        """
+        self.client = client
+        self.images = images
+        self.user_ids = sorted(images)
+        self.rng = random.Random(seed)
+        self.lockers: Optional[asyncio.Queue] = None
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.status_codes: Dict[str, int] = {}
+
+    def pick_image(self):
+        user_id = self.rng.choice(self.user_ids)
+        return user_id, self.rng.choice(self.images[user_id])
+
+    async def request(self, name: str, method: str, url: str, started_at: Optional[float] = None, **kwargs) -> Optional[httpx.Response]:
+        """
+        Send one request and record its latency and outcome
+        :param name: Operation name used in the report
+        :param started_at: perf_counter() of the scheduled arrival (open loop)
+        """
+        start = started_at if started_at is not None else time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = str(response.status_code)
+        except Exception:
+            response = None
+            status = "exception"
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        self.status_codes[status] = self.status_codes.get(status, 0) + 1
+        if response is None or response.status_code >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+def _upload(image_data: bytes) -> dict:
+    return {"file": ("face.jpg", image_data, "image/jpeg")}
+
+async def op_register(ctx: LoadContext, started_at: Optional[float] = None):
+    user_id, image_data = ctx.pick_image()
+    await ctx.request("register", "POST", "/api/face/register", started_at, files=_upload(image_data), data={"user_id": user_id})
+
+async def op_verify(ctx: LoadContext, started_at: Optional[float] = None):
+    user_id, image_data = ctx.pick_image()
+    await ctx.request("verify", "POST", "/api/face/verify", started_at, files=_upload(image_data), data={"user_id": user_id})
+
+async def op_unlock(ctx: LoadContext, started_at: Optional[float] = None):
+    user_id, image_data = ctx.pick_image()
+    await ctx.request(
+        "unlock", "POST", "/api/face/unlock-locker", started_at,
+        files=_upload(image_data), data={"user_id": user_id, "locker_id": "1"}
+    )
+
+async def op_status(ctx: LoadContext, started_at: Optional[float] = None):
+    await ctx.request("status", "GET", "/api/face/status", started_at)
+
+async def op_list_images(ctx: LoadContext, started_at: Optional[float] = None):
+    await ctx.request("list_images", "GET", f"/api/face/list-images/{ctx.rng.choice(ctx.user_ids)}", started_at)
+
+async def op_locker_list(ctx: LoadContext, started_at: Optional[float] = None):
+    await ctx.request("locker_list", "GET", "/api/lockers/", started_at)
+
+async def op_locker_get(ctx: LoadContext, started_at: Optional[float] = None):
+    locker_id = await ctx.lockers.get()
+    try:
+        await ctx.request("locker_get", "GET", f"/api/lockers/{locker_id}", started_at)
+    finally:
+        ctx.lockers.put_nowait(locker_id)
+
+async def op_locker_cycle(ctx: LoadContext, started_at: Optional[float] = None):
+    """occupy -> unlock -> lock -> release on a locker no other operation holds"""
+    locker_id = await ctx.lockers.get()
+    try:
+        for action in ("occupy", "unlock", "lock", "release"):
+            await ctx.request(f"locker_{action}", "POST", f"/api/lockers/{locker_id}/{action}", started_at)
+            started_at = None
+    finally:
+        ctx.lockers.put_nowait(locker_id)
+
+Operation = Callable[..., Awaitable[None]]
+
+OPERATIONS: Dict[str, Operation] = {
+    "register": op_register,
+    "verify": op_verify,
+    "unlock": op_unlock,
+    "status": op_status,
+    "list_images": op_list_images,
+    "locker_list": op_locker_list,
+    "locker_get": op_locker_get,
+    "locker_cycle": op_locker_cycle
+}
+
+LOCKER_OPERATIONS = {"locker_list", "locker_get", "locker_cycle"}
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Parse "verify=6,unlock=3,register=1" into operation weights"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', expected one of: {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def mount_locker_routes(app, lockers: int = 20):
+    """
+    Mount the locker router on app for a load run
+
+    The database is replaced with a shared in-memory SQLite database seeded
+    with lockers, and authentication with a fixed active user, so the run
+    measures the locker endpoints rather than bcrypt.
+    :return: List of locker IDs
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from config.database import Base, Locker, User, get_db
+    from api.routes.auth import get_current_active_user
+    from api.routes.locker import router as locker_router
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    with Session() as db:
+        user = User(username="loadtest", email="loadtest@example.com", hashed_password="", full_name="Load Test", is_active=True)
+        db.add(user)
+        db.add_all([Locker(locker_number=f"L{number:03d}") for number in range(1, lockers + 1)])
+        db.commit()
+        locker_ids = [locker.id for locker in db.query(Locker).all()]
+
+    def get_test_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def get_test_user():
+        with Session() as db:
+            return db.query(User).filter(User.username == "loadtest").first()
+
+    app.include_router(locker_router, prefix="/api/lockers")
+    app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[get_current_active_user] = get_test_user
+    return locker_ids
+
+async def _closed_loop(ctx: LoadContext, mix: Dict[str, float], concurrency: int, deadline: float, max_requests: int):
+    names, weights = list(mix), list(mix.values())
+    issued = 0
+
+    async def client():
+        nonlocal issued
+        while time.perf_counter() < deadline and (not max_requests or issued < max_requests):
+            issued += 1
+            await OPERATIONS[ctx.rng.choices(names, weights)[0]](ctx)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+
+async def _open_loop(ctx: LoadContext, mix: Dict[str, float], rate: float, deadline: float, max_requests: int, max_outstanding: int):
+    names, weights = list(mix), list(mix.values())
+    outstanding = set()
+    dropped = 0
+    issued = 0
+    next_arrival = time.perf_counter()
+
+    while next_arrival < deadline and (not max_requests or issued < max_requests):
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if len(outstanding) >= max_outstanding:
+            dropped += 1
+        else:
+            operation = OPERATIONS[ctx.rng.choices(names, weights)[0]]
+            task = asyncio.ensure_future(operation(ctx, next_arrival))
+            outstanding.add(task)
+            task.add_done_callback(outstanding.discard)
+        issued += 1
+        next_arrival += ctx.rng.expovariate(rate)
+
+    if outstanding:
+        await asyncio.gather(*outstanding)
+    return dropped
+
+async def run_load(
+    app,
+    images: Dict[str, List[bytes]],
+    mix: Dict[str, float],
+    duration: float = 30.0,
+    concurrency: int = 8,
+    rate: float = 0.0,
+    max_requests: int = 0,
+    max_outstanding: int = 10000,
+    warmup_register: bool = True,
+    lockers: int = 20,
+    seed: int = 0
+) -> dict:
+    """
+    Drive the app with a request mix and report latency, throughput and errors
+    :param app: ASGI app under test (e.g. main.app)
+    :param images: JPEG variants per user ID
+    :param mix: Operation weights (see parse_mix)
+    :param duration: Seconds to generate load for
+    :param concurrency: Clients of the closed-loop model (ignored when rate is set)
+    :param rate: Arrivals per second of the open-loop model (0 = closed loop)
+    :param max_requests: Stop after this many operations (0 = duration only)
+    :param max_outstanding: Open loop: arrivals beyond this many in flight are dropped and counted
+    :param warmup_register: Register every user once before the run, so verify/unlock can match
+    :param lockers: Lockers seeded when the mix has locker operations
+    :param seed: Random seed
+    :return: Report dict
+    """
+    locker_ids = mount_locker_routes(app, lockers) if LOCKER_OPERATIONS & set(mix) else []
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            # Wait for /ready when the app has it (see main.py)
+            for _ in range(600):
+                response = await client.get("/ready")
+                if response.status_code != 503:
+                    break
+                await asyncio.sleep(0.1)
+
+            ctx = LoadContext(client, images, seed)
+            ctx.lockers = asyncio.Queue()
+            for locker_id in locker_ids:
+                ctx.lockers.put_nowait(locker_id)
+
+            if warmup_register:
+                for user_id in ctx.user_ids:
+                    await client.post("/api/face/register", files=_upload(images[user_id][0]), data={"user_id": user_id})
+
+            start = time.perf_counter()
+            deadline = start + duration
+            dropped = 0
+            if rate > 0:
+                dropped = await _open_loop(ctx, mix, rate, deadline, max_requests, max_outstanding)
+            else:
+                await _closed_loop(ctx, mix, concurrency, deadline, max_requests)
+            elapsed = time.perf_counter() - start
+    finally:
+        await app.router.shutdown()
+
+    all_latencies = [latency for latencies in ctx.latencies.values() for latency in latencies]
+    total_errors = sum(ctx.errors.values())
+    return {
+        "model": "open" if rate > 0 else "closed",
+        "rate": rate,
+        "concurrency": None if rate > 0 else concurrency,
+        "mix": mix,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": len(all_latencies),
+        "dropped_arrivals": dropped,
+        "throughput_rps": round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(total_errors / len(all_latencies), 4) if all_latencies else 0.0,
+        "status_codes": dict(sorted(ctx.status_codes.items())),
+        "latency": summarize(all_latencies),
+        "operations": {
+            name: {
+                **summarize(latencies),
+                "errors": ctx.errors.get(name, 0),
+                "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0
+            }
+            for name, latencies in sorted(ctx.latencies.items())
+        }
+    }
@@ -0,0 +1,21 @@
+"""Latency summaries shared by the benchmarks"""
+
+from typing import Sequence
+
+import numpy as np
+
+def summarize(samples: Sequence[float]) -> dict:
+    """
+    Summarize latencies given in seconds
+    :return: count, mean and percentiles in milliseconds
+    """
+    if len(samples) == 0:
+        return {"count": 0}
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        "count": int(values.shape[0]),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3)
+    }
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Script to bulk-enroll faces from a directory tree or zip archive
+
+The source must be laid out like the face images folder:
+    <source>/<user_id>/<image>.jpg
+Images are encoded across all cores and the encodings are written to
+BULK_IMPORT_FILE, which the API loads into its gallery at startup.
+"""
+
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from config.settings import FACE_WORKERS, BULK_IMPORT_FILE
+from face_recognition_local.bulk_import import run_bulk_import, save_import_results, load_import_results
+from face_recognition_local.executor import init_face_worker
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-enroll faces from a directory or zip archive")
+    parser.add_argument("source", help="Directory or zip archive laid out as <user_id>/<image>")
+    parser.add_argument("--workers", type=int, default=FACE_WORKERS, help="Number of encoding processes")
+    parser.add_argument("--output", default=BULK_IMPORT_FILE, help="Where to write the encodings (.npz)")
+    parser.add_argument("--append", action="store_true", help="Keep encodings already in the output file")
+    args = parser.parse_args()
+    
+    print(f"🔧 Bulk importing faces from {args.source} with {args.workers} worker(s)...")
+    
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_face_worker
+    ) as executor:
+        report = run_bulk_import(args.source, executor, max_in_flight=2 * args.workers)
+    
+    encodings = report["encodings"]
+    if args.append:
+        try:
+            existing = load_import_results(args.output)
+        except FileNotFoundError:
+            existing = {}
+        for user_id, user_encodings in encodings.items():
+            existing.setdefault(user_id, []).extend(user_encodings)
+        encodings = existing
+    
+    save_import_results(encodings, args.output)
+    
+    print("\n📊 Bulk import complete:")
+    print(f"   ✅ Imported: {report['imported_images']} images for {report['imported_users']} users")
+    print(f"   ❌ Failed: {len(report['failed'])} images")
+    print(f"   ⏱️  {report['images_per_second']} images/sec over {report['elapsed_seconds']}s")
+    print(f"   💾 Encodings written to: {args.output}")
+    
+    for failure in report["failed"]:
+        print(f"   ⚠️  {failure['user_id']}/{failure['image']}: {failure['error']}")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -47,7 +47,7 @@ class FaceData(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
-    face_encoding = Column(Text)  # Store face encoding as text
+    face_encoding = Column(LargeBinary)  # Binary record, see face_recognition_local/encoding_store.py
     image_path = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -0,0 +1,143 @@
+"""
+Runtime settings for the face recognition service.
+
+Every value can be overridden with an environment variable of the same name,
+so kiosk servers and API pods can be tuned without code changes.
+"""
+
+import os
+
+# Number of worker processes used for face detection/encoding
+FACE_WORKERS = int(os.getenv("FACE_WORKERS", os.cpu_count() or 1))
+
+# Background encoding (bulk import, gallery rebuild, gallery watcher) runs in
+# its own pool of BACKGROUND_FACE_WORKERS processes, niced by
+# BACKGROUND_WORKER_NICE so verify/unlock requests get the CPU first, with at
+# most BACKGROUND_MAX_IN_FLIGHT tasks queued at a time
+BACKGROUND_FACE_WORKERS = int(os.getenv("BACKGROUND_FACE_WORKERS", max(1, FACE_WORKERS // 4)))
+BACKGROUND_WORKER_NICE = int(os.getenv("BACKGROUND_WORKER_NICE", 10))
+BACKGROUND_MAX_IN_FLIGHT = int(os.getenv("BACKGROUND_MAX_IN_FLIGHT", 2 * BACKGROUND_FACE_WORKERS))
+
+# Encodings written by bulk_import_faces.py and loaded at startup
+BULK_IMPORT_FILE = os.getenv("BULK_IMPORT_FILE", "face_recognition_local/data/bulk_import.npz")
+
+# Faces are detected on a copy whose long side is at most this many pixels
+# (0 disables downscaling); encoding still uses the full-resolution image
+FACE_DETECTION_MAX_SIZE = int(os.getenv("FACE_DETECTION_MAX_SIZE", 800))
+
+# Times the HOG and CNN detectors upsample the image (higher finds smaller faces)
+FACE_DETECTION_UPSAMPLE = int(os.getenv("FACE_DETECTION_UPSAMPLE", 1))
+
+# Face detector backend (see face_recognition_local/detectors.py): "hog",
+# "cnn", "opencv_dnn" or "yunet"; endpoints take a "detector" form field
+# to override it per request
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "hog").lower()
+
+# Model files of the OpenCV backends (not shipped with the repo) and the
+# lowest score a detection must reach
+OPENCV_DNN_PROTOTXT = os.getenv("OPENCV_DNN_PROTOTXT", "face_recognition_local/models/deploy.prototxt")
+OPENCV_DNN_MODEL = os.getenv("OPENCV_DNN_MODEL", "face_recognition_local/models/res10_300x300_ssd_iter_140000.caffemodel")
+OPENCV_DNN_CONFIDENCE = float(os.getenv("OPENCV_DNN_CONFIDENCE", 0.5))
+YUNET_MODEL = os.getenv("YUNET_MODEL", "face_recognition_local/models/face_detection_yunet_2023mar.onnx")
+YUNET_SCORE_THRESHOLD = float(os.getenv("YUNET_SCORE_THRESHOLD", 0.9))
+YUNET_NMS_THRESHOLD = float(os.getenv("YUNET_NMS_THRESHOLD", 0.3))
+
+# Margin around a face box, as a fraction of its size, kept when encoding
+FACE_CROP_MARGIN = float(os.getenv("FACE_CROP_MARGIN", 0.25))
+
+# Save an aligned face chip (with its landmarks) at registration; chips are
+# re-encoded without detection. FACE_CHIP_PADDING is the margin around the
+# face as in dlib.get_face_chip (0.5 gives 200x200 chips around the encoder's
+# 150x150 one). KEEP_ORIGINAL_IMAGES=false stores only the chip.
+FACE_CHIPS_ENABLED = os.getenv("FACE_CHIPS_ENABLED", "false").lower() in ("1", "true", "yes")
+FACE_CHIP_PADDING = float(os.getenv("FACE_CHIP_PADDING", 0.5))
+FACE_CHIP_JPEG_QUALITY = int(os.getenv("FACE_CHIP_JPEG_QUALITY", 95))
+KEEP_ORIGINAL_IMAGES = os.getenv("KEEP_ORIGINAL_IMAGES", "true").lower() in ("1", "true", "yes")
+
+# Upload limits: uploads above MAX_UPLOAD_BYTES or MAX_IMAGE_PIXELS are
+# rejected before decoding; images above DECODE_MAX_PIXELS are decoded at
+# 1/2, 1/4 or 1/8 size (0 disables a limit)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 40000000))
+DECODE_MAX_PIXELS = int(os.getenv("DECODE_MAX_PIXELS", 4000000))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 64 * 1024))
+
+# Also measure peak Python/NumPy memory of every encode with tracemalloc
+# (slows encodes down and cannot see dlib's C++ allocations; the workers'
+# peak RSS is always reported)
+TRACK_REQUEST_MEMORY = os.getenv("TRACK_REQUEST_MEMORY", "false").lower() in ("1", "true", "yes")
+
+# Encoding cache keyed by a hash of the uploaded bytes
+ENCODING_CACHE_SIZE = int(os.getenv("ENCODING_CACHE_SIZE", 1024))
+ENCODING_CACHE_TTL = float(os.getenv("ENCODING_CACHE_TTL", 300))
+
+# Micro-batching of encode requests that arrive while every face worker is
+# busy: at most ENCODE_BATCH_MAX_SIZE images per pool task, sent at the
+# latest after ENCODE_BATCH_MAX_WAIT_MS (ENCODE_BATCH_MAX_SIZE=1 disables
+# batching; an idle worker always gets a request right away)
+ENCODE_BATCH_MAX_SIZE = int(os.getenv("ENCODE_BATCH_MAX_SIZE", 8))
+ENCODE_BATCH_MAX_WAIT_MS = float(os.getenv("ENCODE_BATCH_MAX_WAIT_MS", 5))
+
+# Face image store (content-addressed blobs, manifests and legacy per-user folders)
+FACE_IMAGES_DIR = os.getenv("FACE_IMAGES_DIR", "face_recognition_local/data/faces")
+
+# Write-behind queue for saved face images: images waiting to be written,
+# images written (and fsynced) together, and retries of a failed write
+IMAGE_WRITE_QUEUE_SIZE = int(os.getenv("IMAGE_WRITE_QUEUE_SIZE", 256))
+IMAGE_WRITE_BATCH_SIZE = int(os.getenv("IMAGE_WRITE_BATCH_SIZE", 32))
+IMAGE_WRITE_BATCH_WAIT_MS = float(os.getenv("IMAGE_WRITE_BATCH_WAIT_MS", 20))
+IMAGE_WRITE_RETRIES = int(os.getenv("IMAGE_WRITE_RETRIES", 3))
+
+# Page size of /api/face/list-images (default and largest allowed)
+LIST_IMAGES_PAGE_SIZE = int(os.getenv("LIST_IMAGES_PAGE_SIZE", 50))
+LIST_IMAGES_MAX_PAGE_SIZE = int(os.getenv("LIST_IMAGES_MAX_PAGE_SIZE", 500))
+
+# Memory-mapped gallery of registered face encodings (plus .ids and .lock
+# sidecars; several worker processes may share it)
+GALLERY_PATH = os.getenv("GALLERY_PATH", "face_recognition_local/data/gallery.f32")
+
+# Approximate (IVF) search for very large galleries, see "python -m benchmarks ann"
+ANN_ENABLED = os.getenv("ANN_ENABLED", "false").lower() in ("1", "true", "yes")
+ANN_MIN_SIZE = int(os.getenv("ANN_MIN_SIZE", 100000))
+ANN_LISTS = int(os.getenv("ANN_LISTS", 0))  # 0 = 4 * sqrt(gallery size)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", 8))
+ANN_RETRAIN_GROWTH = float(os.getenv("ANN_RETRAIN_GROWTH", 0.2))
+
+# Incremental gallery rebuild (rebuild_gallery.py, /api/face/admin/rebuild-gallery):
+# state directory with the content hash -> encoding manifest, and the encoder
+# version it was computed with (changing it re-encodes every image)
+REBUILD_DIR = os.getenv("REBUILD_DIR", "face_recognition_local/data/rebuild")
+GALLERY_MODEL_VERSION = os.getenv("GALLERY_MODEL_VERSION", "dlib_resnet_v1")
+REBUILD_CHUNK_SIZE = int(os.getenv("REBUILD_CHUNK_SIZE", 32))
+
+# Live gallery updates (gallery_watcher.py): watch the legacy per-user folders
+# of FACE_IMAGES_DIR ("inotify", "poll" or "auto" = inotify if available) and
+# the FaceData table, and apply changes once a user has been quiet for
+# GALLERY_WATCH_DEBOUNCE seconds
+GALLERY_WATCH_ENABLED = os.getenv("GALLERY_WATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+GALLERY_WATCH_MODE = os.getenv("GALLERY_WATCH_MODE", "auto")
+GALLERY_WATCH_POLL_INTERVAL = float(os.getenv("GALLERY_WATCH_POLL_INTERVAL", 10))
+GALLERY_WATCH_DEBOUNCE = float(os.getenv("GALLERY_WATCH_DEBOUNCE", 2))
+
+# Face templates kept per user; enrollment adds one and drops the oldest
+MAX_TEMPLATES_PER_USER = int(os.getenv("MAX_TEMPLATES_PER_USER", 5))
+
+# How a user's templates are compared: "min", "centroid" or "both"
+TEMPLATE_AGGREGATION = os.getenv("TEMPLATE_AGGREGATION", "min")
+
+# Maximum face distance accepted as a match (face_recognition default)
+FACE_MATCH_TOLERANCE = float(os.getenv("FACE_MATCH_TOLERANCE", 0.6))
+
+# Streaming unlock (WebSocket): unlock after STREAM_REQUIRED_MATCHES of the
+# last STREAM_WINDOW evaluated frames match, fail after STREAM_MAX_FRAMES
+STREAM_REQUIRED_MATCHES = int(os.getenv("STREAM_REQUIRED_MATCHES", 1))
+STREAM_WINDOW = int(os.getenv("STREAM_WINDOW", 3))
+STREAM_MAX_FRAMES = int(os.getenv("STREAM_MAX_FRAMES", 30))
+STREAM_MAX_IN_FLIGHT = int(os.getenv("STREAM_MAX_IN_FLIGHT", 2))
+STREAM_SESSION_TIMEOUT = float(os.getenv("STREAM_SESSION_TIMEOUT", 15))
+
+# Face tracking across stream frames: detect only around the previous box
+# (expanded by TRACK_ROI_MARGIN of its size), with a full-frame detection
+# every TRACK_REDETECT_INTERVAL frames or when the face is lost
+TRACK_ROI_MARGIN = float(os.getenv("TRACK_ROI_MARGIN", 0.5))
+TRACK_REDETECT_INTERVAL = int(os.getenv("TRACK_REDETECT_INTERVAL", 10))
@@ -0,0 +1,255 @@
+"""
+Approximate nearest-neighbour index for very large galleries.
+
+IVFIndex is an inverted-file index in plain NumPy: k-means centroids split
+the gallery into lists, and a query only scans the rows of the nprobe
+lists whose centroids are closest. Candidates are re-ranked with exact
+distances from the gallery matrix, and the search falls back to a full
+scan when the probed lists do not hold enough users.
+
+Rows added to the gallery (e.g. by /register) are assigned to their
+nearest list immediately. Once the gallery has grown by retrain_growth
+since the last training, the centroids are retrained in a background
+thread and swapped in when ready; searches keep using the old lists
+meanwhile.
+"""
+
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class _IVFState:
+    """Centroids and inverted lists produced by one training run"""
+
+    def __init__(self, centroids: np.ndarray, lists: List[np.ndarray], list_of_slot: np.ndarray):
+        self.centroids = centroids
+        self.centroid_sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+        self.lists = lists
+        self.extra: List[List[int]] = [[] for _ in lists]  # Rows inserted after training
+        self.list_of_slot = list_of_slot  # -1 for rows not in any list
+
+    def nearest_lists(self, vectors: np.ndarray, n: int = 1) -> np.ndarray:
+        scores = self.centroid_sq_norms[np.newaxis, :] - 2.0 * (vectors @ self.centroids.T)
+        if n == 1:
+            return np.argmin(scores, axis=1)
+        return np.argpartition(scores, n - 1, axis=1)[:, :n]
+
+    def insert(self, slots: List[int], vectors: np.ndarray):
+        if not slots:
+            return
+        if max(slots) >= self.list_of_slot.shape[0]:
+            grown = np.full(max(max(slots) + 1, 2 * self.list_of_slot.shape[0]), -1, dtype=np.int32)
+            grown[:self.list_of_slot.shape[0]] = self.list_of_slot
+            self.list_of_slot = grown
+        for slot, list_id in zip(slots, self.nearest_lists(vectors)):
+            self.extra[list_id].append(slot)
+            self.list_of_slot[slot] = list_id
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+    """Index of the nearest centroid of every vector, in bounded-memory chunks"""
+    centroid_sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+    assignment = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        scores = centroid_sq_norms[np.newaxis, :] - 2.0 * (chunk @ centroids.T)
+        assignment[start:start + chunk_size] = np.argmin(scores, axis=1)
+    return assignment
+
+def kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Lloyd's k-means
+    :param vectors: float32 matrix of shape (n, dim)
+    :param n_clusters: Number of centroids (at most n)
+    :param n_iter: Iterations to run
+    :param seed: Seed for the initial centroids
+    :return: float32 centroids of shape (n_clusters, dim)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(vectors.shape[0], n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignment = _assign(vectors, centroids)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        sums = np.stack(
+            [np.bincount(assignment, weights=vectors[:, d], minlength=n_clusters) for d in range(vectors.shape[1])],
+            axis=1
+        )
+        filled = counts > 0
+        centroids[filled] = (sums[filled] / counts[filled, np.newaxis]).astype(np.float32)
+
+        # Re-seed empty clusters with random vectors
+        empty = np.flatnonzero(~filled)
+        if empty.shape[0]:
+            centroids[empty] = vectors[rng.choice(vectors.shape[0], empty.shape[0], replace=False)]
+
+    return centroids
+
+class IVFIndex:
+    """Inverted-file ANN index over a GalleryIndex"""
+
+    def __init__(
+        self,
+        gallery,
+        n_lists: int = 0,
+        nprobe: int = 8,
+        min_size: int = 100000,
+        retrain_growth: float = 0.2,
+        max_train_points_per_list: int = 64,
+        n_iter: int = 10
+    ):
+        """
+        :param gallery: GalleryIndex whose rows are indexed
+        :param n_lists: Number of k-means lists (0 picks 4 * sqrt(gallery size))
+        :param nprobe: Lists scanned per query; higher is slower but more accurate
+        :param min_size: Gallery size below which exact search is used
+        :param retrain_growth: Retrain once the gallery grew by this fraction
+        :param max_train_points_per_list: Sample size used for k-means, per list
+        :param n_iter: k-means iterations
+        """
+        self.gallery = gallery
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.retrain_growth = retrain_growth
+        self.max_train_points_per_list = max_train_points_per_list
+        self.n_iter = n_iter
+
+        self._state: Optional[_IVFState] = None
+        self._lock = threading.Lock()
+        self._training = False
+        self._pending: Optional[List[int]] = None  # Rows added while training
+        self._trained_size = 0
+        self._added_since_train = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self._state is not None
+
+    def stats(self) -> dict:
+        state = self._state
+        return {
+            "trained": state is not None,
+            "training": self._training,
+            "n_lists": len(state.lists) if state is not None else 0,
+            "nprobe": self.nprobe,
+            "trained_size": self._trained_size,
+            "added_since_train": self._added_since_train
+        }
+
+    def reset(self):
+        with self._lock:
+            self._state = None
+            self._trained_size = 0
+            self._added_since_train = 0
+
+    def train(self, seed: int = 0):
+        """Build centroids and lists from the gallery's current rows"""
+        with self._lock:
+            if self._training:
+                return
+            self._training = True
+            self._pending = []
+
+        try:
+            slots = self.gallery.live_slots()
+            vectors = self.gallery._matrix[slots]
+            n_lists = self.n_lists or int(4 * np.sqrt(slots.shape[0]))
+            n_lists = max(1, min(n_lists, slots.shape[0]))
+
+            rng = np.random.default_rng(seed)
+            n_train = min(slots.shape[0], n_lists * self.max_train_points_per_list)
+            sample = vectors[rng.choice(slots.shape[0], n_train, replace=False)]
+            centroids = kmeans(sample, n_lists, self.n_iter, seed)
+
+            assignment = _assign(vectors, centroids)
+            order = np.argsort(assignment, kind="stable")
+            bounds = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+            lists = [slots[order[bounds[i]:bounds[i + 1]]] for i in range(n_lists)]
+
+            list_of_slot = np.full(self.gallery._matrix.shape[0], -1, dtype=np.int32)
+            list_of_slot[slots] = assignment
+            state = _IVFState(centroids, lists, list_of_slot)
+
+            with self._lock:
+                # Rows added during training were not in the snapshot
+                pending = [slot for slot in self._pending if self.gallery._user_ids[slot] is not None]
+                state.insert(pending, self.gallery._matrix[pending])
+                self._state = state
+                self._trained_size = slots.shape[0] + len(pending)
+                self._added_since_train = 0
+
+            logger.info(f"IVF index trained: {slots.shape[0]} rows in {n_lists} lists")
+        finally:
+            with self._lock:
+                self._training = False
+                self._pending = None
+
+    def maybe_train(self):
+        """Start background (re)training when the gallery is large enough or has grown"""
+        if self._training or len(self.gallery) < self.min_size:
+            return
+        if self._state is not None and self._added_since_train <= self.retrain_growth * self._trained_size:
+            return
+        threading.Thread(target=self.train, name="ivf-train", daemon=True).start()
+
+    def on_add(self, slots: List[int]):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(slots)
+            if self._state is not None:
+                self._state.insert(list(slots), self.gallery._matrix[slots])
+            self._added_since_train += len(slots)
+        self.maybe_train()
+
+    def on_remove(self, slots: List[int]):
+        with self._lock:
+            state = self._state
+            if state is not None:
+                for slot in slots:
+                    if slot < state.list_of_slot.shape[0]:
+                        state.list_of_slot[slot] = -1
+
+    def search(self, encoding: np.ndarray, k: int = 1, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Find the k nearest distinct users, scanning only the closest lists
+        :param encoding: Query face encoding
+        :param k: Number of users to return
+        :param nprobe: Lists to scan (defaults to self.nprobe)
+        :return: List of (user_id, distance) sorted by distance
+        """
+        state = self._state
+        if state is None:
+            return self.gallery.exact_search(encoding, k)
+
+        query = np.asarray(encoding, dtype=np.float32).reshape(1, -1)
+        nprobe = max(1, min(nprobe or self.nprobe, len(state.lists)))
+        probed = np.atleast_1d(state.nearest_lists(query, nprobe)[0])
+
+        parts = []
+        list_ids = []
+        for list_id in probed:
+            for part in (state.lists[list_id], np.asarray(state.extra[list_id], dtype=np.int64)):
+                if part.shape[0]:
+                    parts.append(part)
+                    list_ids.append(np.full(part.shape[0], list_id, dtype=np.int32))
+
+        if parts:
+            candidates = np.concatenate(parts)
+            # Drop rows that were removed or moved to another list since
+            valid = state.list_of_slot[candidates] == np.concatenate(list_ids)
+            candidates = candidates[valid]
+            candidates = candidates[np.isfinite(self.gallery._sq_norms[candidates])]
+        else:
+            candidates = np.empty(0, dtype=np.int64)
+
+        # Exact re-ranking of the candidates
+        dist = self.gallery.distances_to(query[0], candidates)
+        results = self.gallery.rank_users(candidates, dist, k)
+
+        if len(results) < min(k, self.gallery.n_users):
+            return self.gallery.exact_search(encoding, k)
+        return results
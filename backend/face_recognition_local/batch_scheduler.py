@@ -0,0 +1,137 @@
+"""
+Micro-batching of encode requests sent to the face-compute pool.
+
+A batch is one pool task: its images are decoded and searched one after
+another, then all their face chips go through the encoder in one batched
+call (see face_engine.encode_faces_batch), which is cheaper than one call
+per face.
+
+Batches only form when they cost nothing: while a worker is idle, a request
+is sent right away on its own. Requests that arrive while every worker is
+busy wait until a batch finishes (or at most max_wait_ms, or until
+max_batch_size of them are waiting) and are then sent together, spread over
+the workers, instead of queueing one task each behind the running ones.
+"""
+
+import asyncio
+import math
+from collections import Counter
+from typing import List, Optional, Set, Tuple
+
+from config.settings import ENCODE_BATCH_MAX_SIZE, ENCODE_BATCH_MAX_WAIT_MS, FACE_WORKERS
+from face_recognition_local.executor import run_face_task
+from face_recognition_local.face_engine import EncodeResult, encode_face_profiled, encode_faces_batch, raise_if_rejected
+from face_recognition_local.metrics import encode_batch_size
+from face_recognition_local.upload_limits import UploadRejected
+
+class EncodeBatcher:
+    """Coalesces concurrent encode requests into pool batches"""
+
+    def __init__(self, max_batch_size: int = 8, max_wait_ms: float = 5.0, workers: int = 1):
+        """
+        :param max_batch_size: Most images sent to one worker in one task (1 disables batching)
+        :param max_wait_ms: Longest a request waits while every worker is busy
+        :param workers: Pool size: batches in flight before requests wait
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.workers = max(1, workers)
+
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes: Counter = Counter()
+
+        self._pending: List[Tuple[bytes, Optional[str], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()  # Batches in the pool
+
+    async def submit(self, image_data: bytes, detector: Optional[str] = None) -> Tuple[EncodeResult, dict]:
+        """
+        Encode an image as part of the next batch
+        :param image_data: Raw image bytes
+        :param detector: Detector backend, None for FACE_DETECTOR (a batch may mix backends)
+        :return: Tuple of (result, profile) as returned by encode_face_profiled
+        """
+        if self.max_batch_size <= 1:
+            self._record(1)
+            return await run_face_task(encode_face_profiled, image_data, None, detector)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((image_data, detector, future))
+
+        if len(self._tasks) < self.workers or len(self._pending) >= self.max_batch_size * self.workers:
+            # A worker is idle (no reason to wait) or every worker has a full batch
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush)
+
+        return await future
+
+    def _record(self, size: int):
+        self.batches += 1
+        self.items += size
+        self.batch_sizes[size] += 1
+        encode_batch_size.observe(size)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        # Requests whose callers gave up are not encoded
+        pending = [item for item in self._pending if not item[2].done()]
+        self._pending = []
+        if not pending:
+            return
+
+        idle = max(1, self.workers - len(self._tasks))
+        chunk = min(self.max_batch_size, math.ceil(len(pending) / idle))
+        for start in range(0, len(pending), chunk):
+            batch = pending[start:start + chunk]
+            self._record(len(batch))
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        # A worker is free: send the requests that piled up meanwhile
+        if self._pending:
+            self._flush()
+
+    async def _run_batch(self, batch: List[Tuple[bytes, Optional[str], asyncio.Future]]):
+        try:
+            results = await run_face_task(
+                encode_faces_batch, [image_data for image_data, _, _ in batch], [detector for _, detector, _ in batch]
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), (result, profile) in zip(batch, results):
+            if future.done():
+                continue
+            try:
+                raise_if_rejected(profile)
+            except UploadRejected as e:
+                future.set_exception(e)
+            else:
+                future.set_result((result, profile))
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "pending": len(self._pending),
+            "batches_in_flight": len(self._tasks),
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 3) if self.batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())}
+        }
+
+# Shared by main.py and api/routes/face_recognition.py (through encode_face_cached)
+encode_batcher = EncodeBatcher(ENCODE_BATCH_MAX_SIZE, ENCODE_BATCH_MAX_WAIT_MS, FACE_WORKERS)
@@ -0,0 +1,187 @@
+"""
+Bulk face enrollment from a directory tree or a zip archive.
+
+Sources are laid out like FACE_IMAGES_DIR: one folder per user containing
+that user's face images (<user_id>/<image>). Images are encoded in chunks
+in a process pool, at most max_in_flight chunks at a time (the API uses
+the background pool, see executor.py), and the results are returned
+together, so the caller can load them into the gallery in one step.
+"""
+
+import os
+import time
+import zipfile
+from concurrent.futures import Executor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import BACKGROUND_MAX_IN_FLIGHT
+from face_recognition_local.executor import bounded_map
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Folders under FACE_IMAGES_DIR that do not belong to a user (the last two
+# hold the content-addressed image store, see image_store.py)
+SKIP_DIRS = {"test_images", "blobs", "manifests"}
+
+# (user_id, image name, source path, zip member or None)
+ImportJob = Tuple[str, str, str, Optional[str]]
+
+def _iter_directory_jobs(root: str) -> Iterator[ImportJob]:
+    for user_id in sorted(os.listdir(root)):
+        user_dir = os.path.join(root, user_id)
+        if not os.path.isdir(user_dir) or user_id in SKIP_DIRS:
+            continue
+        for dirpath, _, filenames in os.walk(user_dir):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield user_id, filename, os.path.join(dirpath, filename), None
+
+def _iter_zip_jobs(zip_path: str) -> Iterator[ImportJob]:
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in archive.namelist():
+            if member.endswith('/') or not member.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            parts = member.split('/')
+            if len(parts) < 2 or parts[-2] in SKIP_DIRS:
+                continue
+            # The folder directly containing the image is the user ID, so an
+            # archive with an extra top-level folder works too
+            yield parts[-2], parts[-1], zip_path, member
+
+def iter_import_jobs(source: str) -> Iterator[ImportJob]:
+    """
+    List the images to import
+    :param source: Directory laid out as <user_id>/<image> or a zip archive of one
+    :return: Iterator of import jobs
+    """
+    if os.path.isdir(source):
+        return _iter_directory_jobs(source)
+    if zipfile.is_zipfile(source):
+        return _iter_zip_jobs(source)
+    raise ValueError(f"Source must be a directory or a zip archive: {source}")
+
+def _read_job(job: ImportJob, archives: Dict[str, zipfile.ZipFile]) -> bytes:
+    """
+    Read the image of a job
+    :param archives: Zip archives opened so far for the current chunk, by path
+    """
+    _, _, path, member = job
+    if member is None:
+        with open(path, "rb") as f:
+            return f.read()
+    archive = archives.get(path)
+    if archive is None:
+        archive = archives[path] = zipfile.ZipFile(path)
+    return archive.read(member)
+
+def encode_import_chunk(jobs: List[ImportJob]) -> List[Tuple[str, str, Optional[np.ndarray], Optional[str]]]:
+    """
+    Encode a chunk of import jobs in one batched encoder call (runs in a pool worker)
+    
+    Archives are opened once per chunk and closed before returning, so a
+    long-lived worker does not keep a deleted upload open.
+    :param jobs: Import jobs from iter_import_jobs
+    :return: Tuple of (user_id, image name, encoding or None, error or None) per job
+    """
+    # Imported here so only the workers load the face models
+    from face_recognition_local.face_engine import encode_faces_batch
+    
+    results, readable = {}, []
+    archives: Dict[str, zipfile.ZipFile] = {}
+    try:
+        for i, job in enumerate(jobs):
+            try:
+                readable.append((i, _read_job(job, archives)))
+            except Exception as e:
+                results[i] = (job[0], job[1], None, str(e))
+    finally:
+        for archive in archives.values():
+            archive.close()
+    batch = encode_faces_batch([image_data for _, image_data in readable])
+    for (i, _), (result, profile) in zip(readable, batch):
+        user_id, name = jobs[i][0], jobs[i][1]
+        if result is None:
+            results[i] = (user_id, name, None, profile.get("rejected", "No face detected"))
+        else:
+            results[i] = (user_id, name, result[0], None)
+    return [results[i] for i in range(len(jobs))]
+
+def run_bulk_import(
+    source: str,
+    executor: Executor,
+    chunksize: int = 16,
+    progress_every: int = 500,
+    max_in_flight: int = BACKGROUND_MAX_IN_FLIGHT
+) -> dict:
+    """
+    Encode every image of a bulk import source
+    :param source: Directory or zip archive laid out as <user_id>/<image>
+    :param executor: Pool the images are encoded in
+    :param chunksize: Number of images sent to a worker at a time
+    :param progress_every: Print throughput every N images (0 disables)
+    :param max_in_flight: Most chunks submitted to the pool at a time
+    :return: Report with the encodings per user, failures and throughput
+    """
+    jobs = list(iter_import_jobs(source))
+    print(f"📦 Bulk import: {len(jobs)} image(s) found in {source}")
+
+    encodings: Dict[str, List[np.ndarray]] = {}
+    failed = []
+    start = time.perf_counter()
+
+    chunks = [jobs[i:i + chunksize] for i in range(0, len(jobs), chunksize)]
+    results = (result for chunk in bounded_map(executor, encode_import_chunk, chunks, max_in_flight) for result in chunk)
+    for done, (user_id, name, encoding, error) in enumerate(results, start=1):
+        if encoding is None:
+            failed.append({"user_id": user_id, "image": name, "error": error})
+        else:
+            encodings.setdefault(user_id, []).append(encoding)
+
+        if progress_every and done % progress_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"⏱️  {done}/{len(jobs)} images, {done / elapsed:.1f} images/sec")
+
+    elapsed = time.perf_counter() - start
+    imported = len(jobs) - len(failed)
+    print(f"✅ Bulk import encoded {imported}/{len(jobs)} image(s) in {elapsed:.1f}s")
+
+    return {
+        "source": source,
+        "encodings": encodings,
+        "total_images": len(jobs),
+        "imported_images": imported,
+        "imported_users": len(encodings),
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 3),
+        "images_per_second": round(len(jobs) / elapsed, 2) if elapsed > 0 else 0.0
+    }
+
+def save_import_results(encodings: Dict[str, List[np.ndarray]], path: str):
+    """
+    Save bulk import encodings so the API can load them at startup
+    :param encodings: Encodings per user from run_bulk_import
+    :param path: Destination .npz file
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    user_ids = []
+    vectors = []
+    for user_id, user_encodings in encodings.items():
+        for encoding in user_encodings:
+            user_ids.append(user_id)
+            vectors.append(encoding)
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    np.savez(path, user_ids=np.asarray(user_ids, dtype=str), encodings=matrix)
+
+def load_import_results(path: str) -> Dict[str, List[np.ndarray]]:
+    """
+    Load encodings saved by save_import_results
+    :param path: .npz file written by save_import_results
+    :return: Encodings per user
+    """
+    encodings: Dict[str, List[np.ndarray]] = {}
+    with np.load(path) as data:
+        for user_id, encoding in zip(data["user_ids"], data["encodings"]):
+            encodings.setdefault(str(user_id), []).append(encoding)
+    return encodings
@@ -0,0 +1,223 @@
+"""
+Face detector backends.
+
+Every backend returns boxes as (top, right, bottom, left) in the pixel
+coordinates of the image it was given, the format face_recognition uses,
+so the backend can change without touching the code that crops, aligns
+or encodes faces:
+
+    hog         dlib HOG + linear SVM (face_recognition's default), CPU only
+    cnn         dlib MMOD CNN; finds smaller and turned faces, but needs a
+                CUDA build of dlib to be fast
+    opencv_dnn  OpenCV SSD with a ResNet-10 backbone (Caffe model files)
+    yunet       OpenCV YuNet (ONNX model, cv2.FaceDetectorYN)
+
+FACE_DETECTOR selects the backend of a deployment, and endpoints accept a
+"detector" form field to override it per request. A backend is created on
+first use in each process, so each pool worker loads only the models it
+is asked for. Detection latency is exported per backend as
+face_detection_seconds (see metrics.py).
+"""
+
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import face_recognition
+
+from config.settings import (
+    FACE_DETECTOR, FACE_DETECTION_UPSAMPLE, OPENCV_DNN_PROTOTXT, OPENCV_DNN_MODEL, OPENCV_DNN_CONFIDENCE,
+    YUNET_MODEL, YUNET_SCORE_THRESHOLD, YUNET_NMS_THRESHOLD
+)
+from face_recognition_local.metrics import current_endpoint, detection_seconds
+
+# (top, right, bottom, left), the box format used by face_recognition
+FaceBox = Tuple[int, int, int, int]
+
+def corners_to_box(x1: float, y1: float, x2: float, y2: float, width: int, height: int) -> Optional[FaceBox]:
+    """Box from corner coordinates, clipped to the image (None if nothing is left)"""
+    top, right = max(0, int(round(y1))), min(width, int(round(x2)))
+    bottom, left = min(height, int(round(y2))), max(0, int(round(x1)))
+    if bottom <= top or right <= left:
+        return None
+    return top, right, bottom, left
+
+class DetectorBackend:
+    """Finds faces in an image; subclasses implement detect()"""
+
+    name = ""
+    input_color = "rgb"  # Channel order detect() expects: "rgb" or "bgr"
+
+    @classmethod
+    def check(cls):
+        """
+        Make sure the backend can run here
+        :raises ValueError: If a model file or OpenCV feature is missing
+        """
+
+    def detect(self, image: np.ndarray) -> List[FaceBox]:
+        """
+        :param image: Image in input_color channel order
+        :return: Face boxes, most confident first where the backend scores them
+        """
+        raise NotImplementedError
+
+class HogDetector(DetectorBackend):
+    """dlib HOG detector through face_recognition"""
+
+    name = "hog"
+    model = "hog"
+
+    def __init__(self, upsample: int = FACE_DETECTION_UPSAMPLE):
+        """
+        :param upsample: Times the image is upsampled (higher finds smaller faces)
+        """
+        self.upsample = upsample
+
+    def detect(self, image: np.ndarray) -> List[FaceBox]:
+        return face_recognition.face_locations(image, number_of_times_to_upsample=self.upsample, model=self.model)
+
+class CnnDetector(HogDetector):
+    """dlib MMOD CNN detector through face_recognition (model shipped with face_recognition_models)"""
+
+    name = "cnn"
+    model = "cnn"
+
+def _require_files(*paths: str):
+    missing = [path for path in paths if not os.path.isfile(path)]
+    if missing:
+        raise ValueError(f"Model file(s) not found: {', '.join(missing)}")
+
+class OpenCVDnnDetector(DetectorBackend):
+    """OpenCV SSD face detector (res10_300x300_ssd_iter_140000.caffemodel)"""
+
+    name = "opencv_dnn"
+    input_color = "bgr"
+    input_size = (300, 300)
+    mean = (104.0, 177.0, 123.0)
+
+    @classmethod
+    def check(cls):
+        _require_files(OPENCV_DNN_PROTOTXT, OPENCV_DNN_MODEL)
+
+    def __init__(self, prototxt: str = OPENCV_DNN_PROTOTXT, model: str = OPENCV_DNN_MODEL,
+                 confidence: float = OPENCV_DNN_CONFIDENCE):
+        """
+        :param prototxt: Network definition
+        :param model: Caffe weights
+        :param confidence: Lowest score kept
+        """
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+        self.confidence = confidence
+
+    def detect(self, image: np.ndarray) -> List[FaceBox]:
+        height, width = image.shape[:2]
+        self.net.setInput(cv2.dnn.blobFromImage(image, 1.0, self.input_size, self.mean))
+        # Rows of [image id, class, score, x1, y1, x2, y2] with corners in [0, 1], best first
+        detections = self.net.forward()[0, 0]
+        boxes = []
+        for _, _, score, x1, y1, x2, y2 in detections:
+            if score < self.confidence:
+                continue
+            box = corners_to_box(x1 * width, y1 * height, x2 * width, y2 * height, width, height)
+            if box is not None:
+                boxes.append(box)
+        return boxes
+
+class YuNetDetector(DetectorBackend):
+    """OpenCV YuNet face detector (face_detection_yunet_2023mar.onnx)"""
+
+    name = "yunet"
+    input_color = "bgr"
+
+    @classmethod
+    def check(cls):
+        if not hasattr(cv2, "FaceDetectorYN"):
+            raise ValueError(f"OpenCV {cv2.__version__} has no FaceDetectorYN (4.5.4 or newer is required)")
+        _require_files(YUNET_MODEL)
+
+    def __init__(self, model: str = YUNET_MODEL, score_threshold: float = YUNET_SCORE_THRESHOLD,
+                 nms_threshold: float = YUNET_NMS_THRESHOLD):
+        """
+        :param model: ONNX model
+        :param score_threshold: Lowest score kept
+        :param nms_threshold: Overlap above which the weaker of two boxes is dropped
+        """
+        self.detector = cv2.FaceDetectorYN.create(model, "", (320, 320), score_threshold, nms_threshold)
+        self._input_size: Optional[Tuple[int, int]] = None
+
+    def detect(self, image: np.ndarray) -> List[FaceBox]:
+        height, width = image.shape[:2]
+        if self._input_size != (width, height):
+            self.detector.setInputSize((width, height))
+            self._input_size = (width, height)
+        _, faces = self.detector.detect(image)
+        if faces is None:
+            return []
+        # Rows of [x, y, w, h, 5 landmarks (x, y), score]
+        faces = faces[np.argsort(-faces[:, -1])]
+        boxes = []
+        for x, y, w, h in faces[:, :4]:
+            box = corners_to_box(x, y, x + w, y + h, width, height)
+            if box is not None:
+                boxes.append(box)
+        return boxes
+
+DETECTOR_BACKENDS = {
+    backend.name: backend for backend in (HogDetector, CnnDetector, OpenCVDnnDetector, YuNetDetector)
+}
+
+_detectors: Dict[str, DetectorBackend] = {}
+
+def resolve_detector(name: Optional[str] = None) -> str:
+    """
+    Validate a detector name, e.g. a per-request override
+    :param name: Backend name, None for FACE_DETECTOR
+    :return: Normalized backend name
+    :raises ValueError: If the backend is unknown or cannot run here
+    """
+    name = (name or FACE_DETECTOR).strip().lower()
+    backend = DETECTOR_BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown face detector '{name}', expected one of: {', '.join(DETECTOR_BACKENDS)}")
+    if name not in _detectors:
+        backend.check()
+    return name
+
+def get_detector(name: Optional[str] = None) -> DetectorBackend:
+    """Backend instance for this process, created (and its model loaded) on first use"""
+    detector = _detectors.get(name or FACE_DETECTOR)
+    if detector is None:
+        name = resolve_detector(name)
+        detector = _detectors.get(name)
+        if detector is None:
+            detector = _detectors[name] = DETECTOR_BACKENDS[name]()
+    return detector
+
+def detect_faces(image: np.ndarray, color: str = "bgr", detector: Optional[str] = None) -> List[FaceBox]:
+    """
+    Detect faces in this process, recording the latency under the backend's name
+    :param image: Image with channels in color order
+    :param color: "bgr" (cv2.imdecode) or "rgb" (face_recognition.load_image_file)
+    :param detector: Backend name, None for FACE_DETECTOR
+    """
+    backend = get_detector(detector)
+    if backend.input_color != color:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB if color == "bgr" else cv2.COLOR_RGB2BGR)
+    start = time.perf_counter()
+    boxes = backend.detect(image)
+    detection_seconds.observe(time.perf_counter() - start, backend.name, current_endpoint.get())
+    return boxes
+
+def detector_status() -> Dict[str, str]:
+    """"ok" or the reason it cannot run, per backend (for status endpoints)"""
+    status = {}
+    for name in DETECTOR_BACKENDS:
+        try:
+            resolve_detector(name)
+            status[name] = "ok"
+        except ValueError as e:
+            status[name] = str(e)
+    return status
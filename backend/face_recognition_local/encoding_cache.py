@@ -0,0 +1,154 @@
+"""
+Cache of face encodings keyed by a hash of the uploaded image bytes.
+
+Clients retry the same JPEG after timeouts and the app re-sends identical
+frames, so the result of a full detect+encode pass is kept for a while and
+reused. Identical uploads that arrive while the first one is still being
+encoded wait for that encode instead of starting another. The shared encode
+runs as a task of its own, so a caller that goes away (e.g. a client
+disconnect cancels its request) does not cancel it for the others; it is
+only cancelled once no caller is left waiting for it.
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from config.settings import ENCODING_CACHE_SIZE, ENCODING_CACHE_TTL, FACE_DETECTOR
+from face_recognition_local.face_engine import EncodeResult
+from face_recognition_local.batch_scheduler import encode_batcher
+from face_recognition_local.metrics import current_endpoint, record_encode_profile, upload_bytes
+
+class EncodingCache:
+    """Bounded LRU cache with per-entry TTL"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        """
+        :param max_entries: Entries kept before the least recently used is evicted
+        :param ttl_seconds: Seconds an entry stays valid (0 means no expiry)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, EncodeResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0  # Misses that joined an encode already in flight
+
+    @staticmethod
+    def key(image_data: bytes, detector: str = "") -> str:
+        """Cache key of an image; results of different detector backends are kept apart"""
+        digest = hashlib.blake2b(image_data, digest_size=16).hexdigest()
+        return f"{digest}:{detector}" if detector else digest
+
+    def get(self, key: str) -> Tuple[bool, EncodeResult]:
+        """
+        Look up a cached result
+        :return: Tuple of (found, result); result may be None for "no face"
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if not self.ttl_seconds or time.monotonic() - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, result
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key: str, result: EncodeResult):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+# Shared by main.py and api/routes/face_recognition.py
+encoding_cache = EncodingCache(ENCODING_CACHE_SIZE, ENCODING_CACHE_TTL)
+
+# Encodes currently running in the pool, and the callers waiting for them, by cache key
+_in_flight: Dict[str, "asyncio.Task"] = {}
+_waiters: Dict[str, int] = {}
+
+async def _encode_and_cache(key: str, image_data: bytes, detector: str) -> EncodeResult:
+    try:
+        submitted_at = time.time()
+        result, profile = await encode_batcher.submit(image_data, detector)
+        record_encode_profile(profile, submitted_at)
+        encoding_cache.put(key, result)
+        return result
+    finally:
+        _in_flight.pop(key, None)
+        _waiters.pop(key, None)
+
+def _retrieve_exception(task: "asyncio.Task"):
+    # Every waiter may have been cancelled; do not log the error as unretrieved
+    if not task.cancelled():
+        task.exception()
+
+async def encode_face_cached(image_data: bytes, detector: Optional[str] = None) -> EncodeResult:
+    """
+    Encode an uploaded image in the face-compute pool, reusing cached results
+    :param image_data: Raw image bytes
+    :param detector: Detector backend (validated with detectors.resolve_detector), None for FACE_DETECTOR
+    :return: Tuple of (encoding, face box) or None if no face was found
+    """
+    upload_bytes.observe(len(image_data), current_endpoint.get())
+    detector = detector or FACE_DETECTOR
+    key = encoding_cache.key(image_data, detector)
+    found, result = encoding_cache.get(key)
+    if found:
+        print("⚡ Encoding cache hit")
+        return result
+    
+    task = _in_flight.get(key)
+    if task is not None:
+        encoding_cache.coalesced += 1
+    else:
+        task = _in_flight[key] = asyncio.ensure_future(_encode_and_cache(key, image_data, detector))
+        task.add_done_callback(_retrieve_exception)
+    _waiters[key] = _waiters.get(key, 0) + 1
+    try:
+        # Cancelling this caller leaves the encode running for the others
+        return await asyncio.shield(task)
+    finally:
+        if _in_flight.get(key) is task:
+            _waiters[key] -= 1
+            if not _waiters[key]:
+                # Nobody wants the result any more (e.g. a stream session ended)
+                task.cancel()
+
+async def encode_face_image_cached(image_data: bytes, detector: Optional[str] = None) -> Optional[np.ndarray]:
+    """Same as encode_face_cached but returns only the encoding"""
+    result = await encode_face_cached(image_data, detector)
+    return result[0] if result is not None else None
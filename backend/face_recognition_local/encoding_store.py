@@ -0,0 +1,121 @@
+"""
+Compact binary format for stored face encodings.
+
+A record is an 8-byte header followed by the encoding as little-endian
+float32 values:
+
+    magic  b"FENC"  (4 bytes)
+    version         (uint8)
+    reserved        (1 byte)
+    dim             (uint16, little-endian)
+    values          (dim * float32, little-endian)
+
+The same record is used for FaceData.face_encoding BLOBs and for encoding
+files written by FaceDetector.save_face_encoding. Older text encodings
+("[0.1, -0.2, ...]") can still be read with parse_legacy_encoding.
+"""
+
+import json
+import struct
+from typing import List, Sequence, Union
+
+import numpy as np
+
+MAGIC = b"FENC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBxH")
+ENCODING_DTYPE = np.dtype("<f4")
+
+def pack_encoding(encoding: np.ndarray) -> bytes:
+    """
+    Serialize an encoding to a binary record
+    :param encoding: 1-D face encoding
+    :return: Header followed by float32 values
+    """
+    values = np.ascontiguousarray(encoding, dtype=ENCODING_DTYPE).ravel()
+    return HEADER.pack(MAGIC, FORMAT_VERSION, values.shape[0]) + values.tobytes()
+
+def is_binary_encoding(data: Union[bytes, bytearray, memoryview]) -> bool:
+    return len(data) >= HEADER.size and bytes(data[:len(MAGIC)]) == MAGIC
+
+def unpack_encoding(data: Union[bytes, bytearray, memoryview]) -> np.ndarray:
+    """
+    Read a binary record without copying the values
+    :param data: Record written by pack_encoding
+    :return: float32 encoding (read-only view over data)
+    """
+    magic, version, dim = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a binary face encoding")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported face encoding version: {version}")
+    if len(data) != HEADER.size + dim * ENCODING_DTYPE.itemsize:
+        raise ValueError("Truncated face encoding record")
+    return np.frombuffer(data, dtype=ENCODING_DTYPE, count=dim, offset=HEADER.size)
+
+def unpack_encodings(records: Sequence[bytes], dim: int = 128) -> np.ndarray:
+    """
+    Read many binary records straight into one matrix
+    :param records: Records written by pack_encoding, all of length dim
+    :param dim: Expected encoding length
+    :return: float32 matrix of shape (len(records), dim)
+    """
+    if not records:
+        return np.empty((0, dim), dtype=ENCODING_DTYPE)
+
+    record_size = HEADER.size + dim * ENCODING_DTYPE.itemsize
+    raw = np.frombuffer(b"".join(records), dtype=np.uint8)
+    if raw.shape[0] != record_size * len(records):
+        raise ValueError("Face encoding records have unexpected sizes")
+    raw = raw.reshape(len(records), record_size)
+
+    expected_header = np.frombuffer(HEADER.pack(MAGIC, FORMAT_VERSION, dim), dtype=np.uint8)
+    if not (raw[:, :HEADER.size] == expected_header).all():
+        raise ValueError("Face encoding records have an unexpected header")
+
+    return raw[:, HEADER.size:].copy().view(ENCODING_DTYPE)
+
+def parse_legacy_encoding(text: str) -> np.ndarray:
+    """
+    Parse an encoding stored as str(encoding.tolist())
+    :param text: Text such as "[0.1, -0.2, ...]"
+    :return: float32 encoding
+    """
+    return np.asarray(json.loads(text), dtype=ENCODING_DTYPE)
+
+def decode_stored_encoding(value: Union[bytes, bytearray, memoryview, str]) -> np.ndarray:
+    """
+    Read an encoding in either the binary or the legacy text format
+    :param value: Stored encoding
+    :return: float32 encoding
+    """
+    if isinstance(value, str):
+        return parse_legacy_encoding(value)
+    if is_binary_encoding(value):
+        return unpack_encoding(value)
+    return parse_legacy_encoding(bytes(value).decode("utf-8"))
+
+def decode_stored_encodings(values: Sequence[Union[bytes, str]], dim: int = 128) -> np.ndarray:
+    """
+    Read many stored encodings into one matrix, in order
+
+    Binary records are decoded together with a single frombuffer; legacy
+    text values are parsed one by one.
+    :param values: Stored encodings in either format
+    :param dim: Expected encoding length
+    :return: float32 matrix of shape (len(values), dim)
+    """
+    binary_rows: List[int] = []
+    binary_records: List[bytes] = []
+    matrix = np.empty((len(values), dim), dtype=ENCODING_DTYPE)
+
+    for row, value in enumerate(values):
+        if not isinstance(value, str) and is_binary_encoding(value):
+            binary_rows.append(row)
+            binary_records.append(bytes(value))
+        else:
+            matrix[row] = decode_stored_encoding(value)
+
+    if binary_records:
+        matrix[binary_rows] = unpack_encodings(binary_records, dim)
+    return matrix
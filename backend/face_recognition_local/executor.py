@@ -0,0 +1,127 @@
+"""
+Process pools that run face detection/encoding off the event loop.
+
+Face detection/encoding is CPU-bound, so it is submitted to a pool of worker
+processes (one per core by default) instead of running inside async handlers.
+Each worker loads the dlib models once in its initializer and runs a
+warm-up encode, so no user request pays for the first, slow call.
+
+Long jobs (bulk import, gallery rebuild, gallery watcher) use a second,
+smaller pool whose workers run at a lower CPU priority, and submit through
+bounded_map, so they never queue thousands of tasks ahead of the
+verify/unlock requests sent to the live pool.
+"""
+
+import asyncio
+import collections
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional
+
+from config.settings import FACE_WORKERS, BACKGROUND_FACE_WORKERS, BACKGROUND_WORKER_NICE
+
+_executor: Optional[ProcessPoolExecutor] = None
+_background_executor: Optional[ProcessPoolExecutor] = None
+
+def init_face_worker():
+    """Preload and warm up face models in a freshly started worker process"""
+    # face_recognition loads the detector, landmark and encoder models on import
+    import face_recognition  # noqa: F401
+    from face_recognition_local.face_engine import warm_up_face_models
+    
+    elapsed = warm_up_face_models()
+    print(f"🧠 Face worker {os.getpid()} ready (warm-up {elapsed * 1000:.0f} ms)")
+
+def init_background_worker():
+    """Lower the CPU priority of a background worker, then load its models"""
+    if BACKGROUND_WORKER_NICE and hasattr(os, "nice"):
+        os.nice(BACKGROUND_WORKER_NICE)
+    init_face_worker()
+
+def _spawn_pool(workers: int, initializer: Callable[[], None]) -> ProcessPoolExecutor:
+    # Use spawn: forking a process that already runs an event loop and
+    # threads is not safe
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer
+    )
+
+def get_face_executor() -> ProcessPoolExecutor:
+    """Return the shared face-compute pool, creating it on first use"""
+    global _executor
+    if _executor is None:
+        _executor = _spawn_pool(FACE_WORKERS, init_face_worker)
+        print(f"🚀 Face-compute pool started with {FACE_WORKERS} worker(s)")
+    return _executor
+
+def get_background_executor() -> ProcessPoolExecutor:
+    """Return the pool for background encoding jobs, creating it on first use"""
+    global _background_executor
+    if _background_executor is None:
+        _background_executor = _spawn_pool(BACKGROUND_FACE_WORKERS, init_background_worker)
+        print(f"🚀 Background face pool started with {BACKGROUND_FACE_WORKERS} worker(s)")
+    return _background_executor
+
+def bounded_map(executor: Executor, func: Callable[[Any], Any], items: Iterable, max_in_flight: int) -> Iterator:
+    """
+    Like executor.map, but with at most max_in_flight tasks submitted and unfinished
+    
+    executor.map submits every item up front, so a large job would sit in
+    the pool's queue ahead of anything submitted after it. Closing the
+    iterator early cancels the tasks that have not started.
+    :param executor: Pool the tasks run in
+    :param func: Module-level function called with each item
+    :param items: Items to process
+    :param max_in_flight: Most tasks submitted at a time
+    :return: Iterator of results, in the order of items
+    """
+    pending: Deque = collections.deque()
+    try:
+        for item in items:
+            if len(pending) >= max(1, max_in_flight):
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, item))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+async def run_face_task(func: Callable[..., Any], *args) -> Any:
+    """Run a module-level face function in the pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_face_executor(), func, *args)
+
+async def warm_up_face_executor() -> List[int]:
+    """
+    Start every worker of the pool and wait until all of them are warm
+    
+    Workers are spawned on demand, one per pending task, so submitting one
+    task per worker starts them all. A worker only takes tasks once its
+    initializer (model loading and warm-up) has finished, so rounds of
+    trivial tasks are sent until every worker has answered.
+    :return: PIDs of the warm workers
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_face_executor()
+    warm_pids = set()
+    while len(warm_pids) < FACE_WORKERS:
+        pids = await asyncio.gather(*(loop.run_in_executor(executor, os.getpid) for _ in range(FACE_WORKERS)))
+        warm_pids.update(pids)
+        if len(warm_pids) < FACE_WORKERS:
+            await asyncio.sleep(0.05)
+    return sorted(warm_pids)
+
+def shutdown_face_executor():
+    """Stop the face-compute pools (called on application shutdown)"""
+    global _executor, _background_executor
+    if _background_executor is not None:
+        _background_executor.shutdown(wait=True, cancel_futures=True)
+        _background_executor = None
+        print("🛑 Background face pool stopped")
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        print("🛑 Face-compute pool stopped")
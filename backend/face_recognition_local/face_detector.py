@@ -3,36 +3,51 @@ import cv2
 import numpy as np
 import os
 import pickle
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Union
 import logging
 
+from face_recognition_local.detectors import detect_faces
+from face_recognition_local.gallery_index import GalleryIndex
+from face_recognition_local.encoding_store import pack_encoding, decode_stored_encoding, decode_stored_encodings
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class FaceDetector:
-    def __init__(self, tolerance: float = 0.6):
+    def __init__(self, tolerance: float = 0.6, aggregation: str = "min", detector: Optional[str] = None):
         """
         Initialize face detector with tolerance for face matching
         :param tolerance: Lower values are more strict (0.6 is default)
+        :param aggregation: How a user's templates are compared: "min", "centroid" or "both"
+        :param detector: Face detector backend (see detectors.py), None for FACE_DETECTOR
         """
         self.tolerance = tolerance
-        self.known_face_encodings = []
-        self.known_face_names = []
+        self.aggregation = aggregation
+        self.detector = detector
+        self.gallery = GalleryIndex()
         
-    def load_known_faces(self, faces_data: List[Tuple[str, str]]):
+    def load_known_faces(self, faces_data: List[Tuple[str, Union[bytes, str]]]):
         """
         Load known faces from database
-        :param faces_data: List of tuples (user_id, face_encoding)
+        :param faces_data: List of tuples (user_id, face_encoding) where face_encoding
+            is a binary record (see encoding_store) or a legacy text encoding
         """
-        self.known_face_encodings = []
-        self.known_face_names = []
+        self.gallery.clear()
         
-        for user_id, face_encoding_str in faces_data:
+        try:
+            # Decode every row into one matrix in a single pass
+            user_ids = [user_id for user_id, _ in faces_data]
+            encodings = decode_stored_encodings([face_encoding for _, face_encoding in faces_data])
+            self.gallery.add_many(user_ids, encodings)
+            logger.info(f"Loaded face data for {len(user_ids)} encodings")
+            return
+        except Exception as e:
+            logger.error(f"Error bulk loading face data, falling back to row by row: {e}")
+        
+        for user_id, face_encoding_data in faces_data:
             try:
-                # Convert string back to numpy array
-                face_encoding = np.array(eval(face_encoding_str))
-                self.known_face_encodings.append(face_encoding)
-                self.known_face_names.append(user_id)
+                face_encoding = decode_stored_encoding(face_encoding_data)
+                self.gallery.add(user_id, face_encoding)
                 logger.info(f"Loaded face data for user {user_id}")
             except Exception as e:
                 logger.error(f"Error loading face data for user {user_id}: {e}")
@@ -48,7 +63,7 @@ class FaceDetector:
             image = face_recognition.load_image_file(image_path)
             
             # Find face locations
-            face_locations = face_recognition.face_locations(image)
+            face_locations = detect_faces(image, "rgb", self.detector)
             
             if not face_locations:
                 logger.warning("No face found in image")
@@ -83,7 +98,7 @@ class FaceDetector:
             image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
             
             # Find face locations
-            face_locations = face_recognition.face_locations(image_rgb)
+            face_locations = detect_faces(image_rgb, "rgb", self.detector)
             
             if not face_locations:
                 logger.warning("No face found in image")
@@ -109,34 +124,22 @@ class FaceDetector:
         :param face_encoding: Face encoding to recognize
         :return: Tuple of (user_id, confidence_score) or (None, 0.0) if no match
         """
-        if not self.known_face_encodings:
+        if len(self.gallery) == 0:
             logger.warning("No known faces loaded")
             return None, 0.0
         
         try:
-            # Compare face with known faces
-            matches = face_recognition.compare_faces(
-                self.known_face_encodings, 
-                face_encoding, 
-                tolerance=self.tolerance
-            )
-            
-            # Calculate face distances
-            face_distances = face_recognition.face_distance(
-                self.known_face_encodings, 
-                face_encoding
-            )
+            # Nearest enrolled user in a single pass over the gallery matrix
+            matches = self.gallery.search(face_encoding, k=1, aggregation=self.aggregation)
             
             if not matches:
                 logger.info("No face matches found")
                 return None, 0.0
             
-            # Find the best match
-            best_match_index = np.argmin(face_distances)
+            user_id, distance = matches[0]
             
-            if matches[best_match_index]:
-                user_id = self.known_face_names[best_match_index]
-                confidence = 1.0 - face_distances[best_match_index]
+            if distance <= self.tolerance:
+                confidence = 1.0 - distance
                 confidence_percentage = int(confidence * 100)
                 
                 logger.info(f"Face recognized as user {user_id} with {confidence_percentage}% confidence")
@@ -156,7 +159,7 @@ class FaceDetector:
         """
         try:
             image = face_recognition.load_image_file(image_path)
-            face_locations = face_recognition.face_locations(image)
+            face_locations = detect_faces(image, "rgb", self.detector)
             return face_locations
         except Exception as e:
             logger.error(f"Error detecting faces in image {image_path}: {e}")
@@ -172,11 +175,9 @@ class FaceDetector:
         try:
             os.makedirs(os.path.dirname(save_path), exist_ok=True)
             
-            # Convert numpy array to string for storage
-            encoding_str = str(face_encoding.tolist())
-            
-            with open(save_path, 'w') as f:
-                f.write(encoding_str)
+            # Binary record: version header + float32 values
+            with open(save_path, 'wb') as f:
+                f.write(pack_encoding(face_encoding))
             
             logger.info(f"Face encoding saved for user {user_id}")
             
@@ -190,12 +191,11 @@ class FaceDetector:
         :return: Face encoding as numpy array or None if error
         """
         try:
-            with open(load_path, 'r') as f:
-                encoding_str = f.read()
+            with open(load_path, 'rb') as f:
+                encoding_data = f.read()
             
-            # Convert string back to numpy array
-            encoding_list = eval(encoding_str)
-            return np.array(encoding_list)
+            # Binary record, or text written by older versions
+            return decode_stored_encoding(encoding_data)
             
         except Exception as e:
             logger.error(f"Error loading face encoding from {load_path}: {e}")
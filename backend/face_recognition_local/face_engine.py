@@ -0,0 +1,492 @@
+"""
+Face compute functions shared by main.py and api/routes/face_recognition.py.
+
+Everything in this module is plain module-level code so it can be pickled
+and run inside the face-compute process pool (see executor.py).
+"""
+
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+import dlib
+import face_recognition
+import face_recognition.api as face_api
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+from config.settings import (
+    FACE_DETECTOR, FACE_DETECTION_MAX_SIZE, FACE_CROP_MARGIN, TRACK_ROI_MARGIN, TRACK_REQUEST_MEMORY,
+    FACE_CHIP_PADDING, FACE_CHIP_JPEG_QUALITY
+)
+from face_recognition_local.upload_limits import (
+    MAX_HEADER_BYTES, UploadRejected, check_image_size, decode_scale_flag, read_image_size
+)
+from face_recognition_local.detectors import FaceBox, get_detector
+
+# Encoding and face box, or None when no face was found
+EncodeResult = Optional[Tuple[np.ndarray, FaceBox]]
+
+# The encoder's own chip: 150x150 pixels with dlib's default padding of 0.25
+ENCODER_CHIP_SIZE = 150
+ENCODER_CHIP_PADDING = 0.25
+
+def face_chip_size(padding: float = FACE_CHIP_PADDING) -> int:
+    """Size of a stored chip whose center is exactly the encoder's 150x150 chip"""
+    return round(ENCODER_CHIP_SIZE * (1 + 2 * padding) / (1 + 2 * ENCODER_CHIP_PADDING))
+
+def worker_max_rss() -> Optional[int]:
+    """Peak resident memory of this process in bytes (includes dlib's heap), None if unknown"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux, in bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+@contextmanager
+def _stage(stages: Optional[Dict[str, float]], name: str):
+    """Add the duration of the block to stages[name] (no-op when stages is None)"""
+    if stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+def detect_face_locations(
+    image: np.ndarray,
+    stages: Optional[Dict[str, float]] = None,
+    detector: Optional[str] = None
+) -> List[FaceBox]:
+    """
+    Find faces in a BGR image, detecting on a downscaled copy
+    
+    Detection cost grows with pixel count, so images whose long side exceeds
+    FACE_DETECTION_MAX_SIZE are shrunk before detection. Boxes are returned
+    in full-resolution coordinates.
+    :param detector: Detector backend (see detectors.py), None for FACE_DETECTOR
+    """
+    backend = get_detector(detector)
+    height, width = image.shape[:2]
+    scale = 1.0
+    if FACE_DETECTION_MAX_SIZE and max(height, width) > FACE_DETECTION_MAX_SIZE:
+        scale = FACE_DETECTION_MAX_SIZE / max(height, width)
+        small_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        with _stage(stages, "resize"):
+            image = cv2.resize(image, small_size, interpolation=cv2.INTER_AREA)
+    
+    if backend.input_color == "rgb":
+        with _stage(stages, "color_convert"):
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    with _stage(stages, "detection"):
+        face_locations = backend.detect(image)
+    
+    if scale == 1.0:
+        return face_locations
+    
+    # Map boxes back to full-resolution coordinates
+    return [
+        (
+            max(0, round(top / scale)),
+            min(width, round(right / scale)),
+            min(height, round(bottom / scale)),
+            max(0, round(left / scale))
+        )
+        for top, right, bottom, left in face_locations
+    ]
+
+def detect_face_locations_in_roi(
+    image: np.ndarray,
+    previous_box: FaceBox,
+    stages: Optional[Dict[str, float]] = None,
+    detector: Optional[str] = None
+) -> List[FaceBox]:
+    """
+    Find faces near a box from a previous frame
+    
+    Detection only runs on the previous box expanded by TRACK_ROI_MARGIN
+    (as a fraction of its size) on every side, which is much smaller than
+    the full frame while the face stays roughly in place. Boxes are
+    returned in full-frame coordinates.
+    """
+    height, width = image.shape[:2]
+    top, right, bottom, left = previous_box
+    margin = int(TRACK_ROI_MARGIN * max(bottom - top, right - left))
+    
+    y0, y1 = max(0, top - margin), min(height, bottom + margin)
+    x0, x1 = max(0, left - margin), min(width, right + margin)
+    if y1 <= y0 or x1 <= x0:
+        return []
+    
+    return [
+        (roi_top + y0, roi_right + x0, roi_bottom + y0, roi_left + x0)
+        for roi_top, roi_right, roi_bottom, roi_left in detect_face_locations(image[y0:y1, x0:x1], stages, detector)
+    ]
+
+def encode_face_region(
+    image: np.ndarray,
+    face_location: FaceBox,
+    stages: Optional[Dict[str, float]] = None
+) -> Optional[np.ndarray]:
+    """
+    Encode one face of a full-resolution BGR image
+    
+    Only the face box plus a margin (for landmarks just outside the box) is
+    color-converted, aligned and passed to the encoder.
+    """
+    chip, _ = extract_face_chip(image, face_location, stages, ENCODER_CHIP_PADDING)
+    with _stage(stages, "encoding"):
+        return encode_chips([chip])[0]
+
+def encode_chips(chips: List[np.ndarray]) -> List[np.ndarray]:
+    """
+    Encode aligned 150x150 RGB chips (see extract_face_chip) in one call
+    
+    dlib runs the whole list through the network as one batch, which costs
+    less than one call per chip.
+    """
+    if not chips:
+        return []
+    descriptors = face_api.face_encoder.compute_face_descriptor([np.ascontiguousarray(chip) for chip in chips])
+    return [np.array(descriptor) for descriptor in descriptors]
+
+def extract_face_chip(
+    image: np.ndarray,
+    face_location: FaceBox,
+    stages: Optional[Dict[str, float]] = None,
+    padding: float = FACE_CHIP_PADDING
+) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """
+    Cut an aligned face chip out of a BGR image
+    
+    The face is aligned on its 5 landmarks the same way the encoder does it,
+    with padding (FACE_CHIP_PADDING for stored chips) instead of 0.25 around
+    it, so the chip can be encoded later without detection or landmarks (see
+    encode_aligned_chip). With ENCODER_CHIP_PADDING it is the encoder's own chip.
+    :return: Tuple of (RGB chip of face_chip_size(padding) pixels, landmarks as (x, y) in image coordinates)
+    """
+    height, width = image.shape[:2]
+    top, right, bottom, left = face_location
+    margin = int(FACE_CROP_MARGIN * max(bottom - top, right - left))
+    
+    y0, y1 = max(0, top - margin), min(height, bottom + margin)
+    x0, x1 = max(0, left - margin), min(width, right + margin)
+    with _stage(stages, "color_convert"):
+        rgb_crop = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+    
+    with _stage(stages, "landmarks"):
+        shape = face_api._raw_face_landmarks(rgb_crop, [(top - y0, right - x0, bottom - y0, left - x0)], model="small")[0]
+    with _stage(stages, "alignment"):
+        chip = dlib.get_face_chip(rgb_crop, shape, size=face_chip_size(padding), padding=padding)
+    
+    landmarks = [(point.x + x0, point.y + y0) for point in shape.parts()]
+    return chip, landmarks
+
+def encode_aligned_chip(chip: np.ndarray, padding: float = FACE_CHIP_PADDING) -> np.ndarray:
+    """
+    Encode an RGB chip from extract_face_chip, skipping detection and landmarks
+    :param padding: Padding the chip was cut with
+    """
+    return encode_chips([encoder_chip(chip, padding)])[0]
+
+def encoder_chip(chip: np.ndarray, padding: float = FACE_CHIP_PADDING) -> np.ndarray:
+    """The encoder's 150x150 chip at the center of a chip cut with padding"""
+    size = chip.shape[0]
+    inner = round(size * (1 + 2 * ENCODER_CHIP_PADDING) / (1 + 2 * padding))
+    offset = (size - inner) // 2
+    face = chip[offset:offset + inner, offset:offset + inner]
+    if inner != ENCODER_CHIP_SIZE:
+        face = cv2.resize(face, (ENCODER_CHIP_SIZE, ENCODER_CHIP_SIZE), interpolation=cv2.INTER_AREA)
+    return face
+
+def _decode_upload(image_data: bytes, profile: dict) -> Optional[np.ndarray]:
+    """Decode an uploaded image (large images at a reduced size), recording it in profile"""
+    stages = profile["stages"]
+    
+    # Large images are decoded straight to a reduced size
+    size = read_image_size(image_data[:MAX_HEADER_BYTES])
+    check_image_size(size)
+    flag, profile["decode_scale"] = decode_scale_flag(size)
+    
+    # Convert bytes to numpy array
+    with _stage(stages, "decode"):
+        nparr = np.frombuffer(image_data, np.uint8)
+        image = cv2.imdecode(nparr, flag)
+    
+    if image is None:
+        print("❌ Error: Could not decode image")
+        return None
+    
+    print(f"✅ Image decoded successfully. Shape: {image.shape}")
+    profile["height"], profile["width"] = image.shape[:2]
+    check_image_size((profile["width"], profile["height"]))
+    return image
+
+def prepare_face_profiled(
+    image_data: bytes,
+    roi_hint: Optional[FaceBox] = None,
+    detector: Optional[str] = None
+) -> Tuple[Optional[Tuple[np.ndarray, FaceBox]], dict]:
+    """
+    Decode an image, find its first face and cut the encoder's chip, timing each stage
+    :param image_data: Encoded image bytes
+    :param roi_hint: Face box from a previous frame; detection searches around
+                     it first and falls back to the full frame if it is lost
+    :param detector: Detector backend (see detectors.py), None for FACE_DETECTOR
+    :return: Tuple of ((chip, face box) or None, profile); profile holds
+             started_at (time.time()), input_bytes, detector, stage durations
+             in seconds and, once known, width, height, decode_scale,
+             full_frame (a full-frame detection ran, e.g. because the tracked
+             face was lost), faces, max_rss_bytes and (with
+             TRACK_REQUEST_MEMORY) peak_bytes
+    :raises UploadRejected: If the decoded image is over MAX_IMAGE_PIXELS
+    """
+    profile = {"started_at": time.time(), "input_bytes": len(image_data), "stages": {}, "detector": detector or FACE_DETECTOR}
+    stages = profile["stages"]
+    if TRACK_REQUEST_MEMORY:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    try:
+        image = _decode_upload(image_data, profile)
+        if image is None:
+            return None, profile
+        
+        # Find face locations (full-resolution coordinates)
+        face_locations = detect_face_locations_in_roi(image, roi_hint, stages, detector) if roi_hint is not None else []
+        if roi_hint is not None and not face_locations:
+            print("🔎 Tracked face lost, running full-frame detection")
+        if not face_locations:
+            face_locations = detect_face_locations(image, stages, detector)
+            profile["full_frame"] = True
+        
+        print(f"🔍 Found {len(face_locations)} face(s) in image")
+        profile["faces"] = len(face_locations)
+        
+        if not face_locations:
+            print("❌ No faces detected in image")
+            return None, profile
+        
+        # Align the first face from its full-resolution region
+        chip, _ = extract_face_chip(image, face_locations[0], stages, ENCODER_CHIP_PADDING)
+        return (chip, face_locations[0]), profile
+    
+    except UploadRejected:
+        raise
+    except ImportError:
+        print("❌ Error: face_recognition library not installed. Please run: pip install face-recognition")
+        return None, profile
+    except Exception as e:
+        print(f"❌ Error encoding face: {e}")
+        return None, profile
+    finally:
+        profile["max_rss_bytes"] = worker_max_rss()
+        if TRACK_REQUEST_MEMORY:
+            profile["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+
+def encode_face_profiled(
+    image_data: bytes,
+    roi_hint: Optional[FaceBox] = None,
+    detector: Optional[str] = None
+) -> Tuple[EncodeResult, dict]:
+    """
+    Encode face from image data, timing each stage
+    :param image_data: Encoded image bytes
+    :param roi_hint: See prepare_face_profiled
+    :param detector: Detector backend (see detectors.py), None for FACE_DETECTOR
+    :return: Tuple of (result, profile), profile as in prepare_face_profiled
+    :raises UploadRejected: If the decoded image is over MAX_IMAGE_PIXELS
+    """
+    result, profile = encode_faces_batch([image_data], [detector], [roi_hint])[0]
+    raise_if_rejected(profile)
+    return result, profile
+
+def encode_face_with_chip(image_data: bytes, detector: Optional[str] = None) -> Optional[dict]:
+    """
+    Encode the first face of an image from its aligned chip, for registration
+    :param detector: Detector backend (see detectors.py), None for FACE_DETECTOR
+    :return: None when no face was found, otherwise a dict with encoding,
+             box and landmarks (original image coordinates), chip (JPEG bytes),
+             chip_padding and profile
+    """
+    profile = {"started_at": time.time(), "input_bytes": len(image_data), "stages": {}, "detector": detector or FACE_DETECTOR}
+    stages = profile["stages"]
+    try:
+        image = _decode_upload(image_data, profile)
+        if image is None:
+            return None
+        
+        face_locations = detect_face_locations(image, stages, detector)
+        profile["faces"] = len(face_locations)
+        if not face_locations:
+            print("❌ No faces detected in image")
+            return None
+        
+        chip, landmarks = extract_face_chip(image, face_locations[0], stages)
+        with _stage(stages, "encoding"):
+            face_encoding = encode_aligned_chip(chip)
+        with _stage(stages, "chip_encode"):
+            ok, chip_jpeg = cv2.imencode(
+                ".jpg", cv2.cvtColor(chip, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, FACE_CHIP_JPEG_QUALITY]
+            )
+        if not ok:
+            print("❌ Could not encode face chip")
+            return None
+        
+        # Report coordinates in the original (not reduced) image
+        scale = profile["decode_scale"]
+        print("✅ Successfully encoded face from its aligned chip")
+        return {
+            "encoding": face_encoding,
+            "box": tuple(int(value * scale) for value in face_locations[0]),
+            "landmarks": [(x * scale, y * scale) for x, y in landmarks],
+            "chip": chip_jpeg.tobytes(),
+            "chip_padding": FACE_CHIP_PADDING,
+            "profile": profile
+        }
+    
+    except UploadRejected:
+        raise
+    except Exception as e:
+        print(f"❌ Error encoding face chip: {e}")
+        return None
+
+def encode_face_chips_batch(chips: List[Tuple[bytes, float]]) -> List[Optional[np.ndarray]]:
+    """
+    Encode stored face chips in one pool task and one encoder call (no detection, no landmarks)
+    :param chips: (chip JPEG bytes, padding it was cut with) per chip
+    :return: Encoding per chip, None if a chip could not be decoded
+    """
+    faces = {}
+    for i, (chip_data, padding) in enumerate(chips):
+        chip = cv2.imdecode(np.frombuffer(chip_data, np.uint8), cv2.IMREAD_COLOR)
+        if chip is not None:
+            faces[i] = encoder_chip(cv2.cvtColor(chip, cv2.COLOR_BGR2RGB), padding)
+    encodings: List[Optional[np.ndarray]] = [None] * len(chips)
+    for i, encoding in zip(faces, encode_chips(list(faces.values()))):
+        encodings[i] = encoding
+    return encodings
+
+def encode_face(image_data: bytes, roi_hint: Optional[FaceBox] = None, detector: Optional[str] = None) -> EncodeResult:
+    """Encode face from image data, returning the encoding and its face box"""
+    return encode_face_profiled(image_data, roi_hint, detector)[0]
+
+def encode_faces_batch(
+    images: List[bytes],
+    detectors: Optional[List[Optional[str]]] = None,
+    roi_hints: Optional[List[Optional[FaceBox]]] = None
+) -> List[Tuple[EncodeResult, dict]]:
+    """
+    Encode several images in one pool task (see batch_scheduler.py)
+    
+    Each image is decoded, searched and aligned on its own; then the chips of
+    all of them go through the encoder in one batched call. Each profile's
+    "encoding" stage is its share of that call.
+    :param detectors: Detector backend per image (None = FACE_DETECTOR for all)
+    :param roi_hints: Face box to search around per image (see prepare_face_profiled)
+    :return: (result, profile) per image, as returned by encode_face_profiled;
+             the profile of an image over MAX_IMAGE_PIXELS holds the reason
+             as "rejected" (see raise_if_rejected)
+    """
+    detectors = detectors or [None] * len(images)
+    roi_hints = roi_hints or [None] * len(images)
+    prepared = []
+    for image_data, detector, roi_hint in zip(images, detectors, roi_hints):
+        try:
+            prepared.append(prepare_face_profiled(image_data, roi_hint, detector))
+        except UploadRejected as e:
+            # Only this image's caller is answered with the rejection, not the whole batch
+            prepared.append((None, {
+                "started_at": time.time(), "input_bytes": len(image_data), "stages": {},
+                "detector": detector or FACE_DETECTOR, "rejected": str(e)
+            }))
+    results: List[Tuple[EncodeResult, dict]] = [(None, profile) for _, profile in prepared]
+    with_face = [i for i, (face, _) in enumerate(prepared) if face is not None]
+    if not with_face:
+        return results
+    
+    start = time.perf_counter()
+    try:
+        encodings = encode_chips([prepared[i][0][0] for i in with_face])
+    except Exception as e:
+        print(f"❌ Error encoding faces: {e}")
+        return results
+    share = (time.perf_counter() - start) / len(with_face)
+    
+    for i, encoding in zip(with_face, encodings):
+        (_, face_location), profile = prepared[i]
+        profile["stages"]["encoding"] = profile["stages"].get("encoding", 0.0) + share
+        results[i] = ((encoding, face_location), profile)
+    print(f"✅ Successfully encoded {len(with_face)} face(s)")
+    return results
+
+def raise_if_rejected(profile: dict):
+    """Raise the UploadRejected an image of encode_faces_batch was answered with, if any"""
+    if "rejected" in profile:
+        raise UploadRejected(profile["rejected"])
+
+def locate_faces(image_data: bytes, detector: Optional[str] = None) -> Tuple[Optional[dict], dict]:
+    """
+    Decode an image and detect its faces without encoding them (e.g. for test endpoints)
+    
+    Large images are decoded at a reduced size, as for encoding; the boxes
+    are scaled back to the original image.
+    :param image_data: Encoded image bytes
+    :param detector: Detector backend (see detectors.py), None for FACE_DETECTOR
+    :return: Tuple of (None if the image cannot be decoded, otherwise a dict
+             with the original shape and face_locations; profile as in
+             prepare_face_profiled)
+    """
+    profile = {"started_at": time.time(), "input_bytes": len(image_data), "stages": {}, "detector": detector or FACE_DETECTOR}
+    image = _decode_upload(image_data, profile)
+    if image is None:
+        return None, profile
+    
+    face_locations = detect_face_locations(image, profile["stages"], detector)
+    profile["faces"] = len(face_locations)
+    
+    scale = profile["decode_scale"]
+    size = read_image_size(image_data[:MAX_HEADER_BYTES])
+    width, height = size if size is not None else (image.shape[1] * scale, image.shape[0] * scale)
+    return {
+        "shape": (height, width) + image.shape[2:],
+        "face_locations": [tuple(int(value * scale) for value in box) for box in face_locations]
+    }, profile
+
+def encode_face_image(image_data: bytes) -> Optional[np.ndarray]:
+    """Encode face from image data"""
+    result = encode_face(image_data)
+    return result[0] if result is not None else None
+
+def warm_up_face_models() -> float:
+    """
+    Run detection and encoding once on a synthetic image
+    
+    The first call into dlib is much slower than the following ones, so this
+    runs at startup instead of on a user's first request.
+    :return: Seconds the warm-up took
+    """
+    start = time.perf_counter()
+    image = np.random.default_rng(0).integers(0, 256, (240, 320, 3), dtype=np.uint8)
+    detect_face_locations(image)
+    encode_face_region(image, (60, 220, 180, 100))
+    return time.perf_counter() - start
+
+def verify_face_encoding(known_encoding: np.ndarray, unknown_encoding: np.ndarray, tolerance: float = 0.6) -> bool:
+    """Verify if two face encodings match"""
+    try:
+        # Compare face encodings
+        matches = face_recognition.compare_faces([known_encoding], unknown_encoding, tolerance=tolerance)
+        return matches[0] if matches else False
+    except Exception as e:
+        print(f"Error verifying face: {e}")
+        return False
@@ -0,0 +1,462 @@
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class GalleryIndex:
+    """
+    In-memory 1:N index of face encodings.
+
+    All encodings live in one contiguous float32 matrix with their squared
+    norms precomputed, so a query is a single matrix-vector product:
+    ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2
+    Removed rows are recycled through a free-slot list.
+
+    A user may own several rows (templates). Rows are grouped per user, and
+    per-user sums are kept up to date so a query can reduce the distances of
+    every user's templates (minimum, centroid or both) in one vectorized pass.
+    """
+
+    def __init__(self, dim: int = 128, capacity: int = 1024):
+        """
+        :param dim: Length of a face encoding (128 for dlib)
+        :param capacity: Number of rows to allocate up front
+        """
+        self.dim = dim
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._sq_norms = np.full(capacity, np.inf, dtype=np.float32)
+        self._user_ids: List[Optional[str]] = [None] * capacity
+        self._slots_by_user: Dict[str, List[int]] = {}
+        self._free_slots: List[int] = []
+        self._size = 0  # High-water mark: rows [0, _size) have been used
+        self.ann = None  # Optional approximate index kept in sync with the rows
+        self._rebuild_groups()
+
+    def __len__(self) -> int:
+        return self._size - len(self._free_slots)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._slots_by_user
+
+    @property
+    def user_ids(self) -> List[str]:
+        return list(self._slots_by_user.keys())
+
+    @property
+    def n_users(self) -> int:
+        return len(self._slots_by_user)
+
+    def _resize_matrix(self, new_capacity: int) -> np.ndarray:
+        """Return a matrix of new_capacity rows holding the current rows"""
+        matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        matrix[:self._matrix.shape[0]] = self._matrix
+        return matrix
+
+    def _grow(self):
+        """Double the capacity of the matrix"""
+        old_capacity = self._matrix.shape[0]
+        new_capacity = max(1, old_capacity * 2)
+        matrix = self._resize_matrix(new_capacity)
+        sq_norms = np.full(new_capacity, np.inf, dtype=np.float32)
+        sq_norms[:old_capacity] = self._sq_norms
+        self._matrix = matrix
+        self._sq_norms = sq_norms
+        self._user_ids.extend([None] * (new_capacity - old_capacity))
+        slot_group = np.full(new_capacity, -1, dtype=np.int32)
+        slot_group[:old_capacity] = self._slot_group
+        self._slot_group = slot_group
+
+    def _rebuild_groups(self):
+        """Recompute the per-user groups from _slots_by_user"""
+        capacity = self._matrix.shape[0]
+        self._slot_group = np.full(capacity, -1, dtype=np.int32)
+        self._group_of_user: Dict[str, int] = {}
+        self._group_users: List[Optional[str]] = []
+        self._free_groups: List[int] = []
+        n_groups = max(16, len(self._slots_by_user))
+        self._group_sums = np.zeros((n_groups, self.dim), dtype=np.float32)
+        self._group_counts = np.zeros(n_groups, dtype=np.int32)
+        for user_id, slots in self._slots_by_user.items():
+            self._attach_slots(user_id, slots)
+
+    def _group_for(self, user_id: str) -> int:
+        group = self._group_of_user.get(user_id)
+        if group is not None:
+            return group
+        if self._free_groups:
+            group = self._free_groups.pop()
+            self._group_users[group] = user_id
+        else:
+            group = len(self._group_users)
+            self._group_users.append(user_id)
+            if group == self._group_sums.shape[0]:
+                self._group_sums = np.concatenate([self._group_sums, np.zeros_like(self._group_sums)])
+                self._group_counts = np.concatenate([self._group_counts, np.zeros_like(self._group_counts)])
+        self._group_of_user[user_id] = group
+        return group
+
+    def _attach_slots(self, user_id: str, slots: List[int]):
+        """Add already-written rows to their user's group"""
+        group = self._group_for(user_id)
+        self._slot_group[slots] = group
+        self._group_sums[group] += self._matrix[slots].sum(axis=0)
+        self._group_counts[group] += len(slots)
+
+    def _assign_slots(self, slots: List[int], user_ids: List[Optional[str]]):
+        """
+        Called before rows are written with the users that will own them
+        (None = freed); the persisted gallery journals them here
+        """
+
+    def _release_slots(self, slots: List[int]):
+        """Free rows and update the groups of their users"""
+        live = [slot for slot in slots if self._user_ids[slot] is not None]
+        self._assign_slots(live, [None] * len(live))
+        touched = set()
+        for slot in slots:
+            user_id = self._user_ids[slot]
+            if user_id is None:
+                continue
+            self._slots_by_user[user_id].remove(slot)
+            touched.add(user_id)
+            self._matrix[slot] = 0.0
+            # Infinite norm keeps freed rows out of every search result
+            self._sq_norms[slot] = np.inf
+            self._user_ids[slot] = None
+            self._slot_group[slot] = -1
+            self._free_slots.append(slot)
+
+        for user_id in touched:
+            group = self._group_of_user[user_id]
+            remaining = self._slots_by_user[user_id]
+            if remaining:
+                # Recompute rather than subtract to avoid float drift
+                self._group_sums[group] = self._matrix[remaining].sum(axis=0)
+                self._group_counts[group] = len(remaining)
+            else:
+                del self._slots_by_user[user_id]
+                del self._group_of_user[user_id]
+                self._group_sums[group] = 0.0
+                self._group_counts[group] = 0
+                self._group_users[group] = None
+                self._free_groups.append(group)
+
+        if self.ann is not None and slots:
+            self.ann.on_remove(slots)
+
+    def add(self, user_id: str, encoding: np.ndarray) -> int:
+        """
+        Add an encoding for a user
+        :param user_id: User the encoding belongs to
+        :param encoding: Face encoding of length dim
+        :return: Row index the encoding was stored in
+        """
+        vector = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            if self._size == self._matrix.shape[0]:
+                self._grow()
+            slot = self._size
+            self._size += 1
+
+        self._assign_slots([slot], [user_id])
+        self._matrix[slot] = vector
+        self._sq_norms[slot] = float(np.dot(vector, vector))
+        self._user_ids[slot] = user_id
+        self._slots_by_user.setdefault(user_id, []).append(slot)
+        self._attach_slots(user_id, [slot])
+        if self.ann is not None:
+            self.ann.on_add([slot])
+        return slot
+
+    def add_many(self, user_ids: List[str], encodings: np.ndarray) -> List[int]:
+        """
+        Add many encodings at once (e.g. when loading the gallery)
+        :param user_ids: User of each row of encodings
+        :param encodings: Matrix of shape (len(user_ids), dim)
+        :return: Row index of each encoding
+        """
+        vectors = np.asarray(encodings, dtype=np.float32).reshape(len(user_ids), self.dim)
+        slots = [self._free_slots.pop() for _ in range(min(len(self._free_slots), len(user_ids)))]
+
+        n_new = len(user_ids) - len(slots)
+        while self._size + n_new > self._matrix.shape[0]:
+            self._grow()
+        slots.extend(range(self._size, self._size + n_new))
+        self._size += n_new
+
+        self._assign_slots(slots, user_ids)
+        self._matrix[slots] = vectors
+        self._sq_norms[slots] = np.einsum("ij,ij->i", vectors, vectors)
+        slots_of_user: Dict[str, List[int]] = {}
+        for slot, user_id in zip(slots, user_ids):
+            self._user_ids[slot] = user_id
+            self._slots_by_user.setdefault(user_id, []).append(slot)
+            slots_of_user.setdefault(user_id, []).append(slot)
+        for user_id, user_slots in slots_of_user.items():
+            self._attach_slots(user_id, user_slots)
+        if self.ann is not None:
+            self.ann.on_add(slots)
+        return slots
+
+    def add_templates(self, user_ids: List[str], encodings: np.ndarray, max_templates: int = 0) -> List[int]:
+        """
+        Add encodings as extra templates, dropping each user's oldest ones
+        :param user_ids: User of each row of encodings
+        :param encodings: Matrix of shape (len(user_ids), dim)
+        :param max_templates: Templates kept per user (0 = unlimited)
+        :return: Row index of each encoding that was kept
+        """
+        if max_templates > 0:
+            # Only the newest max_templates of each user can survive
+            keep = []
+            seen: Dict[str, int] = {}
+            for i in range(len(user_ids) - 1, -1, -1):
+                seen[user_ids[i]] = seen.get(user_ids[i], 0) + 1
+                if seen[user_ids[i]] <= max_templates:
+                    keep.append(i)
+            keep.reverse()
+            user_ids = [user_ids[i] for i in keep]
+            encodings = np.asarray(encodings)[keep]
+
+        slots = self.add_many(user_ids, encodings)
+
+        if max_templates > 0:
+            evicted = []
+            for user_id in set(user_ids):
+                user_slots = self._slots_by_user[user_id]
+                if len(user_slots) > max_templates:
+                    # Slots are kept in insertion order, oldest first
+                    evicted.extend(user_slots[:len(user_slots) - max_templates])
+            if evicted:
+                self.remove_slots(evicted)
+        return slots
+
+    def add_template(self, user_id: str, encoding: np.ndarray, max_templates: int = 0) -> int:
+        """
+        Add one template for a user, dropping their oldest beyond max_templates
+        :return: Row index the encoding was stored in
+        """
+        return self.add_templates([user_id], np.asarray(encoding)[np.newaxis], max_templates)[0]
+
+    def remove_slots(self, slots: List[int]) -> int:
+        """
+        Remove individual rows (e.g. a user's oldest template)
+        :param slots: Row indices to free
+        :return: Number of rows removed
+        """
+        self._release_slots(slots)
+        return len(slots)
+
+    def replace_users(self, user_ids: List[str], encodings: np.ndarray) -> List[int]:
+        """
+        Replace all encodings of users with new ones
+        :param user_ids: User of each new encoding (a user may appear several times)
+        :param encodings: Matrix of shape (len(user_ids), dim)
+        :return: Row index of each new encoding
+        """
+        for user_id in dict.fromkeys(user_ids):
+            self.remove(user_id)
+        return self.add_many(user_ids, encodings)
+
+    def get(self, user_id: str) -> np.ndarray:
+        """
+        Encodings of a user
+        :param user_id: User to look up
+        :return: Matrix of shape (n_encodings, dim), empty if the user is unknown
+        """
+        return self._matrix[self._slots_by_user.get(user_id, [])]
+
+    def slots_of(self, user_id: str) -> List[int]:
+        """Row indices of a user's encodings, in the order get() returns them (oldest first)"""
+        return list(self._slots_by_user.get(user_id, []))
+
+    def remove(self, user_id: str) -> int:
+        """
+        Remove every encoding of a user
+        :param user_id: User to remove
+        :return: Number of encodings removed
+        """
+        slots = list(self._slots_by_user.get(user_id, []))
+        self._release_slots(slots)
+        return len(slots)
+
+    def clear(self):
+        """Remove all encodings, keeping the allocated capacity"""
+        self._matrix[:self._size] = 0.0
+        self._sq_norms[:self._size] = np.inf
+        self._user_ids = [None] * self._matrix.shape[0]
+        self._slots_by_user = {}
+        self._free_slots = []
+        self._size = 0
+        self._rebuild_groups()
+        if self.ann is not None:
+            self.ann.reset()
+
+    def attach_ann(self, ann):
+        """
+        Keep an approximate index in sync with this gallery and use it for search
+        :param ann: Index such as ann_index.IVFIndex built over this gallery
+        """
+        self.ann = ann
+        ann.maybe_train()
+
+    def live_slots(self) -> np.ndarray:
+        """Row indices that currently hold an encoding"""
+        return np.flatnonzero(np.isfinite(self._sq_norms[:self._size]))
+
+    def distances(self, encoding: np.ndarray) -> np.ndarray:
+        """
+        Euclidean distance from an encoding to every used row
+        :param encoding: Query face encoding
+        :return: Array of length _size (freed rows are inf)
+        """
+        query = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        matrix = self._matrix[:self._size]
+        sq_dist = self._sq_norms[:self._size] - 2.0 * (matrix @ query) + np.dot(query, query)
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+        return np.sqrt(sq_dist)
+
+    def distances_to(self, encoding: np.ndarray, slots: np.ndarray) -> np.ndarray:
+        """
+        Euclidean distance from an encoding to selected rows
+        :param encoding: Query face encoding
+        :param slots: Row indices
+        :return: Array of distances, one per slot
+        """
+        query = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        sq_dist = self._sq_norms[slots] - 2.0 * (self._matrix[slots] @ query) + np.dot(query, query)
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+        return np.sqrt(sq_dist)
+
+    def user_distance(self, encoding: np.ndarray, user_id: str, aggregation: str = "min") -> float:
+        """
+        Distance from an encoding to one user's templates
+        :param encoding: Query face encoding
+        :param user_id: User to compare against
+        :param aggregation: "min" (closest template), "centroid" (mean template)
+            or "both" (the larger of the two, i.e. both must match)
+        :return: Aggregated distance, inf if the user is unknown
+        """
+        slots = self._slots_by_user.get(user_id)
+        if not slots:
+            return float("inf")
+
+        query = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        min_distance = float(self.distances_to(query, slots).min())
+        if aggregation == "min":
+            return min_distance
+
+        group = self._group_of_user[user_id]
+        centroid = self._group_sums[group] / self._group_counts[group]
+        centroid_distance = float(np.linalg.norm(centroid - query))
+        if aggregation == "centroid":
+            return centroid_distance
+        return max(min_distance, centroid_distance)
+
+    def user_distances(self, encoding: np.ndarray, aggregation: str = "min") -> Tuple[List[Optional[str]], np.ndarray]:
+        """
+        Aggregated distance from an encoding to every user in one pass
+        :param encoding: Query face encoding
+        :param aggregation: "min", "centroid" or "both" (see user_distance)
+        :return: Tuple of (user per group, distance per group); unused groups are inf
+        """
+        query = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        n_groups = len(self._group_users)
+        counts = self._group_counts[:n_groups]
+        active = counts > 0
+        result = np.full(n_groups, np.inf, dtype=np.float32)
+
+        if aggregation in ("min", "both"):
+            dist = self.distances(query)
+            groups = self._slot_group[:self._size]
+            live = groups >= 0
+            np.minimum.at(result, groups[live], dist[live])
+
+        if aggregation in ("centroid", "both"):
+            centroid_dist = np.full(n_groups, np.inf, dtype=np.float32)
+            centroids = self._group_sums[:n_groups][active] / counts[active, np.newaxis]
+            centroid_dist[active] = np.linalg.norm(centroids - query, axis=1)
+            result = centroid_dist if aggregation == "centroid" else np.maximum(result, centroid_dist)
+
+        return self._group_users, result
+
+    def search(self, encoding: np.ndarray, k: int = 1, aggregation: str = "min") -> List[Tuple[str, float]]:
+        """
+        Find the k nearest distinct users
+        :param encoding: Query face encoding
+        :param k: Number of users to return
+        :param aggregation: How a user's templates are reduced (see user_distance)
+        :return: List of (user_id, distance) sorted by distance
+        """
+        if len(self) == 0 or k <= 0:
+            return []
+
+        # Large galleries can use an approximate index (see ann_index.py)
+        if self.ann is not None and self.ann.is_trained:
+            if aggregation == "min":
+                return self.ann.search(encoding, k)
+            # Shortlist users by their closest template, then aggregate exactly
+            shortlist = self.ann.search(encoding, 4 * k)
+            scored = sorted(
+                (self.user_distance(encoding, user_id, aggregation), user_id) for user_id, _ in shortlist
+            )
+            return [(user_id, distance) for distance, user_id in scored[:k]]
+
+        if aggregation == "min":
+            return self.exact_search(encoding, k)
+
+        group_users, dist = self.user_distances(encoding, aggregation)
+        k = min(k, self.n_users)
+        order = np.argpartition(dist, k - 1)[:k] if k < dist.shape[0] else np.arange(dist.shape[0])
+        order = order[np.argsort(dist[order])]
+        return [(group_users[group], float(dist[group])) for group in order if np.isfinite(dist[group])]
+
+    def exact_search(self, encoding: np.ndarray, k: int = 1) -> List[Tuple[str, float]]:
+        """Brute-force search over every row (see search)"""
+        if len(self) == 0 or k <= 0:
+            return []
+
+        dist = self.distances(encoding)
+        return self.rank_users(np.arange(dist.shape[0]), dist, k)
+
+    def rank_users(self, slots: np.ndarray, dist: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """
+        Pick the k nearest distinct users among candidate rows
+        :param slots: Candidate row indices
+        :param dist: Distance of each candidate row
+        :param k: Number of users to return
+        :return: List of (user_id, distance) sorted by distance
+        """
+        k = min(k, self.n_users)
+        if k <= 0 or dist.shape[0] == 0:
+            return []
+
+        # A user may own several rows, so widen the candidate set until it
+        # holds k distinct users
+        n_candidates = k
+        while True:
+            n_candidates = min(n_candidates, dist.shape[0])
+            if n_candidates == dist.shape[0]:
+                order = np.argsort(dist)
+            else:
+                order = np.argpartition(dist, n_candidates - 1)[:n_candidates]
+                order = order[np.argsort(dist[order])]
+
+            results: List[Tuple[str, float]] = []
+            seen = set()
+            for i in order:
+                user_id = self._user_ids[slots[i]]
+                if user_id is None or user_id in seen:
+                    continue
+                seen.add(user_id)
+                results.append((user_id, float(dist[i])))
+                if len(results) == k:
+                    return results
+
+            if n_candidates == dist.shape[0]:
+                return results
+            n_candidates *= 2
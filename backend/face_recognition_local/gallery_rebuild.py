@@ -0,0 +1,428 @@
+"""
+Incremental rebuild of the gallery from the face image store.
+
+A rebuild lists every user's images (store manifests and legacy per-user
+folders), encodes only the images whose content hash has no encoding yet,
+and builds a new gallery from the newest MAX_TEMPLATES_PER_USER encodings of
+each user. Images are encoded in chunks, at most max_in_flight at a time;
+the API runs rebuilds on the background pool (see executor.py), so live
+verify/unlock requests never wait behind a rebuild, and the CLI on a pool
+of its own that uses every core.
+
+State kept in REBUILD_DIR makes the next rebuild (or a rebuild restarted
+after a crash) skip everything that was already encoded:
+    encodings.bin   fixed-size records (sha256, ok flag, encoding), appended
+                    as results arrive; a torn last record is dropped on load
+    encodings.json  GALLERY_MODEL_VERSION the records were computed with; a
+                    different version starts from scratch
+    files.jsonl     [path, size, mtime_ns, sha256] of legacy files, so an
+                    unchanged file is not read again just to hash it
+
+The manifest is loaded once per process and shared with the gallery
+watcher (gallery_watcher.py), which encodes the images of users whose
+folder or FaceData rows changed in the same way; manifest_lock keeps the
+two from using it at the same time.
+
+Stored face chips are encoded without detection, and an upload whose chip
+is stored is not encoded at all. Users unregistered through the API come
+back on a rebuild if their images are still in the store.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from config.settings import (
+    REBUILD_DIR, GALLERY_MODEL_VERSION, REBUILD_CHUNK_SIZE, MAX_TEMPLATES_PER_USER, GALLERY_PATH, FACE_WORKERS,
+    BACKGROUND_MAX_IN_FLIGHT
+)
+from face_recognition_local.bulk_import import IMAGE_EXTENSIONS, SKIP_DIRS
+from face_recognition_local.executor import bounded_map
+from face_recognition_local.gallery_store import MappedGalleryIndex, attach_configured_ann
+from face_recognition_local.image_store import ImageStore
+
+ENCODING_DIM = 128
+
+NO_FACE = "No face detected"
+
+RECORD = np.dtype([("digest", "S64"), ("ok", "u1"), ("encoding", "<f4", (ENCODING_DIM,))])
+
+class SourceImage(NamedTuple):
+    user_id: str
+    digest: Optional[str]  # sha256, None until a legacy file is hashed
+    path: str
+    created: float
+    kind: str  # "original" or "chip"
+    padding: float  # Chip padding (chips only)
+    size: int
+    mtime_ns: int
+
+class EncodingManifest:
+    """Append-only map of image content hash to encoding (None = no face)"""
+
+    def __init__(self, directory: str, model_version: str, full: bool = False):
+        """
+        :param directory: State directory (REBUILD_DIR)
+        :param model_version: Records made with another version are discarded
+        :param full: Discard all records and start from scratch
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "encodings.bin")
+        self.meta_path = os.path.join(directory, "encodings.json")
+
+        meta = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if full or meta is None or meta.get("model_version") != model_version:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({"model_version": model_version, "dim": ENCODING_DIM}, f)
+
+        self._index: Dict[str, int] = {}
+        self._loaded = np.zeros(0, dtype=RECORD)
+        self._appended: List[Optional[np.ndarray]] = []
+        self._load()
+        self._file = open(self.path, "ab")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        complete = size // RECORD.itemsize
+        if complete * RECORD.itemsize != size:
+            # Torn record from a crash during an append
+            with open(self.path, "r+b") as f:
+                f.truncate(complete * RECORD.itemsize)
+        if complete:
+            # Mapped rather than read: the manifest stays open for the life of the process
+            self._loaded = np.memmap(self.path, dtype=RECORD, mode="r", shape=(complete,))
+        for row, digest in enumerate(self._loaded["digest"]):
+            self._index[digest.decode()] = row
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, digest: str) -> Optional[np.ndarray]:
+        """Encoding of an image, None if it had no face or is unknown"""
+        row = self._index.get(digest)
+        if row is None:
+            return None
+        if row < len(self._loaded):
+            record = self._loaded[row]
+            return record["encoding"] if record["ok"] else None
+        return self._appended[row - len(self._loaded)]
+
+    def append(self, results: List[Tuple[str, Optional[np.ndarray]]]):
+        """Record encodings (None = no face) and make them durable"""
+        records = np.zeros(len(results), dtype=RECORD)
+        for i, (digest, encoding) in enumerate(results):
+            records[i]["digest"] = digest.encode()
+            if encoding is not None:
+                records[i]["ok"] = 1
+                records[i]["encoding"] = encoding
+            self._index[digest] = len(self._loaded) + len(self._appended)
+            self._appended.append(None if encoding is None else np.asarray(encoding, dtype=np.float32))
+        self._file.write(records.tobytes())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+class FileHashCache:
+    """Content hashes of legacy files, valid while their size and mtime are unchanged"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        file_path, size, mtime_ns, digest = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._hashes[file_path] = (size, mtime_ns, digest)
+        self._pending: List[str] = []
+
+    def get(self, image: SourceImage) -> Optional[str]:
+        cached = self._hashes.get(image.path)
+        if cached is not None and cached[0] == image.size and cached[1] == image.mtime_ns:
+            return cached[2]
+        return None
+
+    def add(self, image: SourceImage, digest: str):
+        self._hashes[image.path] = (image.size, image.mtime_ns, digest)
+        self._pending.append(json.dumps([image.path, image.size, image.mtime_ns, digest]) + "\n")
+
+    def flush(self):
+        if self._pending:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(self._pending))
+            self._pending = []
+
+def hash_file(path: str) -> Optional[str]:
+    """sha256 of a file, None if it cannot be read (e.g. removed since the scan)"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def manifest_sources(store: ImageStore, user_id: str) -> List[SourceImage]:
+    """Images of a user in the store manifest (uploads covered by a stored chip are left out)"""
+    entries = store.entries(user_id)
+    # Uploads whose aligned chip is stored are encoded from the chip
+    chip_sources = {entry.get("source") for entry in entries if entry.get("kind") == "chip"}
+    images = []
+    for entry in entries:
+        kind = entry.get("kind", "original")
+        if kind == "original" and entry["sha256"] in chip_sources:
+            continue
+        images.append(SourceImage(
+            user_id, entry["sha256"], store.path_of(entry), entry["created"],
+            kind, entry.get("padding", 0.0), entry["size"], 0
+        ))
+    return images
+
+def legacy_sources(store: ImageStore, user_id: str) -> List[SourceImage]:
+    """Image files in a user's legacy folder (unhashed)"""
+    images = []
+    for dirpath, _, filenames in os.walk(store.user_dir(user_id)):
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                file_stat = os.stat(path)
+            except FileNotFoundError:
+                # Removed since it was listed
+                continue
+            images.append(SourceImage(
+                user_id, None, path, file_stat.st_mtime, "original", 0.0, file_stat.st_size, file_stat.st_mtime_ns
+            ))
+    return images
+
+def scan_image_sources(store: ImageStore) -> List[SourceImage]:
+    """
+    List every user's images: store manifest entries, then legacy folder files
+    :param store: Image store to scan
+    """
+    images = []
+    for user_id in store.manifest_user_ids():
+        if user_id not in SKIP_DIRS:
+            images.extend(manifest_sources(store, user_id))
+
+    for user_id in sorted(os.listdir(store.root)):
+        if user_id not in SKIP_DIRS and os.path.isdir(store.user_dir(user_id)):
+            images.extend(legacy_sources(store, user_id))
+    return images
+
+def hash_sources(images: List[SourceImage], file_hashes: FileHashCache) -> Tuple[List[SourceImage], int]:
+    """
+    Fill in the content hash of legacy files (I/O bound, so on threads)
+    :return: Tuple of (images with a hash, files that had to be read); unreadable files are dropped
+    """
+    images = list(images)
+    to_hash = []
+    for i, image in enumerate(images):
+        if image.digest is None:
+            digest = file_hashes.get(image)
+            if digest is None:
+                to_hash.append(i)
+            else:
+                images[i] = image._replace(digest=digest)
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=max(4, FACE_WORKERS)) as pool:
+            for i, digest in zip(to_hash, pool.map(hash_file, [images[i].path for i in to_hash])):
+                if digest is not None:
+                    images[i] = images[i]._replace(digest=digest)
+                    file_hashes.add(images[i], digest)
+        file_hashes.flush()
+    return [image for image in images if image.digest is not None], len(to_hash)
+
+def dated_templates(images: List[SourceImage], manifest: EncodingManifest) -> List[Tuple[float, np.ndarray]]:
+    """(created, encoding) of each distinct image of a user that has a face, oldest first"""
+    seen, templates = set(), []
+    for image in sorted(images, key=lambda image: (image.created, image.digest)):
+        encoding = manifest.get(image.digest)
+        if encoding is not None and image.digest not in seen:
+            seen.add(image.digest)
+            templates.append((image.created, encoding))
+    return templates
+
+def encode_rebuild_chunk(jobs: List[Tuple[str, str, str, float]]) -> List[Tuple[str, Optional[np.ndarray], Optional[str]]]:
+    """
+    Encode images for a rebuild (runs in a pool worker)
+    
+    Stored chips and full images are each encoded in one batched encoder call.
+    :param jobs: (sha256, path, kind, chip padding) per image
+    :return: (sha256, encoding or None, error or None) per image
+    """
+    # Imported here so only the workers load the face models
+    from face_recognition_local.face_engine import encode_face_chips_batch, encode_faces_batch
+    
+    results: List[Tuple[str, Optional[np.ndarray], Optional[str]]] = []
+    chips, images = [], []
+    for digest, path, kind, padding in jobs:
+        try:
+            with open(path, "rb") as f:
+                image_data = f.read()
+        except Exception as e:
+            results.append((digest, None, str(e)))
+            continue
+        if kind == "chip":
+            chips.append((digest, (image_data, padding)))
+        else:
+            images.append((digest, image_data))
+    
+    encoded = []
+    if chips:
+        encoded.extend(zip([digest for digest, _ in chips], encode_face_chips_batch([chip for _, chip in chips])))
+    if images:
+        batch = encode_faces_batch([image_data for _, image_data in images])
+        encoded.extend(
+            (digest, result[0] if result is not None else None) for (digest, _), (result, _) in zip(images, batch)
+        )
+    results.extend((digest, encoding, None if encoding is not None else NO_FACE) for digest, encoding in encoded)
+    return results
+
+_rebuild_lock = threading.Lock()
+
+# Held while the shared encoding manifest is used (rebuilds and the gallery watcher)
+manifest_lock = threading.Lock()
+_manifest: Optional[EncodingManifest] = None
+
+def shared_encoding_manifest(full: bool = False) -> EncodingManifest:
+    """
+    The EncodingManifest of REBUILD_DIR, loaded once per process (call with manifest_lock held)
+    :param full: Discard all records and start from scratch
+    """
+    global _manifest
+    if _manifest is None or full:
+        if _manifest is not None:
+            _manifest.close()
+        _manifest = EncodingManifest(REBUILD_DIR, GALLERY_MODEL_VERSION, full)
+    return _manifest
+
+def run_gallery_rebuild(
+    store: ImageStore,
+    executor: Executor,
+    full: bool = False,
+    output_path: str = GALLERY_PATH + ".rebuild",
+    chunk_size: int = REBUILD_CHUNK_SIZE,
+    progress_every: int = 5000,
+    max_in_flight: int = BACKGROUND_MAX_IN_FLIGHT
+) -> Tuple[MappedGalleryIndex, dict]:
+    """
+    Encode new images and build a gallery from the whole store
+    :param store: Image store to rebuild from
+    :param executor: Pool the images are encoded in
+    :param full: Re-encode every image, ignoring the encoding manifest
+    :param output_path: Gallery file to build (replaced if it exists)
+    :param chunk_size: Images sent to a worker at a time
+    :param progress_every: Print throughput every N encoded images (0 disables)
+    :param max_in_flight: Most chunks submitted to the pool at a time
+    :return: Tuple of (new gallery, report); install it with gallery_store.swap_face_gallery
+    :raises RuntimeError: If another rebuild is running in this process
+    """
+    if not _rebuild_lock.acquire(blocking=False):
+        raise RuntimeError("A gallery rebuild is already running")
+    try:
+        start = time.perf_counter()
+        # The watcher waits while a rebuild uses the manifest
+        with manifest_lock:
+            manifest = shared_encoding_manifest(full)
+            file_hashes = FileHashCache(os.path.join(REBUILD_DIR, "files.jsonl"))
+
+            images = scan_image_sources(store)
+            scanned_at = time.perf_counter()
+            print(f"🔎 Gallery rebuild: {len(images)} image(s) found in {store.root}")
+
+            images, hashed = hash_sources(images, file_hashes)
+            hashed_at = time.perf_counter()
+
+            # Encode each missing content hash once
+            jobs, queued = [], set()
+            for image in images:
+                if image.digest not in manifest and image.digest not in queued:
+                    queued.add(image.digest)
+                    jobs.append((image.digest, image.path, image.kind, image.padding))
+            print(f"🧮 {len(jobs)} image(s) to encode, {len(images) - len(jobs)} already in the manifest")
+
+            failed = []
+            encoded = 0
+            job_paths = {digest: path for digest, path, _, _ in jobs}
+            chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+            for results in bounded_map(executor, encode_rebuild_chunk, chunks, max_in_flight):
+                # Read errors are not recorded, so the image is retried next time
+                # (e.g. a blob still in the image writer's queue)
+                manifest.append([
+                    (digest, encoding) for digest, encoding, error in results if error is None or error == NO_FACE
+                ])
+                failed.extend(
+                    {"sha256": digest, "path": job_paths[digest], "error": error}
+                    for digest, _, error in results if error is not None
+                )
+                encoded += len(results)
+                if progress_every and encoded // progress_every != (encoded - len(results)) // progress_every:
+                    elapsed = time.perf_counter() - hashed_at
+                    print(f"⏱️  {encoded}/{len(jobs)} images, {encoded / elapsed:.1f} images/sec")
+            encoded_at = time.perf_counter()
+
+            # Newest templates of each user, oldest first
+            by_user: Dict[str, List[SourceImage]] = {}
+            for image in images:
+                by_user.setdefault(image.user_id, []).append(image)
+            user_ids, vectors = [], []
+            for user_id, user_images in by_user.items():
+                templates = [encoding for _, encoding in dated_templates(user_images, manifest)]
+                if MAX_TEMPLATES_PER_USER > 0:
+                    templates = templates[-MAX_TEMPLATES_PER_USER:]
+                user_ids.extend([user_id] * len(templates))
+                vectors.extend(templates)
+
+        for leftover in (output_path, output_path + ".ids"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        gallery = MappedGalleryIndex(output_path, dim=ENCODING_DIM, capacity=max(1024, len(vectors)))
+        if vectors:
+            gallery.add_many(user_ids, np.asarray(vectors, dtype=np.float32))
+        gallery.close()
+        attach_configured_ann(gallery)
+        elapsed = time.perf_counter() - start
+
+        print(f"✅ Gallery rebuilt: {len(gallery)} template(s) for {gallery.n_users} user(s) in {elapsed:.1f}s")
+        return gallery, {
+            "total_images": len(images),
+            "hashed_images": hashed,
+            "encoded_images": len(jobs),
+            "reused_encodings": len(images) - len(jobs),
+            "failed": failed,
+            "users": gallery.n_users,
+            "templates": len(gallery),
+            "elapsed_seconds": round(elapsed, 3),
+            "stage_seconds": {
+                "scan": round(scanned_at - start, 3),
+                "hash": round(hashed_at - scanned_at, 3),
+                "encode": round(encoded_at - hashed_at, 3),
+                "build": round(time.perf_counter() - encoded_at, 3)
+            },
+            "images_per_second": round(len(jobs) / (encoded_at - hashed_at), 2) if jobs and encoded_at > hashed_at else 0.0
+        }
+    finally:
+        _rebuild_lock.release()
@@ -0,0 +1,523 @@
+"""
+Gallery persisted as a memory-mapped file.
+
+Layout on disk (GALLERY_PATH):
+    <path>       16-byte header followed by fixed-stride float32 rows
+    <path>.ids   JSON-lines journal of [row, user_id] (user_id null = freed)
+    <path>.lock  flock()ed by whichever process is changing the gallery
+
+On startup the vectors are mapped, not parsed, so a worker can answer 1:N
+queries right away and processes opening the same file share the OS page
+cache. Only the small id journal is read and replayed.
+
+Several processes (e.g. uvicorn workers) may open the same gallery. Every
+change holds an exclusive lock on <path>.lock and first replays what other
+processes journaled, so two processes never hand out the same row. Before
+a query, refresh() compares the size and inode of both files with what was
+loaded, and replays the new journal lines (remapping the file if it grew,
+or reloading it if it was compacted or replaced by a rebuild).
+
+A change appends its journal lines before it writes the rows, under the
+lock: another process only replays the journal holding the same lock, so it
+never reads a slot that is still being rewritten. Writing both to disk is
+left to a background thread (fdatasync only writes the pages that changed),
+so registrations do not wait for the disk.
+
+A rebuilt gallery (see gallery_rebuild.py) is written next to the live one
+and moved over it with move_to(); a <path>.swap marker lets the next open
+finish a move that was interrupted between the two renames.
+"""
+
+import contextlib
+import json
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, run a single process
+    fcntl = None
+
+from config.settings import GALLERY_PATH, ANN_ENABLED, ANN_MIN_SIZE, ANN_LISTS, ANN_NPROBE, ANN_RETRAIN_GROWTH
+from face_recognition_local.gallery_index import GalleryIndex
+from face_recognition_local.ann_index import IVFIndex
+
+MAGIC = b"FGAL"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBxH8x")  # magic, version, dim, reserved
+
+class GalleryLock:
+    """
+    Exclusive lock on <gallery>.lock, across processes (flock) and threads
+
+    Re-entrant within a process, and shared by every MappedGalleryIndex of
+    the same path, so e.g. moving a rebuilt gallery over a locked one does
+    not deadlock.
+    """
+
+    _locks: Dict[str, "GalleryLock"] = {}
+    _locks_guard = threading.Lock()
+
+    @classmethod
+    def for_path(cls, path: str) -> "GalleryLock":
+        lock_path = os.path.abspath(path) + ".lock"
+        with cls._locks_guard:
+            lock = cls._locks.get(lock_path)
+            if lock is None:
+                lock = cls._locks[lock_path] = cls(lock_path)
+            return lock
+
+    def __init__(self, lock_path: str):
+        self.path = lock_path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            if self._depth == 0 and fcntl is not None:
+                if self._fd is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+def _file_state(path: str) -> Tuple[Optional[int], int]:
+    """(inode, size) of a file, (None, 0) if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None, 0
+    return stat.st_ino, stat.st_size
+
+class MappedGalleryIndex(GalleryIndex):
+    """GalleryIndex whose matrix lives in a memory-mapped file"""
+
+    def __init__(self, path: str, dim: int = 128, capacity: int = 1024):
+        """
+        Open (or create) a gallery file
+        :param path: Vector file; the id journal is stored next to it
+        :param dim: Encoding length, must match an existing file
+        :param capacity: Rows to allocate when creating a new file
+        """
+        super().__init__(dim=dim, capacity=0)
+        self.path = path
+        self.ids_path = path + ".ids"
+        self._row_bytes = dim * 4
+        self._lock = GalleryLock.for_path(path)
+        self._flusher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gallery-flush")
+        self._flush_guard = threading.Lock()
+        self._flush_pending = False
+
+        with self._lock:
+            finish_interrupted_move(path)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(HEADER.pack(MAGIC, FORMAT_VERSION, dim))
+                    f.truncate(HEADER.size + capacity * self._row_bytes)
+            self._load()
+
+    def _map(self, rows: int) -> np.ndarray:
+        return np.memmap(self.path, dtype=np.float32, mode="r+", offset=HEADER.size, shape=(rows, self.dim))
+
+    def _load(self):
+        """Map the vector file and replay the whole id journal (lock held)"""
+        with open(self.path, "rb") as f:
+            magic, version, file_dim = HEADER.unpack(f.read(HEADER.size))
+            self._matrix_ino = os.fstat(f.fileno()).st_ino
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Not a gallery file (or unsupported version): {self.path}")
+        if file_dim != self.dim:
+            raise ValueError(f"Gallery file has dim {file_dim}, expected {self.dim}")
+
+        rows = (os.path.getsize(self.path) - HEADER.size) // self._row_bytes
+        self._matrix = self._map(rows)
+        self._sq_norms = np.full(rows, np.inf, dtype=np.float32)
+        self._user_ids = [None] * rows
+        self._load_ids()
+        if self.ann is not None:
+            self.ann.reset()
+            self.ann.maybe_train()
+
+    def _read_journal(self, offset: int) -> Tuple[Dict[int, Optional[str]], int]:
+        """
+        Read the complete journal lines after offset
+        :return: Tuple of (owner of each slot, in order of last assignment; number of lines)
+        """
+        self._journal_ino, size = _file_state(self.ids_path)
+        owners: Dict[int, Optional[str]] = {}
+        lines = 0
+        if self._journal_ino is not None and size > offset:
+            with open(self.ids_path, "rb") as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+            # A line still being appended by another process is read next time
+            data = data[:data.rfind(b"\n") + 1]
+            offset += len(data)
+            for line in data.splitlines():
+                if not line.strip():
+                    continue
+                lines += 1
+                slot, user_id = json.loads(line)
+                owners.pop(slot, None)
+                owners[slot] = user_id
+        self._journal_offset = offset
+        return owners, lines
+
+    def _load_ids(self):
+        """Replay the id journal and compute norms of the live rows"""
+        owners, journal_lines = self._read_journal(0)
+        for slot, user_id in owners.items():
+            if slot < len(self._user_ids):
+                self._user_ids[slot] = user_id
+
+        used = [slot for slot, user_id in enumerate(self._user_ids) if user_id is not None]
+        self._size = used[-1] + 1 if used else 0
+        self._free_slots = [slot for slot in range(self._size - 1, -1, -1) if self._user_ids[slot] is None]
+        
+        # Keep each user's templates in the order they were added (oldest first)
+        self._slots_by_user = {}
+        for slot, user_id in owners.items():
+            if user_id is not None and slot < len(self._user_ids):
+                self._slots_by_user.setdefault(user_id, []).append(slot)
+        self._rebuild_groups()
+
+        if used:
+            vectors = self._matrix[used]
+            self._sq_norms[used] = np.einsum("ij,ij->i", vectors, vectors)
+
+        # Keep the journal from growing without bound
+        if journal_lines > 2 * len(used) + 1024:
+            self.compact()
+
+    @contextlib.contextmanager
+    def locked(self):
+        """
+        Hold the gallery's lock, with changes from other processes replayed
+        
+        Every change takes it; hold it around a check-then-change sequence
+        that must not interleave with other processes.
+        """
+        with self._lock:
+            self._refresh_locked()
+            yield self
+
+    def refresh(self) -> bool:
+        """
+        Pick up rows other processes added or removed since the last call
+        
+        Two stat() calls when nothing changed, so it runs before every query
+        (see get_face_gallery).
+        :return: True if the gallery changed
+        """
+        if not self._changed_on_disk():
+            return False
+        with self._lock:
+            return self._refresh_locked()
+
+    def _changed_on_disk(self) -> bool:
+        matrix_ino, matrix_size = _file_state(self.path)
+        mapped_size = HEADER.size + self._matrix.shape[0] * self._row_bytes
+        return (
+            (matrix_ino, matrix_size) != (self._matrix_ino, mapped_size)
+            or _file_state(self.ids_path) != (self._journal_ino, self._journal_offset)
+        )
+
+    def _refresh_locked(self) -> bool:
+        if not self._changed_on_disk():
+            return False
+        journal_ino, journal_size = _file_state(self.ids_path)
+        if (
+            _file_state(self.path)[0] != self._matrix_ino
+            or journal_ino != self._journal_ino
+            or journal_size < self._journal_offset
+        ):
+            # Replaced (rebuilt gallery installed) or journal compacted
+            self._load()
+            return True
+
+        rows = (os.path.getsize(self.path) - HEADER.size) // self._row_bytes
+        if rows > self._matrix.shape[0]:
+            self._extend_rows(rows)
+        owners, _ = self._read_journal(self._journal_offset)
+        self._apply_owners(owners)
+        return True
+
+    def _extend_rows(self, rows: int):
+        """Map rows another process added to the file"""
+        added = rows - self._matrix.shape[0]
+        self._matrix = self._map(rows)
+        self._sq_norms = np.concatenate([self._sq_norms, np.full(added, np.inf, dtype=np.float32)])
+        self._user_ids.extend([None] * added)
+        self._slot_group = np.concatenate([self._slot_group, np.full(added, -1, dtype=np.int32)])
+
+    def _apply_owners(self, owners: Dict[int, Optional[str]]):
+        """Apply slot assignments journaled by another process (rows are already in the file)"""
+        if not owners:
+            return
+        touched = set()
+        removed, added = [], []
+        for slot, user_id in owners.items():
+            if slot >= len(self._user_ids):
+                continue
+            previous = self._user_ids[slot]
+            if previous is not None:
+                self._slots_by_user[previous].remove(slot)
+                self._slot_group[slot] = -1
+                touched.add(previous)
+                removed.append(slot)
+            self._user_ids[slot] = user_id
+            if user_id is None:
+                self._sq_norms[slot] = np.inf
+            else:
+                vector = self._matrix[slot]
+                self._sq_norms[slot] = float(np.dot(vector, vector))
+                self._slots_by_user.setdefault(user_id, []).append(slot)
+                touched.add(user_id)
+                added.append(slot)
+
+        for user_id in touched:
+            self._regroup(user_id)
+        used = [slot for slot, user_id in enumerate(self._user_ids) if user_id is not None]
+        self._size = used[-1] + 1 if used else 0
+        self._free_slots = [slot for slot in range(self._size - 1, -1, -1) if self._user_ids[slot] is None]
+
+        if self.ann is not None:
+            if removed:
+                self.ann.on_remove(removed)
+            if added:
+                self.ann.on_add(added)
+
+    def _regroup(self, user_id: str):
+        """Recompute one user's group after their slots changed"""
+        group = self._group_of_user.get(user_id)
+        if group is not None:
+            self._group_sums[group] = 0.0
+            self._group_counts[group] = 0
+        if self._slots_by_user.get(user_id):
+            self._attach_slots(user_id, self._slots_by_user[user_id])
+            return
+        self._slots_by_user.pop(user_id, None)
+        if group is not None:
+            del self._group_of_user[user_id]
+            self._group_users[group] = None
+            self._free_groups.append(group)
+
+    def _assign_slots(self, slots: List[int], user_ids: List[Optional[str]]):
+        """Record which user owns each slot before its row is written (lock held)"""
+        if not slots:
+            return
+        with open(self.ids_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps([slot, user_id]) + "\n" for slot, user_id in zip(slots, user_ids)))
+            f.flush()
+            self._journal_offset = f.tell()
+            self._journal_ino = os.fstat(f.fileno()).st_ino
+
+    def _schedule_flush(self):
+        """Write the changed rows and journal to disk in the background"""
+        with self._flush_guard:
+            if self._flush_pending:
+                return
+            self._flush_pending = True
+        self._flusher.submit(self._flush_to_disk)
+
+    def _flush_to_disk(self):
+        with self._flush_guard:
+            self._flush_pending = False
+        sync = getattr(os, "fdatasync", os.fsync)
+        # Vectors first, so a journal line on disk never names an unwritten row
+        for path in (self.path, self.ids_path):
+            try:
+                fd = os.open(path, os.O_RDWR)
+                try:
+                    sync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                print(f"⚠️  Could not flush gallery file {path}: {e}")
+
+    def _resize_matrix(self, new_capacity: int) -> np.ndarray:
+        self._matrix.flush()
+        with open(self.path, "r+b") as f:
+            f.truncate(HEADER.size + new_capacity * self._row_bytes)
+        return self._map(new_capacity)
+
+    def add(self, user_id: str, encoding: np.ndarray) -> int:
+        with self.locked():
+            slot = super().add(user_id, encoding)
+        self._schedule_flush()
+        return slot
+
+    def add_many(self, user_ids: List[str], encodings: np.ndarray) -> List[int]:
+        with self.locked():
+            slots = super().add_many(user_ids, encodings)
+        self._schedule_flush()
+        return slots
+
+    def add_templates(self, user_ids: List[str], encodings: np.ndarray, max_templates: int = 0) -> List[int]:
+        # Adding and evicting must not interleave with another process
+        with self.locked():
+            return super().add_templates(user_ids, encodings, max_templates)
+
+    def remove(self, user_id: str) -> int:
+        with self.locked():
+            removed = super().remove(user_id)
+        self._schedule_flush()
+        return removed
+
+    def remove_slots(self, slots: List[int]) -> int:
+        with self.locked():
+            removed = super().remove_slots(slots)
+        self._schedule_flush()
+        return removed
+
+    def replace_users(self, user_ids: List[str], encodings: np.ndarray) -> List[int]:
+        # Removing and adding must not interleave with another process
+        with self.locked():
+            return super().replace_users(user_ids, encodings)
+
+    def clear(self):
+        with self.locked():
+            super().clear()
+            self.compact()
+
+    def compact(self):
+        """Rewrite the id journal with one line per live row"""
+        with self._lock:
+            tmp_path = self.ids_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                # Oldest templates first, so replay keeps their order
+                for user_id, slots in self._slots_by_user.items():
+                    for slot in slots:
+                        f.write(json.dumps([slot, user_id]) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+                self._journal_offset = f.tell()
+                self._journal_ino = os.fstat(f.fileno()).st_ino
+            os.replace(tmp_path, self.ids_path)
+
+    def move_to(self, path: str):
+        """
+        Move this gallery's files over the gallery at path (e.g. to install a rebuild)
+        
+        The mapping stays valid (renames keep the inode), so the object keeps
+        working and journals to the new location afterwards. Other processes
+        with the gallery at path open load this one on their next refresh().
+        """
+        lock = GalleryLock.for_path(path)
+        with self._lock, lock:
+            self._matrix.flush()
+            marker = path + ".swap"
+            with open(marker, "w", encoding="utf-8") as f:
+                json.dump({"from": self.path}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.ids_path, path + ".ids")
+            os.replace(self.path, path)
+            os.remove(marker)
+            self.path = path
+            self.ids_path = path + ".ids"
+            self._lock = lock
+
+    def close(self):
+        self._flusher.shutdown(wait=True)
+        self._matrix.flush()
+
+def finish_interrupted_move(path: str):
+    """Complete a move_to() onto path that crashed between its renames"""
+    marker = path + ".swap"
+    if not os.path.exists(marker):
+        return
+    with open(marker, "r", encoding="utf-8") as f:
+        source = json.load(f)["from"]
+    if os.path.exists(source + ".ids"):
+        os.replace(source + ".ids", path + ".ids")
+    if os.path.exists(source):
+        os.replace(source, path)
+    os.remove(marker)
+    print(f"🔁 Finished interrupted gallery move from {source} to {path}")
+
+def attach_configured_ann(gallery: MappedGalleryIndex):
+    """Attach the IVF index configured in settings (ANN_*), if enabled"""
+    if ANN_ENABLED:
+        gallery.attach_ann(IVFIndex(
+            gallery,
+            n_lists=ANN_LISTS,
+            nprobe=ANN_NPROBE,
+            min_size=ANN_MIN_SIZE,
+            retrain_growth=ANN_RETRAIN_GROWTH
+        ))
+
+_face_gallery: Optional[MappedGalleryIndex] = None
+
+def get_face_gallery() -> MappedGalleryIndex:
+    """Return the service-wide gallery, mapping GALLERY_PATH on first use"""
+    global _face_gallery
+    if _face_gallery is None:
+        _face_gallery = MappedGalleryIndex(GALLERY_PATH)
+        print(f"🗂️  Face gallery mapped from {GALLERY_PATH}: {len(_face_gallery)} encoding(s)")
+        attach_configured_ann(_face_gallery)
+    else:
+        # Pick up enrollments made by other processes
+        _face_gallery.refresh()
+    return _face_gallery
+
+def install_rebuilt_gallery(new_gallery: MappedGalleryIndex, old_gallery: Optional[MappedGalleryIndex],
+                            keep_users: Iterable[str] = (), path: str = GALLERY_PATH):
+    """
+    Move a rebuilt gallery over the gallery file at path
+    :param new_gallery: Gallery built next to path
+    :param old_gallery: Gallery currently at path, if any
+    :param keep_users: Users whose templates are copied from old_gallery instead
+                       of the rebuilt ones (e.g. registered during the rebuild)
+    """
+    # No other process may change the old gallery until the new one is in place
+    with GalleryLock.for_path(path):
+        if old_gallery is not None:
+            old_gallery.refresh()
+        kept_ids, kept_vectors = [], []
+        for user_id in keep_users:
+            templates = old_gallery.get(user_id) if old_gallery is not None else []
+            new_gallery.remove(user_id)
+            kept_ids.extend([user_id] * len(templates))
+            kept_vectors.extend(templates)
+        if kept_ids:
+            new_gallery.add_many(kept_ids, np.asarray(kept_vectors, dtype=np.float32))
+        
+        new_gallery.move_to(path)
+
+def swap_face_gallery(new_gallery: MappedGalleryIndex, keep_users: Iterable[str] = ()) -> MappedGalleryIndex:
+    """
+    Install a rebuilt gallery as the service-wide gallery
+    
+    Must run on the event loop thread without awaiting in between, so no
+    request can modify the old gallery while it is being replaced. Requests
+    that already hold the old gallery keep reading it until they finish.
+    :param new_gallery: Gallery built next to GALLERY_PATH
+    :param keep_users: See install_rebuilt_gallery
+    :return: The new service-wide gallery
+    """
+    global _face_gallery
+    old_gallery = get_face_gallery()
+    install_rebuilt_gallery(new_gallery, old_gallery, keep_users)
+    _face_gallery = new_gallery
+    old_gallery.close()
+    print(f"🔄 Face gallery swapped: {len(new_gallery)} encoding(s) for {new_gallery.n_users} user(s)")
+    return new_gallery
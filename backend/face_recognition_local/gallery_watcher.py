@@ -0,0 +1,608 @@
+"""
+Live gallery updates from the legacy image folders and the FaceData table.
+
+Images dropped into FACE_IMAGES_DIR/<user_id>/ by other tools (e.g. the HR
+sync) and rows added to FaceData used to reach the gallery only through a
+full rebuild. The watcher notices which users changed and, once a user has
+been quiet for GALLERY_WATCH_DEBOUNCE seconds, recomputes just their
+templates, the same way a rebuild would:
+
+- changed folders are found with inotify (Linux, through libc, no extra
+  dependency) or, where that is unavailable, by polling the modification
+  time of each user folder every GALLERY_WATCH_POLL_INTERVAL seconds
+- FaceData is polled (SQLite has no change notifications): every interval
+  one aggregate query (row count, highest id, total encoding bytes) tells
+  whether the table changed. Only then are the rows listed, without their
+  encodings, and only new rows and rows whose user or size changed are read
+  and checksummed (CRC32). Every FULL_CHECK_POLLS polls all rows are
+  checksummed, which also catches an encoding rewritten in place with the
+  same size. Rows are matched to the gallery user with the same id as a
+  string
+- a changed user's folder images are hashed and only images without an
+  encoding in the rebuild manifest are encoded, in the background pool
+- the watcher only manages the templates it derives itself (folder images
+  and FaceData rows), remembered by a hash of their values: templates it
+  added earlier whose source is gone are removed and new ones are added
+  (capped at MAX_TEMPLATES_PER_USER), in one step under the gallery lock.
+  Templates from API registrations, bulk imports or BULK_IMPORT_FILE are
+  left alone, and a user is only removed once none of their templates
+  remain
+
+Only files directly inside a user folder are watched. Changes made while
+the service is down are picked up on the next start from the snapshot saved
+in REBUILD_DIR/watch_state.json.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import json
+import os
+import struct
+import time
+import zlib
+from datetime import timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from config.database import SessionLocal, FaceData
+from config.settings import (
+    GALLERY_WATCH_MODE, GALLERY_WATCH_POLL_INTERVAL, GALLERY_WATCH_DEBOUNCE, MAX_TEMPLATES_PER_USER,
+    REBUILD_CHUNK_SIZE, REBUILD_DIR, BACKGROUND_MAX_IN_FLIGHT
+)
+from face_recognition_local.bulk_import import SKIP_DIRS
+from face_recognition_local.encoding_store import decode_stored_encoding
+from face_recognition_local.executor import bounded_map, get_background_executor
+from face_recognition_local.gallery_rebuild import (
+    NO_FACE, FileHashCache, SourceImage, dated_templates, encode_rebuild_chunk, hash_sources,
+    legacy_sources, manifest_lock, shared_encoding_manifest
+)
+from face_recognition_local.gallery_store import MappedGalleryIndex, get_face_gallery
+from face_recognition_local.image_store import ImageStore
+
+WATCH_MODES = ("auto", "inotify", "poll")
+
+# Attempts a user with unreadable images is deferred before they are applied without them
+MAX_RETRIES = 3
+
+# FaceData polls between checksums of every row (see _poll_face_data)
+FULL_CHECK_POLLS = 30
+
+# Rows whose encodings are read per query
+FACE_DATA_CHUNK_SIZE = 500
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+ROOT_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+USER_MASK = IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_ONLYDIR
+
+EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+class Inotify:
+    """Minimal inotify binding through libc (Linux only)"""
+
+    def __init__(self):
+        """
+        :raises OSError: If inotify is not available
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            init = libc.inotify_init1
+        except AttributeError:
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """
+        :return: Watch descriptor reported with the events of path
+        :raises OSError: E.g. ENOSPC when fs.inotify.max_user_watches is reached
+        """
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read_events(self) -> List[Tuple[int, int, str]]:
+        """Events queued so far as (wd, mask, name), without blocking"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset + EVENT.size <= len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+                events.append((wd, mask, os.fsdecode(name)))
+                offset += EVENT.size + length
+
+    def close(self):
+        os.close(self.fd)
+
+def folder_snapshot(root: str) -> Dict[str, int]:
+    """Modification time (ns) of every user folder under root"""
+    snapshot = {}
+    try:
+        scanner = os.scandir(root)
+    except FileNotFoundError:
+        return snapshot
+    with scanner:
+        for entry in scanner:
+            if entry.name in SKIP_DIRS:
+                continue
+            try:
+                if entry.is_dir():
+                    snapshot[entry.name] = entry.stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+    return snapshot
+
+def changed_keys(old: dict, new: dict) -> Set:
+    """Keys added, removed or with a different value"""
+    return {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+
+def template_key(encoding: np.ndarray) -> str:
+    """Hash of a template's values as stored in the gallery (float32)"""
+    return hashlib.sha1(np.ascontiguousarray(encoding, dtype=np.float32).tobytes()).hexdigest()
+
+class GalleryWatcher:
+    """Applies changes of user folders and FaceData rows to the live gallery"""
+
+    def __init__(self, store: ImageStore, mode: str = "auto", poll_interval: float = 10.0, debounce: float = 2.0,
+                 state_path: Optional[str] = None):
+        """
+        :param store: Image store whose legacy folders are watched
+        :param mode: "inotify", "poll" or "auto" (inotify if available)
+        :param poll_interval: Seconds between polls of the folders (poll mode) and of FaceData
+        :param debounce: Seconds a user must be quiet before their changes are applied
+        :param state_path: Snapshot file used to catch up on changes made while stopped
+        """
+        if mode not in WATCH_MODES:
+            raise ValueError(f"Unknown watch mode '{mode}', expected one of: {', '.join(WATCH_MODES)}")
+        self.store = store
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.state_path = state_path or os.path.join(REBUILD_DIR, "watch_state.json")
+
+        self.active_mode: Optional[str] = None
+        self.events = 0
+        self.cycles = 0
+        self.applied_users = 0
+        self.removed_users = 0
+        self.encoded_images = 0
+        self.last_error: Optional[str] = None
+
+        self._dirty: Dict[str, float] = {}  # user_id -> time of the last change seen
+        self._retries: Dict[str, int] = {}  # user_id -> attempts deferred by unreadable images
+        self._applied: Dict[str, float] = {}  # user_id -> time their templates were last replaced
+        self._dir_mtimes: Dict[str, int] = {}
+        self._face_rows: Dict[int, Tuple[str, int]] = {}  # FaceData id -> (user_id, CRC32 of the encoding)
+        self._face_sizes: Dict[int, int] = {}  # FaceData id -> bytes of the encoding
+        self._face_signature: Optional[tuple] = None  # (rows, highest id, total bytes) at the last poll
+        self._polls_since_full_check = 0
+        self._owned: Dict[str, Set[str]] = {}  # user_id -> template_key of the templates the watcher added
+        self._database_error: Optional[str] = None
+        self._file_hashes = FileHashCache(os.path.join(REBUILD_DIR, "files.jsonl"))
+        self._inotify: Optional[Inotify] = None
+        self._watches: Dict[int, Optional[str]] = {}  # wd -> user_id (None = root)
+        self._poll_now = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start watching (on the running event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop watching and save the snapshot for the next start"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._close_inotify()
+        await asyncio.to_thread(self._save_state)
+
+    def mark_dirty(self, user_id: str, folder_changed: bool = False):
+        """
+        Schedule a user's templates to be recomputed
+        :param folder_changed: Also drop the user's listing index
+        """
+        if user_id in SKIP_DIRS:
+            return
+        self._dirty[user_id] = time.monotonic()
+        if folder_changed:
+            self.store.invalidate(user_id)
+
+    def users_applied_since(self, timestamp: float) -> List[str]:
+        """Users whose templates the watcher replaced at or after timestamp"""
+        return [user_id for user_id, applied in self._applied.items() if applied >= timestamp]
+
+    # ------------------------------------------------------------------
+    # Change detection
+    # ------------------------------------------------------------------
+
+    def _load_state(self) -> Set[str]:
+        """Take the initial snapshots; return users changed since the saved ones"""
+        self._dir_mtimes = folder_snapshot(self.store.root)
+        self._poll_face_data()
+        if not os.path.exists(self.state_path):
+            return set()
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        changed = changed_keys(state.get("folders", {}), self._dir_mtimes)
+        # Rows saved without a checksum compare as changed
+        saved_rows = {row[0]: (row[1], row[2] if len(row) > 2 else None) for row in state.get("face_rows", [])}
+        changed.update(self._row_users(saved_rows, self._face_rows))
+        changed.update(state.get("pending", []))
+        self._owned = {user_id: set(keys) for user_id, keys in state.get("templates", {}).items()}
+        return changed
+
+    def _save_state(self):
+        state = {
+            "folders": self._dir_mtimes,
+            "face_rows": [[row_id, user_id, crc] for row_id, (user_id, crc) in self._face_rows.items()],
+            "templates": {user_id: sorted(keys) for user_id, keys in self._owned.items()},
+            "pending": sorted(self._dirty)
+        }
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _poll_folders(self) -> Set[str]:
+        """Users whose folder appeared, disappeared or changed since the last poll"""
+        snapshot = folder_snapshot(self.store.root)
+        changed = changed_keys(self._dir_mtimes, snapshot)
+        self._dir_mtimes = snapshot
+        return changed
+
+    def _poll_face_data(self) -> Set[str]:
+        """
+        Users with FaceData rows added, deleted or edited since the last poll
+        
+        Usually a single aggregate query; encodings are only read for rows
+        that are new or changed user or size, and for every row once every
+        FULL_CHECK_POLLS polls.
+        """
+        full_check = self._polls_since_full_check >= FULL_CHECK_POLLS
+        try:
+            with SessionLocal() as db:
+                signature = tuple(db.query(
+                    func.count(FaceData.id), func.max(FaceData.id), func.sum(func.length(FaceData.face_encoding))
+                ).one())
+                if signature == self._face_signature and not full_check:
+                    self._polls_since_full_check += 1
+                    return set()
+                
+                rows, sizes, users, unchecked = {}, {}, {}, []
+                listing = db.query(FaceData.id, FaceData.user_id, func.length(FaceData.face_encoding)).yield_per(1000)
+                for row_id, user_id, size in listing:
+                    users[row_id], sizes[row_id] = str(user_id), size or 0
+                    previous = self._face_rows.get(row_id)
+                    if (
+                        full_check or previous is None or previous[0] != users[row_id]
+                        or self._face_sizes.get(row_id) != sizes[row_id]
+                    ):
+                        unchecked.append(row_id)
+                    else:
+                        rows[row_id] = previous
+                
+                for start in range(0, len(unchecked), FACE_DATA_CHUNK_SIZE):
+                    chunk = unchecked[start:start + FACE_DATA_CHUNK_SIZE]
+                    for row_id, face_encoding in db.query(FaceData.id, FaceData.face_encoding).filter(FaceData.id.in_(chunk)):
+                        rows[row_id] = (users[row_id], zlib.crc32(face_encoding or b""))
+        except SQLAlchemyError as e:
+            error = str(e).splitlines()[0]
+            if error != self._database_error:
+                print(f"⚠️  Gallery watcher cannot read FaceData: {error}")
+            self._database_error = error
+            return set()
+        self._database_error = None
+        self._polls_since_full_check = 0 if full_check else self._polls_since_full_check + 1
+        changed = self._row_users(self._face_rows, rows)
+        self._face_rows, self._face_sizes, self._face_signature = rows, sizes, signature
+        return changed
+
+    @staticmethod
+    def _row_users(old: Dict[int, tuple], new: Dict[int, tuple]) -> Set[str]:
+        """Users owning a FaceData row that differs (before or after a change of its user_id)"""
+        changed = set()
+        for row_id in changed_keys(old, new):
+            for rows in (old, new):
+                if row_id in rows:
+                    changed.add(rows[row_id][0])
+        return changed
+
+    def _start_inotify(self) -> bool:
+        """Watch the store root and every user folder; False if inotify cannot be used"""
+        try:
+            self._inotify = Inotify()
+            self._watches[self._inotify.add_watch(self.store.root, ROOT_MASK)] = None
+            for user_id in list(self._dir_mtimes):
+                self._watch_user(user_id)
+        except OSError as e:
+            print(f"⚠️  inotify unavailable ({e}), polling image folders every {self.poll_interval:g}s")
+            self._close_inotify()
+            return False
+        asyncio.get_running_loop().add_reader(self._inotify.fd, self._on_inotify_events)
+        return True
+
+    def _watch_user(self, user_id: str):
+        try:
+            self._watches[self._inotify.add_watch(self.store.user_dir(user_id), USER_MASK)] = user_id
+        except FileNotFoundError:
+            # Removed since it was listed; the root watch reports that
+            pass
+
+    def _watch_new_user(self, user_id: str) -> bool:
+        """Watch a folder created while running; on failure switch to polling (False)"""
+        try:
+            self._watch_user(user_id)
+            return True
+        except OSError as e:
+            print(f"⚠️  Cannot watch {self.store.user_dir(user_id)} ({e}), polling image folders from now on")
+            self.last_error = f"inotify: {e}"
+            self._close_inotify()
+            self.active_mode = "poll"
+            self._poll_now = True
+            return False
+
+    def _close_inotify(self):
+        if self._inotify is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+        except RuntimeError:
+            pass
+        self._inotify.close()
+        self._inotify = None
+        self._watches = {}
+
+    def _on_inotify_events(self):
+        for wd, mask, name in self._inotify.read_events():
+            self.events += 1
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: find the changes by comparing folder times
+                self._poll_now = True
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if wd not in self._watches:
+                continue
+            user_id = self._watches[wd]
+            if user_id is None:
+                # Event in the root: a user folder was added or removed
+                if not mask & IN_ISDIR or name in SKIP_DIRS:
+                    continue
+                user_id = name
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self._watch_new_user(user_id):
+                    return
+            try:
+                self._dir_mtimes[user_id] = os.stat(self.store.user_dir(user_id)).st_mtime_ns
+            except FileNotFoundError:
+                self._dir_mtimes.pop(user_id, None)
+            self.mark_dirty(user_id, folder_changed=True)
+
+    # ------------------------------------------------------------------
+    # Applying changes
+    # ------------------------------------------------------------------
+
+    async def _run(self):
+        for user_id in await asyncio.to_thread(self._load_state):
+            self.mark_dirty(user_id, folder_changed=True)
+
+        if self.mode != "poll" and self._start_inotify():
+            self.active_mode = "inotify"
+        else:
+            self.active_mode = "poll"
+        print(f"👀 Gallery watcher started ({self.active_mode}) on {self.store.root}")
+
+        tick = max(0.2, min(self.debounce, self.poll_interval))
+        last_poll = time.monotonic()
+        while True:
+            await asyncio.sleep(tick)
+            try:
+                if time.monotonic() - last_poll >= self.poll_interval or self._poll_now:
+                    last_poll = time.monotonic()
+                    if self.active_mode == "poll" or self._poll_now:
+                        self._poll_now = False
+                        for user_id in await asyncio.to_thread(self._poll_folders):
+                            self.mark_dirty(user_id, folder_changed=True)
+                    for user_id in await asyncio.to_thread(self._poll_face_data):
+                        self.mark_dirty(user_id)
+
+                quiet_since = time.monotonic() - self.debounce
+                ready = [user_id for user_id, changed in self._dirty.items() if changed <= quiet_since]
+                if ready:
+                    await self._apply(ready)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Gallery watcher error: {e}")
+
+    async def _apply(self, user_ids: List[str]):
+        """Recompute the templates of users and replace them in the live gallery"""
+        # A rebuild is using the manifest; its result includes these changes
+        # or they are applied on a later tick
+        if not manifest_lock.acquire(blocking=False):
+            return
+        start = time.perf_counter()
+        for user_id in user_ids:
+            self._dirty.pop(user_id, None)
+        try:
+            images, jobs, face_rows = await asyncio.to_thread(self._collect, user_ids)
+            chunks = [jobs[i:i + REBUILD_CHUNK_SIZE] for i in range(0, len(jobs), REBUILD_CHUNK_SIZE)]
+            # Background pool, a few chunks at a time, so live requests are not queued behind them
+            results = await asyncio.to_thread(
+                list, bounded_map(get_background_executor(), encode_rebuild_chunk, chunks, BACKGROUND_MAX_IN_FLIGHT)
+            )
+            templates, retry = await asyncio.to_thread(self._templates, user_ids, images, face_rows, results)
+        except Exception:
+            for user_id in user_ids:
+                self._dirty.setdefault(user_id, time.monotonic())
+            raise
+        finally:
+            manifest_lock.release()
+
+        # An image could not be read yet (e.g. still being copied in): try
+        # again later, giving up on unreadable images after MAX_RETRIES attempts
+        for user_id in retry:
+            self._retries[user_id] = self._retries.get(user_id, 0) + 1
+            if self._retries[user_id] <= MAX_RETRIES and user_id in templates:
+                del templates[user_id]
+                self._dirty.setdefault(user_id, time.monotonic())
+
+        # No await from here on: readers see the old or the new templates
+        gallery = get_face_gallery()
+        with gallery.locked():
+            for user_id, user_templates in templates.items():
+                self._replace_owned(gallery, user_id, user_templates)
+                self._applied[user_id] = time.time()
+                self._retries.pop(user_id, None)
+        self.applied_users += len(templates)
+        self.encoded_images += len(jobs)
+        self.cycles += 1
+
+        await asyncio.to_thread(self._save_state)
+        print(f"🔄 Gallery watcher updated {len(templates)} user(s), encoded {len(jobs)} image(s) "
+              f"in {time.perf_counter() - start:.2f}s")
+
+    def _replace_owned(self, gallery: MappedGalleryIndex, user_id: str, encodings: List[np.ndarray]):
+        """
+        Swap the templates the watcher added for a user for new ones, keeping all others
+        
+        A template with the same values as a new one (e.g. added by a
+        rebuild from the same image) is kept and taken over, not added twice.
+        """
+        new_keys = [template_key(encoding) for encoding in encodings]
+        owned = self._owned.get(user_id, set())
+        current_keys = [template_key(encoding) for encoding in gallery.get(user_id)]
+        stale = [
+            slot for slot, key in zip(gallery.slots_of(user_id), current_keys)
+            if key in owned and key not in new_keys
+        ]
+        missing = [encoding for encoding, key in zip(encodings, new_keys) if key not in current_keys]
+
+        had_user = user_id in gallery
+        if stale:
+            gallery.remove_slots(stale)
+        if missing:
+            gallery.add_templates([user_id] * len(missing), np.asarray(missing, dtype=np.float32), MAX_TEMPLATES_PER_USER)
+        if new_keys:
+            self._owned[user_id] = set(new_keys)
+        else:
+            self._owned.pop(user_id, None)
+        if had_user and user_id not in gallery:
+            self.removed_users += 1
+
+    def _collect(self, user_ids: List[str]) -> Tuple[List[SourceImage], list, Dict[str, List[Tuple[float, np.ndarray]]]]:
+        """Hash the users' folder images, list those to encode and read their FaceData rows (blocking)"""
+        images = []
+        for user_id in user_ids:
+            images.extend(legacy_sources(self.store, user_id))
+        images, _ = hash_sources(images, self._file_hashes)
+
+        manifest = shared_encoding_manifest()
+        jobs, queued = [], set()
+        for image in images:
+            if image.digest not in manifest and image.digest not in queued:
+                queued.add(image.digest)
+                jobs.append((image.digest, image.path, image.kind, image.padding))
+
+        face_rows: Dict[str, List[Tuple[float, np.ndarray]]] = {}
+        numeric_ids = [int(user_id) for user_id in user_ids if user_id.isdigit()]
+        if numeric_ids and self._database_error is None:
+            with SessionLocal() as db:
+                rows = db.query(FaceData.user_id, FaceData.face_encoding, FaceData.created_at).filter(
+                    FaceData.user_id.in_(numeric_ids)
+                )
+                for user_id, face_encoding, created_at in rows:
+                    try:
+                        encoding = decode_stored_encoding(face_encoding)
+                    except Exception as e:
+                        self.last_error = f"FaceData of user {user_id}: {e}"
+                        continue
+                    created = created_at.replace(tzinfo=timezone.utc).timestamp() if created_at else 0.0
+                    face_rows.setdefault(str(user_id), []).append((created, encoding))
+        return images, jobs, face_rows
+
+    def _templates(self, user_ids: List[str], images: List[SourceImage], face_rows: dict,
+                   results: List[list]) -> Tuple[Dict[str, List[np.ndarray]], Set[str]]:
+        """
+        Record new encodings and pick each user's newest templates (blocking)
+        :return: Tuple of (templates per user, oldest first; users with unreadable images)
+        """
+        manifest = shared_encoding_manifest()
+        failed = set()
+        for chunk in results:
+            manifest.append([
+                (digest, encoding) for digest, encoding, error in chunk if error is None or error == NO_FACE
+            ])
+            failed.update(digest for digest, _, error in chunk if error is not None and error != NO_FACE)
+
+        by_user: Dict[str, List[SourceImage]] = {user_id: [] for user_id in user_ids}
+        for image in images:
+            by_user[image.user_id].append(image)
+
+        templates, retry = {}, set()
+        for user_id, user_images in by_user.items():
+            if any(image.digest in failed for image in user_images):
+                retry.add(user_id)
+            dated = dated_templates(user_images, manifest) + face_rows.get(user_id, [])
+            dated.sort(key=lambda template: template[0])
+            user_templates = [encoding for _, encoding in dated]
+            if MAX_TEMPLATES_PER_USER > 0:
+                user_templates = user_templates[-MAX_TEMPLATES_PER_USER:]
+            templates[user_id] = user_templates
+        return templates, retry
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.active_mode,
+            "watched_folders": len(self._watches) if self._inotify is not None else len(self._dir_mtimes),
+            "face_data_rows": len(self._face_rows),
+            "managed_users": len(self._owned),
+            "pending_users": len(self._dirty),
+            "events": self.events,
+            "cycles": self.cycles,
+            "applied_users": self.applied_users,
+            "removed_users": self.removed_users,
+            "encoded_images": self.encoded_images,
+            "database_error": self._database_error,
+            "last_error": self.last_error
+        }
+
+def create_gallery_watcher(store: ImageStore) -> GalleryWatcher:
+    """GalleryWatcher configured from settings (GALLERY_WATCH_*)"""
+    return GalleryWatcher(store, GALLERY_WATCH_MODE, GALLERY_WATCH_POLL_INTERVAL, GALLERY_WATCH_DEBOUNCE)
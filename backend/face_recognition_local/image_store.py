@@ -0,0 +1,388 @@
+"""
+Content-addressed store for saved face images.
+
+Every image is stored once, under the SHA-256 of its bytes, in fan-out
+directories named after the first hash characters, so no directory grows
+beyond a few thousand entries even with millions of images:
+
+    <root>/blobs/ab/cd/abcd...ef.jpg        image bytes
+    <root>/manifests/<user_id>.jsonl        one JSON line per image of the user
+
+A user's manifest references the blobs it owns; the same blob can belong to
+several users. Saving an image the user already has (e.g. a retried upload)
+changes nothing, and saving bytes that are already stored for someone else
+only adds a manifest line. Files are written by the background image writer.
+
+Entries have a kind: "original" (the upload) or "chip" (an aligned face
+chip saved at registration, see face_engine.extract_face_chip), which also
+records the landmarks, face box and padding needed to re-encode it.
+
+Per-user folders (<root>/<user_id>/) from before this store are still read
+by the API, and remain the layout for images dropped in by other tools.
+
+For listings, each user has an in-memory UserImageIndex: the manifest plus
+the legacy folder, sorted newest first, with the API fields formatted once.
+It is built on first use and updated by put(), so listing a page is a
+bisect and a slice rather than a directory scan.
+
+put() records an image before the writer has stored it; if its blob or
+manifest line cannot be written, the entry is taken back out. Several
+processes may append to the same manifest, so a cached manifest is checked
+against the file (inode and size) whenever it is used, and lines appended
+since are read and merged.
+"""
+
+import bisect
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from face_recognition_local.image_writer import image_writer
+
+BLOBS_DIR = "blobs"
+MANIFESTS_DIR = "manifests"
+
+# Hash characters used for each fan-out directory level
+FANOUT_LEVELS = (2, 2)
+
+def image_extension(data: bytes) -> str:
+    """File extension for the image format of data"""
+    if data[:2] == b"\xff\xd8":
+        return ".jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    if data[:2] == b"BM":
+        return ".bmp"
+    return ".img"
+
+LEGACY_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+class UserImageIndex:
+    """A user's images sorted newest first, for paginated listings"""
+
+    def __init__(self):
+        self._keys: List[Tuple[float, str]] = []  # (-created, filename), ascending
+        self._items: List[dict] = []
+        self.last_modified = 0.0
+        self.version = 0
+
+    def add(self, created: float, item: dict):
+        """
+        :param created: Creation time (epoch seconds) the listing is sorted by
+        :param item: Entry returned by the API
+        """
+        key = (-created, item["filename"])
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return
+        self._keys.insert(position, key)
+        self._items.insert(position, item)
+        self.last_modified = max(self.last_modified, created)
+        self.version += 1
+
+    def remove(self, created: float, filename: str):
+        """Drop an item added with add() (e.g. when its files could not be written)"""
+        key = (-created, filename)
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            del self._keys[position]
+            del self._items[position]
+            self.version += 1
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def page(self, after: Optional[Tuple[float, str]] = None, limit: int = 50,
+             since: Optional[float] = None, until: Optional[float] = None) -> Tuple[List[dict], int, Optional[Tuple[float, str]]]:
+        """
+        One page of the listing
+        :param after: (created, filename) of the last item of the previous page
+        :param limit: Items per page
+        :param since: Only images created at or after this time
+        :param until: Only images created before this time
+        :return: Tuple of (items, total matching the filters, cursor of the next page or None)
+        """
+        # Newest first, so "until" bounds the start and "since" the end
+        start = bisect.bisect_right(self._keys, (-until, "\uffff")) if until is not None else 0
+        end = bisect.bisect_right(self._keys, (-since, "\uffff")) if since is not None else len(self._keys)
+        total = max(0, end - start)
+
+        if after is not None:
+            start = max(start, bisect.bisect_right(self._keys, (-after[0], after[1])))
+        stop = min(end, start + limit)
+        items = self._items[start:stop]
+
+        cursor = None
+        if stop < end and items:
+            created, filename = self._keys[stop - 1]
+            cursor = (-created, filename)
+        return items, total, cursor
+
+class ImageStore:
+    """Deduplicating image store with per-user manifests"""
+
+    def __init__(self, root: str):
+        """
+        :param root: Store directory (FACE_IMAGES_DIR)
+        """
+        self.root = root
+        self.blobs_dir = os.path.join(root, BLOBS_DIR)
+        self.manifests_dir = os.path.join(root, MANIFESTS_DIR)
+        self._manifests: Dict[str, Dict[str, dict]] = {}  # user_id -> sha256 -> entry
+        self._manifest_read: Dict[str, Tuple[Optional[int], int]] = {}  # user_id -> (inode, bytes read) of the manifest
+        self._indexes: Dict[str, UserImageIndex] = {}
+        self._last_put: Dict[str, float] = {}  # user_id -> time of their last new image
+        self._lock = threading.Lock()
+        self.saved = 0
+        self.duplicates = 0
+
+    def blob_path(self, digest: str, extension: str = ".jpg") -> str:
+        parts, start = [], 0
+        for width in FANOUT_LEVELS:
+            parts.append(digest[start:start + width])
+            start += width
+        return os.path.join(self.blobs_dir, *parts, digest + extension)
+
+    def manifest_path(self, user_id: str) -> str:
+        return os.path.join(self.manifests_dir, quote(user_id, safe="") + ".jsonl")
+
+    def _load_manifest(self, user_id: str) -> Dict[str, dict]:
+        """A user's manifest entries, merging lines other processes appended since the last call (lock held)"""
+        path = self.manifest_path(user_id)
+        try:
+            stat = os.stat(path)
+            inode, size = stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            inode, size = None, 0
+
+        entries = self._manifests.get(user_id)
+        read_inode, offset = self._manifest_read.get(user_id, (None, 0))
+        if entries is not None and (inode, size) == (read_inode, offset):
+            return entries
+        if entries is None or (read_inode is not None and (inode != read_inode or size < offset)):
+            # First use, or the manifest was rewritten: read it all
+            if entries is not None:
+                self._indexes.pop(user_id, None)
+            entries, offset = {}, 0
+        index = self._indexes.get(user_id)
+
+        if size > offset:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+            # A line still being appended is read next time
+            data = data[:data.rfind(b"\n") + 1]
+            offset += len(data)
+            for line in data.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn line from a crash during an append
+                    continue
+                if entry["sha256"] not in entries:
+                    entries[entry["sha256"]] = entry
+                    if index is not None:
+                        index.add(entry["created"], self._store_item(entry))
+        self._manifests[user_id] = entries
+        self._manifest_read[user_id] = (inode, offset)
+        return entries
+
+    def _forget(self, user_id: str, entry: dict):
+        """Take back an entry of put() whose blob or manifest line could not be written"""
+        with self._lock:
+            entries = self._manifests.get(user_id)
+            if entries is None or entries.get(entry["sha256"]) is not entry:
+                return
+            del entries[entry["sha256"]]
+            self.saved -= 1
+            index = self._indexes.get(user_id)
+            if index is not None:
+                index.remove(entry["created"], entry["filename"])
+        print(f"❌ Face image {entry['filename']} of user '{user_id}' was not saved")
+
+    async def put(self, user_id: str, image_data: bytes, kind: str = "original", **metadata) -> dict:
+        """
+        Store an image for a user (no-op if the user already has these bytes)
+        :param user_id: Owner of the image
+        :param image_data: Encoded image
+        :param kind: "original" or "chip"
+        :param metadata: Extra JSON-serializable fields for the manifest entry
+        :return: Manifest entry of the image
+        """
+        digest = hashlib.sha256(image_data).hexdigest()
+        extension = image_extension(image_data)
+
+        with self._lock:
+            entries = self._load_manifest(user_id)
+            entry = entries.get(digest)
+            if entry is not None:
+                self.duplicates += 1
+                return entry
+
+            blob_path = self.blob_path(digest, extension)
+            entry = {
+                "sha256": digest,
+                "filename": digest + extension,
+                "blob": os.path.relpath(blob_path, self.root),
+                "size": len(image_data),
+                "created": time.time(),
+                "kind": kind,
+                **metadata
+            }
+            entries[digest] = entry
+            self.saved += 1
+            self._last_put[user_id] = entry["created"]
+
+            index = self._indexes.get(user_id)
+            if index is not None:
+                index.add(entry["created"], self._store_item(entry))
+
+        # Blob first: the manifest line is only written once the blob is durable
+        forget = functools.partial(self._forget, user_id, entry)
+        blob_job = await image_writer.write(blob_path, image_data, mode="create", on_failure=forget)
+        await image_writer.write(
+            self.manifest_path(user_id), (json.dumps(entry) + "\n").encode(), mode="append", on_failure=forget, after=blob_job
+        )
+        return entry
+
+    def entries(self, user_id: str, kind: Optional[str] = None) -> List[dict]:
+        """Manifest entries of a user, oldest first (optionally only one kind)"""
+        with self._lock:
+            entries = list(self._load_manifest(user_id).values())
+        if kind is not None:
+            entries = [entry for entry in entries if entry.get("kind", "original") == kind]
+        return entries
+
+    def manifest_user_ids(self) -> List[str]:
+        """Users that have a manifest (reads the manifests directory)"""
+        try:
+            names = os.listdir(self.manifests_dir)
+        except FileNotFoundError:
+            names = []
+        user_ids = {unquote(name[:-len(".jsonl")]) for name in names if name.endswith(".jsonl")}
+        with self._lock:
+            user_ids.update(self._manifests)
+        return sorted(user_ids)
+
+    def users_changed_since(self, timestamp: float) -> List[str]:
+        """Users who got a new image through this store at or after timestamp"""
+        with self._lock:
+            return [user_id for user_id, last_put in self._last_put.items() if last_put >= timestamp]
+
+    def path_of(self, entry: dict) -> str:
+        return os.path.join(self.root, entry["blob"])
+
+    def user_dir(self, user_id: str) -> str:
+        """Legacy per-user folder"""
+        return os.path.join(self.root, user_id)
+
+    def _store_item(self, entry: dict) -> dict:
+        created_time = datetime.fromtimestamp(entry["created"]).isoformat()
+        return {
+            "filename": entry["filename"],
+            "file_path": self.path_of(entry),
+            "file_size": entry["size"],
+            "kind": entry.get("kind", "original"),
+            "created_time": created_time,
+            "modified_time": created_time
+        }
+
+    def _scan_legacy(self, user_id: str) -> List[Tuple[float, dict]]:
+        user_dir = self.user_dir(user_id)
+        items = []
+        try:
+            scanner = os.scandir(user_dir)
+        except (FileNotFoundError, NotADirectoryError):
+            return items
+        with scanner:
+            for dir_entry in scanner:
+                if not dir_entry.name.lower().endswith(LEGACY_EXTENSIONS) or not dir_entry.is_file():
+                    continue
+                file_stat = dir_entry.stat()
+                items.append((file_stat.st_ctime, {
+                    "filename": dir_entry.name,
+                    "file_path": os.path.join(user_dir, dir_entry.name),
+                    "file_size": file_stat.st_size,
+                    "kind": "original",
+                    "created_time": datetime.fromtimestamp(file_stat.st_ctime).isoformat(),
+                    "modified_time": datetime.fromtimestamp(file_stat.st_mtime).isoformat()
+                }))
+        return items
+
+    def image_index(self, user_id: str) -> UserImageIndex:
+        """
+        Listing index of a user, built on first use (blocking: scans the legacy folder)
+        :param user_id: User to list
+        """
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                # Add images other processes appended to the manifest (drops the index if it was rewritten)
+                self._load_manifest(user_id)
+                index = self._indexes.get(user_id)
+        if index is not None:
+            return index
+
+        # Scan outside the lock; manifest entries are added under it, so an
+        # image saved meanwhile is not missed
+        legacy = self._scan_legacy(user_id)
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = UserImageIndex()
+                for created, item in legacy:
+                    index.add(created, item)
+                for entry in self._load_manifest(user_id).values():
+                    index.add(entry["created"], self._store_item(entry))
+                self._indexes[user_id] = index
+        return index
+
+    def invalidate(self, user_id: str):
+        """Drop a user's listing index, e.g. after files changed in the legacy folder"""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root,
+            "saved": self.saved,
+            "duplicates": self.duplicates,
+            "users_loaded": len(self._manifests),
+            "users_indexed": len(self._indexes)
+        }
+
+async def save_registration_images(store: ImageStore, user_id: str, image_data: bytes,
+                                   face_chip: Optional[dict] = None, keep_original: bool = True) -> dict:
+    """
+    Store the images of a registration: the upload and/or its face chip
+    :param face_chip: Result of face_engine.encode_face_with_chip, if chips are enabled
+    :param keep_original: Store the upload as well when there is a chip
+    :return: Manifest entry of the upload, or of the chip when the upload is dropped
+    """
+    if face_chip is None:
+        return await store.put(user_id, image_data)
+
+    original = await store.put(user_id, image_data) if keep_original else None
+    chip = await store.put(
+        user_id, face_chip["chip"], kind="chip",
+        landmarks=[[round(x, 1), round(y, 1)] for x, y in face_chip["landmarks"]],
+        box=list(face_chip["box"]),
+        padding=face_chip["chip_padding"],
+        source=hashlib.sha256(image_data).hexdigest()
+    )
+    return original if original is not None else chip
+
+_stores: Dict[str, ImageStore] = {}
+
+def get_image_store(root: str) -> ImageStore:
+    """Shared ImageStore for a store directory"""
+    store = _stores.get(root)
+    if store is None:
+        store = _stores[root] = ImageStore(root)
+    return store
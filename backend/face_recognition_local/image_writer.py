@@ -0,0 +1,403 @@
+"""
+Write-behind queue for face images saved by the API.
+
+Registration used to create the user directory and write the image file
+inside the request, which stalls the event loop on a slow (e.g. NFS)
+volume. Images are now handed to a bounded queue and written by a background
+thread, which takes whatever has queued up (up to batch_size), writes
+every file to a temporary name, fsyncs them together, renames them into
+place and fsyncs each touched directory once. A file therefore only
+appears under its final name once it is durable.
+
+Besides replacing a file, an image can be written only if it does not
+exist yet ("create", used for content-addressed blobs, where an existing
+file already holds the same bytes) or appended ("append", used for
+manifests). Every replace or create goes through its own temporary name,
+so two jobs for the same path never share one. Within a batch, every
+created or replaced file is renamed into place and its directory fsynced
+before any append is written, and an append can name the job it depends
+on (after=), so e.g. a manifest line is only written once its image is
+durable. Failed writes are retried a few times; an append remembers where
+it started, so a retry of an append that did reach the file does not write
+the line twice, and an append after a torn line starts on a new line. A
+job that still fails, or whose dependency failed, calls its on_failure
+callback so the caller can undo what it recorded.
+
+When the queue is full, write() writes the image in a worker thread and
+the request waits for it, so a slow disk slows requests down instead of
+growing memory without bound or stalling the event loop.
+"""
+
+import asyncio
+import itertools
+import os
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from face_recognition_local.metrics import register_gauge
+from config.settings import IMAGE_WRITE_QUEUE_SIZE, IMAGE_WRITE_BATCH_SIZE, IMAGE_WRITE_BATCH_WAIT_MS, IMAGE_WRITE_RETRIES
+
+_STOP = object()
+
+WRITE_MODES = ("replace", "create", "append")
+
+_temp_ids = itertools.count()
+
+def _temp_path(path: str) -> str:
+    """Temporary name for one write of path, unique within the process and across processes"""
+    return f"{path}.{os.getpid()}.{next(_temp_ids)}.tmp"
+
+def _open_for_append(path: str):
+    """
+    Open a file for appending, starting a new line if the file ends with a torn one
+    :return: Tuple of (file, offset the appended data starts at)
+    """
+    f = open(path, "a+b")
+    try:
+        end = f.seek(0, os.SEEK_END)
+        if end:
+            f.seek(end - 1)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+                end += 1
+    except OSError:
+        f.close()
+        raise
+    return f, end
+
+def _already_appended(path: str, offset: int, data: bytes) -> bool:
+    """True if an earlier attempt already wrote data at offset"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(len(data)) == data
+    except OSError:
+        return False
+
+def _discard(tmp_path: Optional[str]):
+    """Remove the temporary file of a failed write (a retry uses a new one)"""
+    if tmp_path is None:
+        return
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+def write_file_durably(path: str, data: bytes, mode: str = "replace") -> bool:
+    """
+    Write a file and fsync it; replaced and created files go through a temporary name
+    :param mode: "replace", "create" (no-op if the file exists) or "append"
+    :return: False if nothing was written ("create" of an existing file)
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if mode == "append":
+        f, _ = _open_for_append(path)
+        with f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+    if mode == "create" and os.path.exists(path):
+        return False
+    tmp_path = _temp_path(path)
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return True
+
+def _fsync_directory(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # Not supported for directories on every platform
+        pass
+    finally:
+        os.close(fd)
+
+class WriteJob:
+    """One queued write and, once it is done, whether it succeeded"""
+
+    def __init__(self, path: str, data: bytes, mode: str = "replace",
+                 on_failure: Optional[Callable[[], None]] = None, after: Optional["WriteJob"] = None):
+        """
+        :param path: Final file path (missing directories are created)
+        :param data: File contents
+        :param mode: "replace", "create" (no-op if the file exists) or "append"
+        :param on_failure: Called once the write is given up (in the writer thread)
+        :param after: Create or replace job that must be durable before this append is written
+        """
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write mode '{mode}', expected one of: {', '.join(WRITE_MODES)}")
+        self.path = path
+        self.data = data
+        self.mode = mode
+        self.on_failure = on_failure
+        self.after = after
+        self.append_offset: Optional[int] = None  # Where an earlier attempt of an append started
+        self.succeeded: Optional[bool] = None  # None until done
+        self.done = threading.Event()
+
+    def finish(self, succeeded: bool):
+        self.succeeded = succeeded
+        self.done.set()
+        if not succeeded and self.on_failure is not None:
+            try:
+                self.on_failure()
+            except Exception as e:
+                print(f"❌ Error undoing failed write of {self.path}: {e}")
+
+class ImageWriteBehind:
+    """Background writer with batched fsyncs"""
+
+    def __init__(self, max_queue: int = 256, batch_size: int = 32, batch_wait_ms: float = 20.0, max_retries: int = 3):
+        """
+        :param max_queue: Images that may wait to be written
+        :param batch_size: Most images written (and fsynced) together
+        :param batch_wait_ms: How long the writer waits for more images to fill a batch
+        :param max_retries: Attempts per image after the first failure
+        """
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_retries = max_retries
+
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.inline_writes = 0
+        self.deduplicated = 0  # "create" writes skipped because the file existed
+        self.last_error: Optional[str] = None
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._directories = set()  # Directories known to exist
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="image-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """Write everything still queued, then stop the writer thread"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def submit(self, path: str, data: bytes, mode: str = "replace", on_failure: Optional[Callable[[], None]] = None,
+               after: Optional[WriteJob] = None) -> Optional[WriteJob]:
+        """
+        Queue an image for writing, without blocking (parameters as in WriteJob)
+        :return: The queued job, None if the queue is full and nothing was queued
+        """
+        job = WriteJob(path, data, mode, on_failure, after)
+        return job if self._enqueue(job) else None
+
+    def _enqueue(self, job: WriteJob) -> bool:
+        self.start()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            return False
+        return True
+
+    async def write(self, path: str, data: bytes, mode: str = "replace", on_failure: Optional[Callable[[], None]] = None,
+                    after: Optional[WriteJob] = None) -> WriteJob:
+        """
+        Queue an image for writing; when the queue is full, write it in a worker thread and wait
+        
+        Backpressure: a request that finds the queue full waits for its own
+        write instead of queueing more, without blocking the event loop.
+        Parameters as in WriteJob; a failed write is reported through
+        on_failure either way.
+        :return: The job, done already if it was written inline
+        """
+        job = WriteJob(path, data, mode, on_failure, after)
+        if self._enqueue(job):
+            return job
+        self.inline_writes += 1
+        if after is not None:
+            await asyncio.to_thread(after.done.wait)
+            if not after.succeeded:
+                self.failed += 1
+                job.finish(False)
+                return job
+        try:
+            written = await asyncio.to_thread(write_file_durably, path, data, mode)
+        except OSError as e:
+            self.failed += 1
+            self.last_error = f"{path}: {e}"
+            print(f"❌ Could not write face image {path}: {e}")
+            job.finish(False)
+            return job
+        if written:
+            self.written += 1
+        else:
+            self.deduplicated += 1
+        job.finish(True)
+        return job
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _next_batch(self) -> Tuple[List[WriteJob], bool]:
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+
+        batch = [item]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write_batch(self, batch: List[WriteJob]) -> List[WriteJob]:
+        """
+        Write a batch with one fsync pass per phase; return the jobs to retry
+        
+        Created and replaced files are renamed into place, and their
+        directories fsynced, before any append of the batch is written.
+        """
+        failed = []
+        self._sync(self._open([job for job in batch if job.mode != "append"], failed), failed)
+
+        appends = []
+        for job in batch:
+            if job.mode != "append":
+                continue
+            if job.after is None or job.after.succeeded:
+                appends.append(job)
+            elif job.after.succeeded is None:
+                # Its file failed in this attempt and is retried with it
+                failed.append(job)
+            else:
+                self.failed += 1
+                job.finish(False)
+        self._sync(self._open(appends, failed), failed)
+        self.batches += 1
+        return failed
+
+    def _open(self, jobs: List[WriteJob], failed: List[WriteJob]) -> List[Tuple[WriteJob, object, Optional[str]]]:
+        """Write jobs without fsyncing them; return (job, open file, temporary path) per job written"""
+        pending = []
+        created = set()  # "create" paths already written by this batch
+        for job in jobs:
+            path = job.path
+            tmp_path = None
+            try:
+                if job.mode == "create" and (path in created or os.path.exists(path)):
+                    self.deduplicated += 1
+                    job.finish(True)
+                    continue
+                directory = os.path.dirname(path) or "."
+                if directory not in self._directories:
+                    os.makedirs(directory, exist_ok=True)
+                    self._directories.add(directory)
+                if job.mode == "append":
+                    if job.append_offset is not None and _already_appended(path, job.append_offset, job.data):
+                        # An earlier attempt got the data into the file; only fsync it
+                        f = open(path, "ab")
+                    else:
+                        f, job.append_offset = _open_for_append(path)
+                        self._write_data(f, job.data)
+                else:
+                    tmp_path = _temp_path(path)
+                    f = open(tmp_path, "wb")
+                    self._write_data(f, job.data)
+                if job.mode == "create":
+                    created.add(path)
+                pending.append((job, f, tmp_path))
+            except OSError as e:
+                self.last_error = f"{path}: {e}"
+                failed.append(job)
+                _discard(tmp_path)
+        return pending
+
+    def _sync(self, pending: List[Tuple[WriteJob, object, Optional[str]]], failed: List[WriteJob]):
+        """fsync written jobs, rename temporary files into place and fsync their directories"""
+        directories = set()
+        done = []
+        for job, f, tmp_path in pending:
+            try:
+                os.fsync(f.fileno())
+                f.close()
+                if tmp_path is not None:
+                    os.replace(tmp_path, job.path)
+                    directories.add(os.path.dirname(job.path) or ".")
+                done.append(job)
+            except OSError as e:
+                f.close()
+                self.last_error = f"{job.path}: {e}"
+                failed.append(job)
+                _discard(tmp_path)
+
+        for directory in directories:
+            _fsync_directory(directory)
+        for job in done:
+            self.written += 1
+            job.finish(True)
+
+    @staticmethod
+    def _write_data(f, data: bytes):
+        try:
+            f.write(data)
+            f.flush()
+        except OSError:
+            f.close()
+            raise
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            attempt = 0
+            while batch:
+                batch = self._write_batch(batch)
+                if not batch:
+                    break
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.failed += len(batch)
+                    for job in batch:
+                        print(f"❌ Could not write face image {job.path}: {self.last_error}")
+                        job.finish(False)
+                    break
+                self.retries += len(batch)
+                time.sleep(0.05 * 2 ** attempt)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "written": self.written,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "inline_writes": self.inline_writes,
+            "deduplicated": self.deduplicated,
+            "last_error": self.last_error
+        }
+
+# Shared by main.py and api/routes/face_recognition.py
+image_writer = ImageWriteBehind(IMAGE_WRITE_QUEUE_SIZE, IMAGE_WRITE_BATCH_SIZE, IMAGE_WRITE_BATCH_WAIT_MS, IMAGE_WRITE_RETRIES)
+
+register_gauge("face_image_write_queue_depth", "Face images waiting to be written to disk", lambda: image_writer.queue_depth)
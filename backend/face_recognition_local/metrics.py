@@ -0,0 +1,166 @@
+"""
+Per-stage latency histograms exported in the Prometheus text format.
+
+Workers time each stage of an encode (decode, resize, color conversion,
+detection, encoding) and send the timings back with the result; the
+request side records them together with queue wait, upload size, image
+size, faces found, worker peak RSS, peak Python memory (optional), match
+distance and detection time per detector backend. Every series is
+labelled with the endpoint that triggered it, taken from current_endpoint,
+which the HTTP middleware in main.py sets per request.
+
+Recording an observation is a bisect and a few additions under a lock, so
+it is cheap enough to do on every request.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Endpoint (route path) of the request being served
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="other")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Prometheus-style cumulative histogram with labels"""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple[str, ...], List] = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+
+        for labels, counts, total, count in sorted(snapshot):
+            label_text = ",".join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            prefix = label_text + "," if label_text else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+class Gauge:
+    """Prometheus gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+request_seconds = Histogram(
+    "face_request_seconds", "End-to-end request latency", LATENCY_BUCKETS, ("endpoint",)
+)
+stage_seconds = Histogram(
+    "face_stage_seconds", "Latency of one processing stage", LATENCY_BUCKETS, ("stage", "endpoint")
+)
+queue_wait_seconds = Histogram(
+    "face_queue_wait_seconds", "Time an encode waited before a worker started it", LATENCY_BUCKETS, ("endpoint",)
+)
+upload_bytes = Histogram(
+    "face_upload_bytes", "Size of uploaded images",
+    (16e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6), ("endpoint",)
+)
+image_pixels = Histogram(
+    "face_image_pixels", "Decoded image size (width * height)",
+    (76800, 307200, 921600, 2073600, 3686400, 8294400, 16777216), ("endpoint",)
+)
+faces_found = Histogram(
+    "face_faces_found", "Faces detected per image", (0, 1, 2, 3, 5, 10), ("endpoint",)
+)
+match_distance = Histogram(
+    "face_match_distance", "Distance between a probe and the claimed user's templates",
+    (0.2, 0.3, 0.4, 0.5, 0.55, 0.6, 0.65, 0.7, 0.8, 1.0), ("endpoint",)
+)
+request_peak_bytes = Histogram(
+    "face_request_peak_bytes", "Upload plus peak Python/NumPy memory of its encode (TRACK_REQUEST_MEMORY)",
+    (1e6, 4e6, 16e6, 32e6, 64e6, 128e6, 256e6, 512e6), ("endpoint",)
+)
+worker_peak_rss_bytes = Histogram(
+    "face_worker_peak_rss_bytes", "Peak RSS of the worker process after an encode",
+    (64e6, 128e6, 256e6, 512e6, 1e9, 2e9, 4e9), ("endpoint",)
+)
+detection_seconds = Histogram(
+    "face_detection_seconds", "Face detection latency per detector backend", LATENCY_BUCKETS, ("backend", "endpoint")
+)
+encode_batch_size = Histogram(
+    "face_encode_batch_size", "Images per face-pool task", (1, 2, 4, 8, 16, 32, 64)
+)
+
+REGISTRY = [
+    request_seconds, stage_seconds, queue_wait_seconds, upload_bytes,
+    image_pixels, faces_found, match_distance, request_peak_bytes, worker_peak_rss_bytes, detection_seconds, encode_batch_size
+]
+
+def record_encode_profile(profile: Optional[dict], submitted_at: Optional[float] = None):
+    """
+    Record the timings a worker returned with an encode result
+    :param profile: Profile from face_engine.encode_face_profiled
+    :param submitted_at: time.time() when the encode was submitted to the pool
+    """
+    if not profile:
+        return
+    endpoint = current_endpoint.get()
+    for stage, seconds in profile["stages"].items():
+        stage_seconds.observe(seconds, stage, endpoint)
+    if "detector" in profile and "detection" in profile["stages"]:
+        detection_seconds.observe(profile["stages"]["detection"], profile["detector"], endpoint)
+    if submitted_at is not None:
+        queue_wait_seconds.observe(max(0.0, profile["started_at"] - submitted_at), endpoint)
+    if "width" in profile:
+        image_pixels.observe(profile["width"] * profile["height"], endpoint)
+    if "faces" in profile:
+        faces_found.observe(profile["faces"], endpoint)
+    if profile.get("max_rss_bytes"):
+        worker_peak_rss_bytes.observe(profile["max_rss_bytes"], endpoint)
+    if "peak_bytes" in profile:
+        request_peak_bytes.observe(profile["input_bytes"] + profile["peak_bytes"], endpoint)
+
+@contextmanager
+def time_stage(stage: str):
+    """Record the duration of a request-side stage (e.g. comparison)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage, current_endpoint.get())
+
+def register_gauge(name: str, help_text: str, read: Callable[[], float]) -> Gauge:
+    """Export a value owned by another module (e.g. a queue depth)"""
+    gauge = Gauge(name, help_text, read)
+    REGISTRY.append(gauge)
+    return gauge
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,218 @@
+"""
+Streaming face verification for one unlock session.
+
+Camera frames arrive over a WebSocket faster than they can be encoded, so
+only the newest unprocessed frame is kept: when a new frame arrives before
+the previous one was picked up, the older one is dropped. Up to
+max_in_flight frames are encoded concurrently in the face-compute pool.
+
+The session decides as soon as required_matches of the last window
+evaluated frames matched the user (k-of-n consensus), or fails after
+max_frames frames. Once a decision is made, or the client disconnects,
+no further frame is submitted and outstanding encodes are cancelled.
+
+The face box found in one frame is passed to the next encode as a region
+of interest, so detection scans a small window instead of the whole
+frame. A full-frame detection still runs when the track is lost and every
+redetect_interval frames; the interval counts from the last full-frame
+detection of either kind.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from face_recognition_local.executor import run_face_task
+from face_recognition_local.encoding_cache import encode_face_cached
+from face_recognition_local.face_engine import FaceBox, encode_face_profiled
+from face_recognition_local.metrics import match_distance, record_encode_profile, time_stage, current_endpoint
+
+class StreamVerifier:
+    def __init__(
+        self,
+        gallery,
+        user_id: str,
+        tolerance: float,
+        aggregation: str = "min",
+        required_matches: int = 1,
+        window: int = 1,
+        max_frames: int = 30,
+        max_in_flight: int = 2,
+        redetect_interval: int = 10,
+        detector: Optional[str] = None
+    ):
+        """
+        :param gallery: GalleryIndex holding the user's templates
+        :param user_id: User the frames must match
+        :param tolerance: Maximum distance accepted as a match
+        :param aggregation: How the user's templates are compared (see GalleryIndex.user_distance)
+        :param required_matches: Matching frames needed within the window (k)
+        :param window: Number of most recent evaluated frames considered (n)
+        :param max_frames: Evaluated frames after which the session fails
+        :param max_in_flight: Frames encoded concurrently
+        :param redetect_interval: Frames between full-frame detections while tracking
+        :param detector: Detector backend, None for FACE_DETECTOR
+        """
+        if required_matches < 1:
+            # With no match required, the first evaluated frame would unlock
+            raise ValueError(f"required_matches must be at least 1 (got {required_matches})")
+        self.gallery = gallery
+        self.user_id = user_id
+        self.tolerance = tolerance
+        self.aggregation = aggregation
+        self.required_matches = required_matches
+        self.window = max(window, required_matches)
+        self.max_frames = max_frames
+        self.max_in_flight = max_in_flight
+        self.redetect_interval = redetect_interval
+        self.detector = detector
+
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_evaluated = 0
+        self.full_detections = 0
+        self.best_distance = float("inf")
+
+        self._latest: Optional[bytes] = None
+        self._frame_ready = asyncio.Event()
+        self._recent = deque(maxlen=self.window)
+        self._closed = False
+        self._track_box: Optional[FaceBox] = None
+        self._frames_since_full = 0
+
+    def submit(self, frame: bytes):
+        """Queue a frame, replacing the previous one if it was not picked up yet"""
+        if self._latest is not None:
+            self.frames_dropped += 1
+        self._latest = frame
+        self.frames_received += 1
+        self._frame_ready.set()
+
+    def close(self):
+        """No more frames will arrive (client disconnected or stopped sending)"""
+        self._closed = True
+        # Nobody would receive the result of a frame not picked up yet
+        if self._latest is not None:
+            self._latest = None
+            self.frames_dropped += 1
+        self._frame_ready.set()
+
+    async def _next_frame(self) -> Optional[bytes]:
+        while self._latest is None:
+            if self._closed:
+                return None
+            self._frame_ready.clear()
+            await self._frame_ready.wait()
+        frame, self._latest = self._latest, None
+        if not self._closed:
+            self._frame_ready.clear()
+        return frame
+
+    def _roi_hint(self) -> Optional[FaceBox]:
+        """Box to search around, or None when a full-frame detection is due"""
+        if self._track_box is None or self._frames_since_full >= self.redetect_interval:
+            self._full_detection()
+            return None
+        self._frames_since_full += 1
+        return self._track_box
+
+    def _full_detection(self):
+        self._frames_since_full = 0
+        self.full_detections += 1
+
+    async def _evaluate(self, frame: bytes) -> dict:
+        roi_hint = self._roi_hint()
+        if roi_hint is None:
+            result = await encode_face_cached(frame, self.detector)
+        else:
+            submitted_at = time.time()
+            result, profile = await run_face_task(encode_face_profiled, frame, roi_hint, self.detector)
+            record_encode_profile(profile, submitted_at)
+            if profile.get("full_frame"):
+                # The tracked face was lost and the whole frame was searched
+                self._full_detection()
+        self.frames_evaluated += 1
+
+        if result is None:
+            # Track lost: the next frame gets a full-frame detection
+            self._track_box = None
+            self._recent.append(False)
+            return {"type": "progress", "frame": self.frames_evaluated, "face_detected": False, "match": False}
+
+        self._track_box = result[1]
+        with time_stage("comparison"):
+            distance = self.gallery.user_distance(result[0], self.user_id, self.aggregation)
+        match_distance.observe(distance, current_endpoint.get())
+        self.best_distance = min(self.best_distance, distance)
+        match = distance <= self.tolerance
+        self._recent.append(match)
+        return {
+            "type": "progress",
+            "frame": self.frames_evaluated,
+            "face_detected": True,
+            "match": match,
+            "distance": round(distance, 4)
+        }
+
+    def _decided(self) -> Optional[bool]:
+        if sum(self._recent) >= self.required_matches:
+            return True
+        if self.frames_evaluated >= self.max_frames:
+            return False
+        return None
+
+    async def run(self, on_progress: Callable[[dict], Awaitable[None]]) -> bool:
+        """
+        Evaluate frames until a decision is reached
+        :param on_progress: Called with a progress message after each evaluated frame
+        :return: True if the user was verified, False otherwise
+        """
+        in_flight = set()
+        try:
+            while True:
+                # Keep up to max_in_flight encodes running
+                while len(in_flight) < self.max_in_flight:
+                    if self._latest is None and in_flight:
+                        break
+                    frame = await self._next_frame()
+                    if frame is None:
+                        break
+                    in_flight.add(asyncio.ensure_future(self._evaluate(frame)))
+
+                if not in_flight:
+                    # Stream ended with nothing left to evaluate
+                    return False
+
+                waiters = set(in_flight)
+                next_frame = None
+                if len(in_flight) < self.max_in_flight and not self._closed:
+                    next_frame = asyncio.ensure_future(self._frame_ready.wait())
+                    waiters.add(next_frame)
+
+                done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+                if next_frame is not None and next_frame not in done:
+                    next_frame.cancel()
+
+                for task in done & in_flight:
+                    in_flight.discard(task)
+                    await on_progress(task.result())
+                    decision = self._decided()
+                    if decision is not None:
+                        return decision
+        finally:
+            # Early exit: submit no more frames and stop encodes that are no
+            # longer needed (encode_face_cached drops an encode once nobody
+            # waits for it)
+            self.close()
+            for task in in_flight:
+                task.cancel()
+
+    def summary(self) -> dict:
+        return {
+            "frames_received": self.frames_received,
+            "frames_dropped": self.frames_dropped,
+            "frames_evaluated": self.frames_evaluated,
+            "full_detections": self.full_detections,
+            "best_distance": round(self.best_distance, 4) if self.best_distance != float("inf") else None
+        }
@@ -0,0 +1,221 @@
+"""
+Size limits for uploaded images, enforced before the image is decoded.
+
+The request body of an upload route is counted as it is received
+(UploadSizeLimit, an ASGI middleware), with or without a Content-Length
+header, and answered with 413 as soon as it passes the limit, before
+Starlette's multipart parser has buffered the rest of it. Once the form is
+parsed, read_image_upload applies the exact MAX_UPLOAD_BYTES limit to the
+file part and reads the image dimensions from its header (JPEG SOF, PNG
+IHDR, BMP info header), so an image with too many pixels is rejected
+before a full-size buffer is ever allocated by the decoder.
+
+Images that are within MAX_IMAGE_PIXELS but larger than DECODE_MAX_PIXELS
+are decoded at a reduced size (see decode_scale_flag), which for JPEG
+happens inside the decoder and never materializes the full-size image.
+"""
+
+import json
+import struct
+from typing import Callable, Optional, Tuple
+
+import cv2
+
+from config.settings import MAX_UPLOAD_BYTES, MAX_IMAGE_PIXELS, DECODE_MAX_PIXELS, UPLOAD_CHUNK_SIZE
+
+# Header bytes read at most while looking for the dimensions (JPEG EXIF
+# segments can push the frame header back by up to 64 KB)
+MAX_HEADER_BYTES = 256 * 1024
+
+# JPEG start-of-frame markers that carry the image size
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+class UploadRejected(ValueError):
+    """Upload exceeds a size limit"""
+
+    def __init__(self, message: str, status_code: int = 413):
+        super().__init__(message)
+        self.status_code = status_code
+
+    def __reduce__(self):
+        # Keep the status code when raised in a pool worker
+        return type(self), (str(self), self.status_code)
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length
+            offset += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > len(data):
+                return None
+            height, width = struct.unpack_from(">HH", data, offset + 5)
+            return width, height
+        offset += 2 + struct.unpack_from(">H", data, offset + 2)[0]
+    return None
+
+def read_image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read (width, height) from the start of an encoded image
+    :param data: The first bytes of the file (may be incomplete)
+    :return: Dimensions, or None if the format is unknown or more bytes are needed
+    """
+    if data[:2] == b"\xff\xd8":
+        return _jpeg_size(data)
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack_from(">II", data, 16)
+    if data[:2] == b"BM" and len(data) >= 26:
+        width, height = struct.unpack_from("<ii", data, 18)
+        return abs(width), abs(height)
+    return None
+
+def check_image_size(size: Optional[Tuple[int, int]]):
+    """Reject dimensions above MAX_IMAGE_PIXELS"""
+    if size is not None and MAX_IMAGE_PIXELS and size[0] * size[1] > MAX_IMAGE_PIXELS:
+        raise UploadRejected(
+            f"Image is {size[0]}x{size[1]} pixels, the limit is {MAX_IMAGE_PIXELS} pixels"
+        )
+
+def check_image_data(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Apply the byte and pixel limits to a complete image (e.g. a stream frame)
+    :return: Dimensions from the header, if known
+    """
+    if MAX_UPLOAD_BYTES and len(data) > MAX_UPLOAD_BYTES:
+        raise UploadRejected(f"Image is larger than {MAX_UPLOAD_BYTES} bytes")
+    size = read_image_size(data[:MAX_HEADER_BYTES])
+    check_image_size(size)
+    return size
+
+async def read_image_upload(file) -> bytes:
+    """
+    Read an UploadFile in chunks, enforcing MAX_UPLOAD_BYTES and MAX_IMAGE_PIXELS
+    
+    The request body has already been received (and capped by
+    UploadSizeLimit) when this runs; this applies the exact limits to the
+    file part itself.
+    :param file: fastapi.UploadFile
+    :return: The uploaded bytes
+    :raises UploadRejected: If the file is over a limit
+    """
+    chunks = []
+    received = 0
+    size_known = False
+
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        received += len(chunk)
+
+        if MAX_UPLOAD_BYTES and received > MAX_UPLOAD_BYTES:
+            raise UploadRejected(f"Image is larger than {MAX_UPLOAD_BYTES} bytes")
+
+        if not size_known and received <= MAX_HEADER_BYTES + UPLOAD_CHUNK_SIZE:
+            header = b"".join(chunks)[:MAX_HEADER_BYTES]
+            size = read_image_size(header)
+            if size is not None:
+                size_known = True
+                check_image_size(size)
+
+    return b"".join(chunks)
+
+class UploadSizeLimit:
+    """
+    ASGI middleware that caps the request body of the upload routes
+    
+    The body is counted as the server hands it over, so a chunked request
+    without Content-Length is cut off just like one that declares its size.
+    Whatever the application answers to a body cut off this way, the client
+    gets a 413.
+    """
+
+    def __init__(self, app, max_body_bytes: int, applies_to: Callable[[dict], bool]):
+        """
+        :param app: The wrapped ASGI application
+        :param max_body_bytes: Largest accepted body (0 disables the limit)
+        :param applies_to: Called with the ASGI scope; True for upload routes
+        """
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.applies_to = applies_to
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_body_bytes or not self.applies_to(scope):
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            print(f"🚫 Upload rejected: {int(content_length)} bytes")
+            await self._reject(send)
+            return
+        
+        received = 0
+        rejected = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    rejected = True
+                    raise UploadRejected(f"Request body is larger than {self.max_body_bytes} bytes")
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if rejected:
+                # Replace the application's answer to the cut-off body
+                if message["type"] == "http.response.start" and not response_started:
+                    response_started = True
+                    await self._reject(send)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadRejected:
+            if response_started:
+                raise
+        if rejected and not response_started:
+            await self._reject(send)
+        if rejected:
+            print(f"🚫 Upload rejected: body passed {self.max_body_bytes} bytes")
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"Image is larger than {MAX_UPLOAD_BYTES} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+def decode_scale_flag(size: Optional[Tuple[int, int]]) -> Tuple[int, int]:
+    """
+    Pick the cv2.imdecode flag for an image of the given size
+    :param size: (width, height) from read_image_size, or None
+    :return: Tuple of (imdecode flag, downscale factor)
+    """
+    if size is None or not DECODE_MAX_PIXELS:
+        return cv2.IMREAD_COLOR, 1
+    pixels = size[0] * size[1]
+    for factor, flag in ((1, cv2.IMREAD_COLOR), (2, cv2.IMREAD_REDUCED_COLOR_2), (4, cv2.IMREAD_REDUCED_COLOR_4)):
+        if pixels <= DECODE_MAX_PIXELS * factor * factor:
+            return flag, factor
+    return cv2.IMREAD_REDUCED_COLOR_8, 8
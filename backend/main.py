@@ -1,15 +1,47 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Match
 import uvicorn
 import os
-import cv2
 import numpy as np
-import face_recognition
-import uuid
+import asyncio
+import shutil
+import tempfile
+import time
+import base64
+import hashlib
+import json
+from email.utils import formatdate, parsedate_to_datetime
 from typing import Optional
 from datetime import datetime
 
+from face_recognition_local.executor import (
+    get_face_executor, get_background_executor, shutdown_face_executor, warm_up_face_executor, run_face_task
+)
+from face_recognition_local.encoding_cache import encoding_cache, encode_face_image_cached
+from face_recognition_local.batch_scheduler import encode_batcher
+from face_recognition_local.bulk_import import run_bulk_import, load_import_results
+from face_recognition_local.gallery_store import get_face_gallery, swap_face_gallery
+from face_recognition_local.gallery_rebuild import run_gallery_rebuild
+from face_recognition_local.gallery_watcher import create_gallery_watcher
+from face_recognition_local.stream_verifier import StreamVerifier
+from face_recognition_local.image_writer import image_writer
+from face_recognition_local.image_store import get_image_store, save_registration_images
+from face_recognition_local.face_engine import encode_face_with_chip, locate_faces, warm_up_face_models
+from face_recognition_local.detectors import detector_status, resolve_detector
+from face_recognition_local.upload_limits import UploadRejected, UploadSizeLimit, check_image_data
+from api.dependencies import DETECTOR_FIELD_DESCRIPTION, read_image_file, request_detector, upload_rejected
+from face_recognition_local.metrics import (
+    current_endpoint, match_distance, record_encode_profile, render_metrics, request_seconds, time_stage
+)
+from config.settings import (
+    BULK_IMPORT_FILE, MAX_TEMPLATES_PER_USER, TEMPLATE_AGGREGATION, FACE_MATCH_TOLERANCE,
+    STREAM_REQUIRED_MATCHES, STREAM_WINDOW, STREAM_MAX_FRAMES, STREAM_MAX_IN_FLIGHT, STREAM_SESSION_TIMEOUT,
+    TRACK_REDETECT_INTERVAL, MAX_UPLOAD_BYTES, LIST_IMAGES_PAGE_SIZE, LIST_IMAGES_MAX_PAGE_SIZE,
+    FACE_CHIPS_ENABLED, KEEP_ORIGINAL_IMAGES, FACE_IMAGES_DIR, GALLERY_WATCH_ENABLED, FACE_DETECTOR
+)
+
 app = FastAPI(
     title="Face Recognition API",
     description="API for Face Registration and Verification",
@@ -25,85 +57,122 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def route_path(scope) -> str:
+    """Route template (e.g. /api/face/list-images/{user_id}) serving a request"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "other"
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Label metrics recorded while serving a request with its endpoint"""
+    endpoint = route_path(request.scope)
+    current_endpoint.set(endpoint)
+    start = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        request_seconds.observe(time.perf_counter() - start, endpoint)
+
+# Endpoints that take a single image upload
+IMAGE_UPLOAD_ROUTES = {"/api/face/register", "/api/face/verify", "/api/face/unlock-locker", "/api/face/test-image"}
+
+# Cap the request body of the upload routes as it arrives, allowing some
+# room for the multipart envelope and form fields
+app.add_middleware(
+    UploadSizeLimit,
+    max_body_bytes=MAX_UPLOAD_BYTES and MAX_UPLOAD_BYTES + 64 * 1024,
+    applies_to=lambda scope: route_path(scope) in IMAGE_UPLOAD_ROUTES
+)
+
 # Directory to store face images
-FACE_IMAGES_DIR = "face_recognition_local/data/faces"
 os.makedirs(FACE_IMAGES_DIR, exist_ok=True)
+image_store = get_image_store(FACE_IMAGES_DIR)
+
+# Applies images dropped into user folders and FaceData changes to the live gallery
+gallery_watcher = create_gallery_watcher(image_store) if GALLERY_WATCH_ENABLED else None
 
-# Simple in-memory storage for demo (in production, use database)
-REGISTERED_FACES = {}  # {user_id: face_encoding}
+# Registered face encodings live in a memory-mapped gallery file (GALLERY_PATH)
 
-def save_face_image(image_data: bytes, user_id: str) -> str:
-    """Save face image to disk in user-specific folder and return filename"""
-    # Create user-specific directory
-    user_dir = os.path.join(FACE_IMAGES_DIR, user_id)
-    os.makedirs(user_dir, exist_ok=True)
+# Startup steps that must finish before /ready reports the service as ready
+readiness = {"gallery": False, "models": False, "face_pool": False}
+_warm_up_task: Optional[asyncio.Task] = None
+
+async def warm_up_face_service():
+    """Warm up the models in this process and in every pool worker"""
+    try:
+        elapsed = await asyncio.to_thread(warm_up_face_models)
+        readiness["models"] = True
+        print(f"🔥 Face models warmed up in {elapsed * 1000:.0f} ms")
+        
+        pids = await warm_up_face_executor()
+        readiness["face_pool"] = True
+        print(f"🔥 {len(pids)} face worker(s) warmed up, service ready")
+    except Exception as e:
+        print(f"❌ Error warming up face models: {e}")
+
+@app.on_event("startup")
+async def start_face_executor():
+    """Start the face-compute pool so workers load models before traffic arrives"""
+    global _warm_up_task
+    get_face_executor()
+    image_writer.start()
     
-    # Generate unique filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"face_{timestamp}_{uuid.uuid4().hex[:8]}.jpg"
-    filepath = os.path.join(user_dir, filename)
+    # Map the persisted gallery so 1:N queries work immediately
+    get_face_gallery()
+    readiness["gallery"] = True
     
-    with open(filepath, "wb") as f:
-        f.write(image_data)
+    # Warm up in the background; /ready turns green once it is done
+    _warm_up_task = asyncio.create_task(warm_up_face_service())
     
-    print(f"📁 Saved face image for user '{user_id}' in: {user_dir}")
-    print(f"📄 Filename: {filename}")
+    # Load encodings produced by bulk_import_faces.py (once, even with
+    # several workers starting together)
+    with get_face_gallery().locked():
+        if os.path.exists(BULK_IMPORT_FILE):
+            imported = load_import_results(BULK_IMPORT_FILE)
+            store_imported_faces(imported)
+            os.replace(BULK_IMPORT_FILE, BULK_IMPORT_FILE + ".loaded")
+            print(f"📦 Loaded {len(imported)} bulk-imported user(s) from {BULK_IMPORT_FILE}")
     
-    return filename
+    if gallery_watcher is not None:
+        gallery_watcher.start()
 
-def encode_face_image(image_data: bytes) -> Optional[np.ndarray]:
-    """Encode face from image data"""
-    try:
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            print("❌ Error: Could not decode image")
-            return None
-        
-        print(f"✅ Image decoded successfully. Shape: {image.shape}")
-        
-        # Convert BGR to RGB
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Find face locations
-        face_locations = face_recognition.face_locations(rgb_image)
-        
-        print(f"🔍 Found {len(face_locations)} face(s) in image")
-        
-        if not face_locations:
-            print("❌ No faces detected in image")
-            return None
-        
-        # Get face encodings
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
-        
-        if not face_encodings:
-            print("❌ Could not encode faces")
-            return None
-        
-        print(f"✅ Successfully encoded {len(face_encodings)} face(s)")
-        
-        # Return the first face encoding
-        return face_encodings[0]
+@app.on_event("shutdown")
+async def stop_face_executor():
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+    if gallery_watcher is not None:
+        await gallery_watcher.stop()
+    shutdown_face_executor()
+    get_face_gallery().close()
     
-    except ImportError as e:
-        print(f"❌ Error: face_recognition library not installed. Please run: pip install face-recognition")
-        return None
-    except Exception as e:
-        print(f"❌ Error encoding face: {e}")
-        return None
+    # Write face images still queued before exiting
+    await asyncio.to_thread(image_writer.stop)
 
-def verify_face_encoding(known_encoding: np.ndarray, unknown_encoding: np.ndarray, tolerance: float = 0.6) -> bool:
-    """Verify if two face encodings match"""
-    try:
-        # Compare face encodings
-        matches = face_recognition.compare_faces([known_encoding], unknown_encoding, tolerance=tolerance)
-        return matches[0] if matches else False
-    except Exception as e:
-        print(f"Error verifying face: {e}")
-        return False
+def store_imported_faces(encodings: dict):
+    """Add bulk-imported encodings to the gallery as templates in one step"""
+    user_ids = [user_id for user_id, user_encodings in encodings.items() for _ in user_encodings]
+    if user_ids:
+        vectors = np.array([encoding for user_encodings in encodings.values() for encoding in user_encodings])
+        get_face_gallery().add_templates(user_ids, vectors, MAX_TEMPLATES_PER_USER)
+
+async def save_face_image(image_data: bytes, user_id: str, face_chip: Optional[dict] = None) -> str:
+    """
+    Save a face image in the content-addressed image store and return its filename
+    
+    The filename is the SHA-256 of the image, so saving the same image again
+    is a no-op. With a face chip, the chip is stored too and the upload only
+    if KEEP_ORIGINAL_IMAGES is set. Files are written by the background
+    image writer, so the request only waits for the disk when its queue is
+    full.
+    """
+    entry = await save_registration_images(image_store, user_id, image_data, face_chip, KEEP_ORIGINAL_IMAGES)
+    
+    print(f"📁 Stored face image for user '{user_id}': {entry['blob']}")
+    
+    return entry["filename"]
 
 # ============================================================================
 # 1. FACE REGISTRATION API
@@ -112,7 +181,8 @@ def verify_face_encoding(known_encoding: np.ndarray, unknown_encoding: np.ndarra
 @app.post("/api/face/register")
 async def register_face(
     file: UploadFile = File(..., description="Face image file (JPG, PNG, etc.)"),
-    user_id: str = Form("owner", description="User ID for face registration")  # Default to "owner" for demo
+    user_id: str = Form("owner", description="User ID for face registration"),  # Default to "owner" for demo
+    detector: Optional[str] = Form(None, description=DETECTOR_FIELD_DESCRIPTION)
 ):
     """
     Register user's face for authentication
@@ -125,21 +195,30 @@ async def register_face(
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    detector = request_detector(detector)
+    
+    # Read image data, stopping early if it is too large
+    image_data = await read_image_file(file)
+    
     try:
-        # Read image data
-        image_data = await file.read()
-        
-        # Encode face
-        face_encoding = encode_face_image(image_data)
+        # Encode face (from its aligned chip when chips are stored)
+        face_chip = None
+        if FACE_CHIPS_ENABLED:
+            face_chip = await run_face_task(encode_face_with_chip, image_data, detector)
+            face_encoding = face_chip["encoding"] if face_chip is not None else None
+            record_encode_profile(face_chip["profile"] if face_chip is not None else None)
+        else:
+            face_encoding = await encode_face_image_cached(image_data, detector)
         
         if face_encoding is None:
             raise HTTPException(status_code=400, detail="No face detected in image. Please ensure your face is clearly visible.")
         
-        # Save face image
-        filename = save_face_image(image_data, user_id)
+        # Add the encoding as a new template (keeps the user's recent enrollments)
+        gallery = get_face_gallery()
+        gallery.add_template(user_id, face_encoding, MAX_TEMPLATES_PER_USER)
         
-        # Store face encoding in memory (in production, store in database)
-        REGISTERED_FACES[user_id] = face_encoding.tolist()
+        # Save face image (written in the background)
+        filename = await save_face_image(image_data, user_id, face_chip)
         
         print(f"✅ Face registered successfully for user: {user_id}")
         
@@ -147,9 +226,14 @@ async def register_face(
             "success": True,
             "message": "Face registered successfully! You can now use face recognition to unlock your locker.",
             "user_id": user_id,
-            "face_image_path": filename
+            "face_image_path": filename,
+            "templates": len(gallery.get(user_id))
         }
         
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        raise upload_rejected(e)
     except Exception as e:
         print(f"❌ Error registering face: {e}")
         raise HTTPException(status_code=500, detail=f"Error registering face: {str(e)}")
@@ -161,7 +245,8 @@ async def register_face(
 @app.post("/api/face/verify")
 async def verify_face(
     file: UploadFile = File(..., description="Face image file to verify (JPG, PNG, etc.)"),
-    user_id: str = Form("owner", description="User ID for face verification")  # Default to "owner" for demo
+    user_id: str = Form("owner", description="User ID for face verification"),  # Default to "owner" for demo
+    detector: Optional[str] = Form(None, description=DETECTOR_FIELD_DESCRIPTION)
 ):
     """
     Verify user's face for authentication
@@ -174,25 +259,28 @@ async def verify_face(
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    detector = request_detector(detector)
+    
+    # Read image data, stopping early if it is too large
+    image_data = await read_image_file(file)
+    
     try:
-        # Read image data
-        image_data = await file.read()
-        
         # Encode face from uploaded image
-        unknown_face_encoding = encode_face_image(image_data)
+        unknown_face_encoding = await encode_face_image_cached(image_data, detector)
         
         if unknown_face_encoding is None:
             raise HTTPException(status_code=400, detail="No face detected in image. Please ensure your face is clearly visible.")
         
         # Check if user has registered face
-        if user_id not in REGISTERED_FACES:
+        gallery = get_face_gallery()
+        if user_id not in gallery:
             raise HTTPException(status_code=400, detail="No face registered for this user. Please register your face first.")
         
-        # Get registered face encoding
-        known_face_encoding = np.array(REGISTERED_FACES[user_id])
-        
-        # Verify faces
-        is_match = verify_face_encoding(known_face_encoding, unknown_face_encoding)
+        # Verify faces against all of the user's templates in one pass
+        with time_stage("comparison"):
+            distance = gallery.user_distance(unknown_face_encoding, user_id, TEMPLATE_AGGREGATION)
+        match_distance.observe(distance, current_endpoint.get())
+        is_match = distance <= FACE_MATCH_TOLERANCE
         
         if is_match:
             print(f"✅ Face verification successful for user: {user_id}")
@@ -211,6 +299,10 @@ async def verify_face(
                 "confidence": 0.0
             }
         
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        raise upload_rejected(e)
     except Exception as e:
         print(f"❌ Error verifying face: {e}")
         raise HTTPException(status_code=500, detail=f"Error verifying face: {str(e)}")
@@ -223,7 +315,8 @@ async def verify_face(
 async def unlock_locker_with_face(
     file: UploadFile = File(..., description="Face image file (JPG, PNG, etc.)"),
     locker_id: str = Form(..., description="Locker ID to unlock"),
-    user_id: str = Form("owner", description="User ID for face verification")
+    user_id: str = Form("owner", description="User ID for face verification"),
+    detector: Optional[str] = Form(None, description=DETECTOR_FIELD_DESCRIPTION)
 ):
     """
     Unlock locker using face recognition
@@ -236,27 +329,30 @@ async def unlock_locker_with_face(
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    detector = request_detector(detector)
+    
+    # Read image data, stopping early if it is too large
+    image_data = await read_image_file(file)
+    
     try:
         print(f"🔓 Starting locker unlock process for locker: {locker_id}, user: {user_id}")
         
-        # Read image data
-        image_data = await file.read()
-        
         # Encode face from uploaded image
-        unknown_face_encoding = encode_face_image(image_data)
+        unknown_face_encoding = await encode_face_image_cached(image_data, detector)
         
         if unknown_face_encoding is None:
             raise HTTPException(status_code=400, detail="No face detected in image. Please ensure your face is clearly visible.")
         
         # Check if user has registered face
-        if user_id not in REGISTERED_FACES:
+        gallery = get_face_gallery()
+        if user_id not in gallery:
             raise HTTPException(status_code=400, detail="No face registered for this user. Please register your face first.")
         
-        # Get registered face encoding
-        known_face_encoding = np.array(REGISTERED_FACES[user_id])
-        
-        # Verify faces
-        is_match = verify_face_encoding(known_face_encoding, unknown_face_encoding)
+        # Verify faces against all of the user's templates in one pass
+        with time_stage("comparison"):
+            distance = gallery.user_distance(unknown_face_encoding, user_id, TEMPLATE_AGGREGATION)
+        match_distance.observe(distance, current_endpoint.get())
+        is_match = distance <= FACE_MATCH_TOLERANCE
         
         if is_match:
             print(f"✅ Face verification successful for user: {user_id}")
@@ -281,10 +377,213 @@ async def unlock_locker_with_face(
                 "confidence": 0.0
             }
         
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        raise upload_rejected(e)
     except Exception as e:
         print(f"❌ Error unlocking locker: {e}")
         raise HTTPException(status_code=500, detail=f"Error unlocking locker: {str(e)}")
 
+@app.websocket("/api/face/unlock-stream")
+async def unlock_locker_stream(websocket: WebSocket):
+    """
+    Unlock locker from a stream of camera frames
+    
+    Protocol:
+    1. Client sends a JSON text message:
+       {"locker_id": "...", "user_id": "owner", "detector": "hog"}
+       (how many frames must match is a server setting: STREAM_REQUIRED_MATCHES
+       of the last STREAM_WINDOW)
+    2. Client sends camera frames as binary messages (JPEG/PNG bytes)
+    3. Server sends {"type": "progress", ...} after each evaluated frame and
+       a final {"type": "result", "success": ...} as soon as a decision is
+       reached, then closes the connection
+    
+    Frames that arrive while the server is busy replace older pending ones,
+    so the decision is always made on the freshest frames.
+    """
+    
+    await websocket.accept()
+    current_endpoint.set("/api/face/unlock-stream")
+    receiver = None
+    try:
+        config = await websocket.receive_json()
+        locker_id = config.get("locker_id")
+        user_id = config.get("user_id", "owner")
+        
+        if not locker_id:
+            await websocket.send_json({"type": "error", "message": "locker_id is required"})
+            await websocket.close(code=1008)
+            return
+        
+        try:
+            detector = resolve_detector(config.get("detector"))
+        except ValueError as e:
+            await websocket.send_json({"type": "error", "message": str(e)})
+            await websocket.close(code=1008)
+            return
+        
+        gallery = get_face_gallery()
+        if user_id not in gallery:
+            await websocket.send_json({"type": "error", "message": "No face registered for this user. Please register your face first."})
+            await websocket.close(code=1008)
+            return
+        
+        print(f"🎥 Starting streaming unlock for locker: {locker_id}, user: {user_id}")
+        
+        session = StreamVerifier(
+            gallery,
+            user_id,
+            FACE_MATCH_TOLERANCE,
+            aggregation=TEMPLATE_AGGREGATION,
+            required_matches=STREAM_REQUIRED_MATCHES,
+            window=STREAM_WINDOW,
+            max_frames=STREAM_MAX_FRAMES,
+            max_in_flight=STREAM_MAX_IN_FLIGHT,
+            redetect_interval=TRACK_REDETECT_INTERVAL,
+            detector=detector
+        )
+        
+        frames_rejected = 0
+        
+        async def receive_frames():
+            nonlocal frames_rejected
+            try:
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        break
+                    if message.get("bytes"):
+                        try:
+                            check_image_data(message["bytes"])
+                        except UploadRejected as e:
+                            frames_rejected += 1
+                            print(f"🚫 Stream frame rejected: {e}")
+                            continue
+                        session.submit(message["bytes"])
+            finally:
+                session.close()
+        
+        receiver = asyncio.create_task(receive_frames())
+        
+        try:
+            success = await asyncio.wait_for(session.run(websocket.send_json), timeout=STREAM_SESSION_TIMEOUT)
+        except asyncio.TimeoutError:
+            success = False
+        
+        # Decision made: stop reading frames before answering
+        receiver.cancel()
+        
+        if success:
+            print(f"✅ Face verification successful for user: {user_id}")
+            print(f"🔓 Unlocking locker: {locker_id}")
+        else:
+            print(f"❌ Face verification failed for user: {user_id}")
+        
+        await websocket.send_json({
+            "type": "result",
+            "success": success,
+            "message": "Locker unlocked successfully!" if success else "Face verification failed. Please try again.",
+            "user_id": user_id,
+            "locker_id": locker_id,
+            "frames_rejected": frames_rejected,
+            **session.summary()
+        })
+        await websocket.close()
+    
+    except WebSocketDisconnect:
+        print("📴 Streaming unlock client disconnected")
+    except Exception as e:
+        print(f"❌ Error in streaming unlock: {e}")
+    finally:
+        if receiver is not None:
+            receiver.cancel()
+
+# ============================================================================
+# 4. BULK ENROLLMENT API (Admin)
+# ============================================================================
+
+@app.post("/api/face/admin/bulk-import")
+async def bulk_import_faces(
+    file: UploadFile = File(..., description="Zip archive laid out as <user_id>/<image>")
+):
+    """
+    Enroll many users at once
+    
+    Accepts a zip archive laid out like the face images folder
+    (<user_id>/<image>). All images are encoded in the background pool, so
+    verify/unlock requests are not queued behind the import, and loaded
+    into the gallery together. Directories on the server are imported with
+    bulk_import_faces.py instead.
+    """
+    
+    temp_path = None
+    try:
+        # Spool the upload to disk so workers can read members directly
+        with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tmp:
+            temp_path = tmp.name
+            await asyncio.to_thread(shutil.copyfileobj, file.file, tmp)
+        source = temp_path
+        
+        try:
+            report = await asyncio.to_thread(run_bulk_import, source, get_background_executor())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # Load every imported user into the gallery in one step; the temp path stays server-side
+        encodings = report.pop("encodings")
+        report.pop("source")
+        store_imported_faces(encodings)
+        
+        print(f"✅ Bulk import loaded {len(encodings)} user(s) into the gallery")
+        
+        return {
+            "success": True,
+            "message": f"Imported {report['imported_images']} of {report['total_images']} image(s)",
+            **report
+        }
+    
+    finally:
+        if temp_path is not None:
+            os.remove(temp_path)
+
+@app.post("/api/face/admin/rebuild-gallery")
+async def rebuild_gallery(
+    full: bool = Form(False, description="Re-encode every image instead of only new or changed ones")
+):
+    """
+    Rebuild the gallery from the face image store
+    
+    Only images whose content hash has no encoding in the rebuild manifest
+    are encoded (in the background pool, so verify/unlock requests are not
+    queued behind the rebuild), then the new gallery replaces
+    the live one in one step. Users registered (or updated by the gallery
+    watcher) during the rebuild, and users
+    without images in the store (e.g. bulk-imported), keep their current
+    templates.
+    """
+    started_at = time.time()
+    try:
+        new_gallery, report = await asyncio.to_thread(run_gallery_rebuild, image_store, get_background_executor(), full)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    rebuilt_users = set(new_gallery.user_ids)
+    keep_users = {user_id for user_id in get_face_gallery().user_ids if user_id not in rebuilt_users}
+    keep_users.update(image_store.users_changed_since(started_at))
+    if gallery_watcher is not None:
+        keep_users.update(gallery_watcher.users_applied_since(started_at))
+    gallery = swap_face_gallery(new_gallery, keep_users)
+    
+    return {
+        "success": True,
+        "message": f"Gallery rebuilt: encoded {report['encoded_images']} of {report['total_images']} image(s)",
+        **report,
+        "kept_users": len(keep_users),
+        "gallery_size": len(gallery)
+    }
+
 # ============================================================================
 # UTILITY ENDPOINTS
 # ============================================================================
@@ -298,9 +597,23 @@ async def health_check():
     return {
         "status": "healthy", 
         "service": "Face Recognition API",
-        "registered_users": list(REGISTERED_FACES.keys())
+        "registered_users": get_face_gallery().user_ids
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 once the gallery is mapped and all models are warm, 503 before"""
+    ready = all(readiness.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "warming_up", **readiness}
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Per-stage latency histograms in the Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/face/status")
 async def face_recognition_status():
     """Check if face recognition service is working"""
@@ -309,112 +622,168 @@ async def face_recognition_status():
         "service": "Face Recognition API",
         "face_images_dir": FACE_IMAGES_DIR,
         "available": os.path.exists(FACE_IMAGES_DIR),
-        "registered_users": list(REGISTERED_FACES.keys()),
+        "registered_users": get_face_gallery().user_ids,
+        "encoding_cache": encoding_cache.stats(),
+        "encode_batching": encode_batcher.stats(),
+        "image_writer": image_writer.stats(),
+        "image_store": image_store.stats(),
+        "gallery_watcher": gallery_watcher.stats() if gallery_watcher is not None else None,
+        "face_detector": {"default": FACE_DETECTOR, "backends": detector_status()},
+        "ann_index": get_face_gallery().ann.stats() if get_face_gallery().ann is not None else None,
         "endpoints": {
             "register": "/api/face/register - Register user face",
             "verify": "/api/face/verify - Verify user face",
-            "test_image": "/api/face/test-image - Test image processing",
-            "list_images": "/api/face/list-images/{user_id} - List user's face images"
+            "unlock_stream": "/api/face/unlock-stream - Unlock locker from a WebSocket stream of camera frames (ws)",
+            "test_image": "/api/face/test-image - Test image processing (face detection only)",
+            "bulk_import": "/api/face/admin/bulk-import - Bulk enroll users from a zip archive",
+            "rebuild_gallery": "/api/face/admin/rebuild-gallery - Re-encode new images and swap in a rebuilt gallery",
+            "list_images": "/api/face/list-images/{user_id}?limit=&cursor=&since=&until= - List user's face images (paginated)"
         }
     }
 
+def encode_list_cursor(position) -> str:
+    """Opaque cursor for the image listing from (created, filename)"""
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip("=")
+
+def decode_list_cursor(cursor: str):
+    try:
+        created, filename = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(created), str(filename)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_time_filter(value: Optional[str], name: str) -> Optional[float]:
+    """ISO 8601 date/time (or epoch seconds) to epoch seconds"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid '{name}': expected an ISO 8601 date/time or epoch seconds")
+
 @app.get("/api/face/list-images/{user_id}")
-async def list_user_images(user_id: str):
-    """List all face images for a specific user"""
-    user_dir = os.path.join(FACE_IMAGES_DIR, user_id)
+async def list_user_images(
+    user_id: str,
+    request: Request,
+    limit: int = Query(LIST_IMAGES_PAGE_SIZE, ge=1, le=LIST_IMAGES_MAX_PAGE_SIZE, description="Images per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    since: Optional[str] = Query(None, description="Only images created at or after this time (ISO 8601 or epoch seconds)"),
+    until: Optional[str] = Query(None, description="Only images created before this time (ISO 8601 or epoch seconds)")
+):
+    """
+    List a user's face images, newest first, one page at a time
     
-    if not os.path.exists(user_dir):
-        return {
-            "user_id": user_id,
-            "message": "No images found for this user",
-            "images": [],
-            "total_images": 0
-        }
+    Served from the image store's per-user index (no directory scan per
+    request). Responses carry ETag and Last-Modified; a matching
+    If-None-Match or an up-to-date If-Modified-Since returns 304.
+    """
+    after = decode_list_cursor(cursor) if cursor else None
+    since_ts = parse_time_filter(since, "since")
+    until_ts = parse_time_filter(until, "until")
     
     try:
-        # Get all image files in user directory
-        image_files = []
-        for filename in os.listdir(user_dir):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
-                file_path = os.path.join(user_dir, filename)
-                file_stat = os.stat(file_path)
-                image_files.append({
-                    "filename": filename,
-                    "file_path": file_path,
-                    "file_size": file_stat.st_size,
-                    "created_time": datetime.fromtimestamp(file_stat.st_ctime).isoformat(),
-                    "modified_time": datetime.fromtimestamp(file_stat.st_mtime).isoformat()
-                })
-        
-        # Sort by creation time (newest first)
-        image_files.sort(key=lambda x: x["created_time"], reverse=True)
+        # First listing of a user scans the legacy folder, keep it off the event loop
+        index = await asyncio.to_thread(image_store.image_index, user_id)
+        
+        # Validators change whenever an image is added to the user's index
+        etag = '"' + hashlib.blake2b(
+            f"{user_id}|{index.version}|{index.last_modified}|{limit}|{cursor}|{since}|{until}".encode(),
+            digest_size=12
+        ).hexdigest() + '"'
+        last_modified = formatdate(index.last_modified, usegmt=True)
+        headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "no-cache"}
+        
+        if_none_match = request.headers.get("if-none-match")
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_none_match is not None:
+            not_modified = etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        elif if_modified_since is not None:
+            try:
+                not_modified = int(index.last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                not_modified = False
+        else:
+            not_modified = False
+        if not_modified:
+            return Response(status_code=304, headers=headers)
         
-        return {
+        if len(index) == 0:
+            return JSONResponse(content={
+                "user_id": user_id,
+                "message": "No images found for this user",
+                "images": [],
+                "total_images": 0,
+                "next_cursor": None
+            }, headers=headers)
+        
+        images, total, next_position = index.page(after, limit, since_ts, until_ts)
+        
+        return JSONResponse(content={
             "user_id": user_id,
-            "user_directory": user_dir,
-            "total_images": len(image_files),
-            "images": image_files
-        }
+            "user_directory": image_store.user_dir(user_id),
+            "total_images": total,
+            "count": len(images),
+            "images": images,
+            "next_cursor": encode_list_cursor(next_position) if next_position else None
+        }, headers=headers)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing images: {str(e)}")
 
 @app.post("/api/face/test-image")
 async def test_image_processing(
-    file: UploadFile = File(..., description="Image file to test")
+    file: UploadFile = File(..., description="Image file to test"),
+    detector: Optional[str] = Form(None, description=DETECTOR_FIELD_DESCRIPTION)
 ):
     """Test image processing without face recognition"""
     
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    detector = request_detector(detector)
+    
+    # Read image data, stopping early if it is too large
+    image_data = await read_image_file(file)
+    
     try:
-        # Read image data
-        image_data = await file.read()
+        # Decode (reduced for large images) and detect faces in the face-compute pool
+        located, profile = await run_face_task(locate_faces, image_data, detector)
+        record_encode_profile(profile)
         
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
+        if located is None:
             return {
                 "success": False,
                 "message": "Could not decode image",
                 "image_info": None
             }
         
-        # Create test directory
-        test_dir = os.path.join(FACE_IMAGES_DIR, "test_images")
-        os.makedirs(test_dir, exist_ok=True)
-        
-        # Save test image with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        test_filename = f"test_{timestamp}_{uuid.uuid4().hex[:8]}.jpg"
-        test_filepath = os.path.join(test_dir, test_filename)
-        
-        with open(test_filepath, "wb") as f:
-            f.write(image_data)
-        
-        # Convert BGR to RGB for face detection
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Try face detection
-        face_locations = face_recognition.face_locations(rgb_image)
+        # Save test image (stored once however often it is tested)
+        entry = await image_store.put("test_images", image_data)
+        test_filename = entry["filename"]
+        test_filepath = image_store.path_of(entry)
         
         return {
             "success": True,
             "message": "Image processed successfully",
             "image_info": {
-                "shape": image.shape,
+                "shape": located["shape"],
                 "filename": test_filename,
                 "file_path": test_filepath,
                 "file_size": len(image_data),
                 "content_type": file.content_type,
-                "faces_detected": len(face_locations),
-                "face_locations": face_locations
+                "detector": detector,
+                "detection_ms": round(profile["stages"].get("detection", 0.0) * 1000, 2),
+                "faces_detected": len(located["face_locations"]),
+                "face_locations": located["face_locations"]
             }
         }
         
+    except UploadRejected as e:
+        raise upload_rejected(e)
     except Exception as e:
         return {
             "success": False,
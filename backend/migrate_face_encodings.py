@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Script to migrate text face encodings in the database to the binary format
+
+Older rows store face_data.face_encoding as str(encoding.tolist()). This
+rewrites every such row as a binary record (see
+face_recognition_local/encoding_store.py) in a single transaction. Rows that
+are already binary are left untouched, so the script can be re-run safely.
+
+Only SQLite is supported: text rows are found with SQLite's typeof().
+"""
+
+from sqlalchemy import text
+
+from config.database import engine
+from face_recognition_local.encoding_store import pack_encoding, parse_legacy_encoding
+
+BATCH_SIZE = 1000
+
+def migrate_face_encodings():
+    """Convert all text face encodings to binary records"""
+    print("🔧 Migrating face encodings to binary format...")
+    
+    if engine.dialect.name != "sqlite":
+        print(f"❌ Only SQLite databases can be migrated (got {engine.dialect.name})")
+        return
+    
+    migrated_count = 0
+    failed_count = 0
+    
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            "SELECT id, face_encoding FROM face_data WHERE typeof(face_encoding) = 'text'"
+        )).fetchall()
+        
+        print(f"📁 Found {len(rows)} text encodings to migrate")
+        
+        updates = []
+        for row_id, encoding_text in rows:
+            try:
+                updates.append({"id": row_id, "blob": pack_encoding(parse_legacy_encoding(encoding_text))})
+            except Exception as e:
+                print(f"❌ Error parsing encoding of row {row_id}: {e}")
+                failed_count += 1
+        
+        for start in range(0, len(updates), BATCH_SIZE):
+            batch = updates[start:start + BATCH_SIZE]
+            conn.execute(text("UPDATE face_data SET face_encoding = :blob WHERE id = :id"), batch)
+            migrated_count += len(batch)
+    
+    print("\n📊 Migration complete:")
+    print(f"   ✅ Migrated: {migrated_count} rows")
+    print(f"   ⚠️  Skipped: {failed_count} rows")
+
+if __name__ == "__main__":
+    migrate_face_encodings()
@@ -1,79 +1,251 @@
 #!/usr/bin/env python3
 """
 Script to organize existing face images into user-specific folders
+
+Flat files named user_<user_id>_<...>.jpg are moved to
+<user_id>/face_legacy_<mtime>_<filename>. The timestamp is the file's own
+modification time, so the target name is the same on every run.
+
+The migration is journaled in <images dir>/organize_journal.jsonl: the first
+run lists the directory once and records every planned move, then moves
+files in per-user batches on several threads and records each finished
+batch. A rerun after an interruption replays the journal instead of
+listing the directory again and skips the moves that are done.
 """
 
+import argparse
+import errno
+import json
 import os
 import shutil
-import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import FACE_IMAGES_DIR
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
 
-# Directory containing face images
-FACE_IMAGES_DIR = "face_recognition_local/data/faces"
+JOURNAL_NAME = "organize_journal.jsonl"
 
-def extract_user_id_from_filename(filename):
+# (source filename, user_id, target filename)
+PlannedMove = Tuple[str, str, str]
+
+def extract_user_id_from_filename(filename: str) -> Optional[str]:
     """Extract user ID from filename like 'user_owner_xxx.jpg'"""
-    match = re.match(r'user_(.+?)_', filename)
-    if match:
-        return match.group(1)
-    return None
+    if not filename.startswith("user_"):
+        return None
+    user_id, separator, _ = filename[5:].partition("_")
+    return user_id if separator and user_id else None
+
+def legacy_filename(filename: str, mtime: float) -> str:
+    """Target name of a migrated file, stable across runs"""
+    return f"face_legacy_{datetime.fromtimestamp(mtime).strftime('%Y%m%d_%H%M%S')}_{filename}"
+
+def plan_moves(images_dir: str) -> Tuple[List[PlannedMove], List[str]]:
+    """
+    List the flat image files of images_dir and plan their moves
+    :return: Tuple of (planned moves, files skipped because no user ID could be extracted)
+    """
+    moves = []
+    skipped = []
+    with os.scandir(images_dir) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                continue
+            user_id = extract_user_id_from_filename(entry.name)
+            if not user_id:
+                skipped.append(entry.name)
+                continue
+            moves.append((entry.name, user_id, legacy_filename(entry.name, entry.stat().st_mtime)))
+    return moves, skipped
+
+class MoveJournal:
+    """JSON-lines journal of planned and finished moves"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.planned: List[PlannedMove] = []
+        self.skipped: List[str] = []
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn line from an interrupted run
+                        continue
+                    if record[0] == "plan":
+                        self.planned.append(tuple(record[1:]))
+                    elif record[0] == "skip":
+                        self.skipped.append(record[1])
+                    elif record[0] == "done":
+                        self.done.update(record[1:])
+
+    @property
+    def has_plan(self) -> bool:
+        return bool(self.planned or self.skipped)
+
+    def _append(self, records: List[list]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record_plan(self, moves: List[PlannedMove], skipped: List[str]):
+        self._append([["plan", *move] for move in moves] + [["skip", name] for name in skipped])
+        self.planned.extend(moves)
+        self.skipped.extend(skipped)
+
+    def record_done(self, sources: List[str]):
+        if sources:
+            self._append([["done", *sources]])
+            self.done.update(sources)
+
+def move_batch(images_dir: str, user_id: str, moves: List[PlannedMove]) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """
+    Move one user's files (runs on a worker thread)
+    :return: Tuple of (moved source names, (source name, error) per failure)
+    """
+    user_dir = os.path.join(images_dir, user_id)
+    os.makedirs(user_dir, exist_ok=True)
+    moved, failed = [], []
+    for source, _, target in moves:
+        old_path = os.path.join(images_dir, source)
+        new_path = os.path.join(user_dir, target)
+        try:
+            os.rename(old_path, new_path)
+        except FileNotFoundError:
+            if os.path.exists(new_path):
+                # Moved by a run that stopped before journaling it
+                moved.append(source)
+            else:
+                failed.append((source, "file not found"))
+            continue
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                failed.append((source, str(e)))
+                continue
+            # Different filesystem: copy and delete
+            try:
+                shutil.move(old_path, new_path)
+            except Exception as e:
+                failed.append((source, str(e)))
+                continue
+        moved.append(source)
+    return moved, failed
 
-def organize_existing_images():
-    """Organize existing images into user-specific folders"""
+def organize_existing_images(
+    images_dir: str = FACE_IMAGES_DIR,
+    workers: int = 8,
+    batch_size: int = 500,
+    rescan: bool = False,
+    dry_run: bool = False
+) -> dict:
+    """
+    Organize existing images into user-specific folders
+    :param images_dir: Directory holding the flat legacy files
+    :param workers: Threads moving files concurrently
+    :param batch_size: Moves per batch (one journal write per batch)
+    :param rescan: List the directory again and plan new files, even if a journal exists
+    :param dry_run: Only plan and print the moves
+    :return: Report with counts and throughput
+    """
     print("🔧 Organizing existing face images...")
-    
-    if not os.path.exists(FACE_IMAGES_DIR):
-        print(f"❌ Directory not found: {FACE_IMAGES_DIR}")
-        return
-    
-    # Get all files in the directory
-    files = [f for f in os.listdir(FACE_IMAGES_DIR) if os.path.isfile(os.path.join(FACE_IMAGES_DIR, f))]
-    
-    print(f"📁 Found {len(files)} files to organize")
-    
+
+    if not os.path.exists(images_dir):
+        print(f"❌ Directory not found: {images_dir}")
+        return {}
+
+    start = time.perf_counter()
+    journal = MoveJournal(os.path.join(images_dir, JOURNAL_NAME))
+
+    if journal.has_plan and not rescan:
+        print(f"📒 Resuming from journal: {len(journal.planned)} planned, {len(journal.done)} done")
+    else:
+        moves, skipped = plan_moves(images_dir)
+        known = {move[0] for move in journal.planned}
+        moves = [move for move in moves if move[0] not in known]
+        known_skipped = set(journal.skipped)
+        skipped = [name for name in skipped if name not in known_skipped]
+        if not dry_run:
+            journal.record_plan(moves, skipped)
+        else:
+            journal.planned.extend(moves)
+            journal.skipped.extend(skipped)
+        print(f"📁 Found {len(moves)} new file(s) to organize ({time.perf_counter() - start:.1f}s to list)")
+
+    for name in journal.skipped:
+        print(f"⚠️  Skipping {name} - cannot extract user ID")
+
+    pending = [move for move in journal.planned if move[0] not in journal.done]
+    if dry_run:
+        for source, user_id, target in pending:
+            print(f"➡️  {source} -> {user_id}/{target}")
+        return {"planned": len(pending), "skipped": len(journal.skipped)}
+
+    # Batches never mix users, so each batch creates at most one folder
+    by_user: Dict[str, List[PlannedMove]] = {}
+    for move in pending:
+        by_user.setdefault(move[1], []).append(move)
+    batches = [
+        (user_id, user_moves[i:i + batch_size])
+        for user_id, user_moves in by_user.items()
+        for i in range(0, len(user_moves), batch_size)
+    ]
+
     organized_count = 0
-    skipped_count = 0
-    
-    for filename in files:
-        if not filename.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
-            continue
-            
-        # Extract user ID from filename
-        user_id = extract_user_id_from_filename(filename)
-        
-        if not user_id:
-            print(f"⚠️  Skipping {filename} - cannot extract user ID")
-            skipped_count += 1
-            continue
-        
-        # Create user directory
-        user_dir = os.path.join(FACE_IMAGES_DIR, user_id)
-        os.makedirs(user_dir, exist_ok=True)
-        
-        # Move file to user directory
-        old_path = os.path.join(FACE_IMAGES_DIR, filename)
-        new_filename = f"face_legacy_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-        new_path = os.path.join(user_dir, new_filename)
-        
-        try:
-            shutil.move(old_path, new_path)
-            print(f"✅ Moved {filename} -> {user_id}/{new_filename}")
-            organized_count += 1
-        except Exception as e:
-            print(f"❌ Error moving {filename}: {e}")
-            skipped_count += 1
-    
-    print(f"\n📊 Organization complete:")
+    failures = []
+    move_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(move_batch, images_dir, user_id, moves) for user_id, moves in batches]
+        for future in futures:
+            moved, failed = future.result()
+            journal.record_done(moved)
+            organized_count += len(moved)
+            failures.extend(failed)
+            elapsed = time.perf_counter() - move_start
+            print(f"⏱️  {organized_count}/{len(pending)} files moved, {organized_count / elapsed:.0f} files/sec")
+
+    elapsed = time.perf_counter() - move_start
+    for source, error in failures:
+        print(f"❌ Error moving {source}: {error}")
+
+    print("\n📊 Organization complete:")
     print(f"   ✅ Organized: {organized_count} files")
-    print(f"   ⚠️  Skipped: {skipped_count} files")
-    
+    print(f"   ⏭️  Already done: {len(journal.planned) - len(pending)} files")
+    print(f"   ⚠️  Skipped: {len(journal.skipped) + len(failures)} files")
+    if organized_count:
+        print(f"   ⏱️  {organized_count / elapsed:.0f} files/sec over {elapsed:.1f}s")
+
     # Show final structure
-    print(f"\n📁 Final directory structure:")
-    for item in os.listdir(FACE_IMAGES_DIR):
-        item_path = os.path.join(FACE_IMAGES_DIR, item)
-        if os.path.isdir(item_path):
-            file_count = len([f for f in os.listdir(item_path) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))])
-            print(f"   📂 {item}/ ({file_count} images)")
+    print("\n📁 Final directory structure:")
+    for user_id in sorted(by_user):
+        user_dir = os.path.join(images_dir, user_id)
+        file_count = sum(1 for name in os.listdir(user_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+        print(f"   📂 {user_id}/ ({file_count} images)")
+
+    return {
+        "organized": organized_count,
+        "already_done": len(journal.planned) - len(pending),
+        "skipped": len(journal.skipped),
+        "failed": len(failures),
+        "elapsed_seconds": round(time.perf_counter() - start, 3),
+        "files_per_second": round(organized_count / elapsed, 1) if elapsed > 0 else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Organize flat legacy face images into per-user folders")
+    parser.add_argument("--dir", default=FACE_IMAGES_DIR, help="Directory holding the flat files")
+    parser.add_argument("--workers", type=int, default=8, help="Threads moving files")
+    parser.add_argument("--batch-size", type=int, default=500, help="Moves per batch (one journal write each)")
+    parser.add_argument("--rescan", action="store_true", help="List the directory again for files added since the journal was made")
+    parser.add_argument("--dry-run", action="store_true", help="Print the planned moves without moving anything")
+    args = parser.parse_args()
+
+    organize_existing_images(args.dir, args.workers, args.batch_size, args.rescan, args.dry_run)
 
 if __name__ == "__main__":
-    organize_existing_images() 
\ No newline at end of file
+    main()
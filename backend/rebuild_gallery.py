@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Script to rebuild the face gallery from the face image store
+
+Only images whose content hash is not in the rebuild manifest (REBUILD_DIR)
+are encoded, across all cores, so nightly runs are incremental and a run
+that was interrupted picks up where it stopped. The rebuilt gallery is
+moved over GALLERY_PATH; while the API is running, use
+POST /api/face/admin/rebuild-gallery instead, which swaps it in live.
+"""
+
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from config.settings import FACE_WORKERS, FACE_IMAGES_DIR, GALLERY_PATH
+from face_recognition_local.executor import init_face_worker
+from face_recognition_local.gallery_rebuild import run_gallery_rebuild
+from face_recognition_local.gallery_store import MappedGalleryIndex, install_rebuilt_gallery
+from face_recognition_local.image_store import ImageStore
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the face gallery from the face image store")
+    parser.add_argument("--images-dir", default=FACE_IMAGES_DIR, help="Face image store to rebuild from")
+    parser.add_argument("--workers", type=int, default=FACE_WORKERS, help="Number of encoding processes")
+    parser.add_argument("--full", action="store_true", help="Re-encode every image, ignoring the manifest")
+    parser.add_argument("--manifest-only", action="store_true",
+                        help="Only encode new images into the manifest; leave the gallery untouched")
+    args = parser.parse_args()
+    
+    print(f"🔧 Rebuilding gallery from {args.images_dir} with {args.workers} worker(s)...")
+    
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_face_worker
+    ) as executor:
+        new_gallery, report = run_gallery_rebuild(
+            ImageStore(args.images_dir), executor, args.full, max_in_flight=2 * args.workers
+        )
+    
+    print("\n📊 Gallery rebuild complete:")
+    print(f"   🖼️  Images: {report['total_images']} ({report['encoded_images']} encoded, {report['reused_encodings']} reused)")
+    print(f"   ❌ Failed: {len(report['failed'])} images")
+    print(f"   ⏱️  {report['images_per_second']} images/sec, {report['elapsed_seconds']}s in total")
+    
+    if args.manifest_only:
+        os.remove(new_gallery.path)
+        os.remove(new_gallery.ids_path)
+        return
+    
+    # Users without images in the store (e.g. bulk-imported) keep their templates
+    old_gallery = MappedGalleryIndex(GALLERY_PATH) if os.path.exists(GALLERY_PATH) else None
+    rebuilt_users = set(new_gallery.user_ids)
+    keep_users = [user_id for user_id in (old_gallery.user_ids if old_gallery else []) if user_id not in rebuilt_users]
+    install_rebuilt_gallery(new_gallery, old_gallery, keep_users)
+    
+    print(f"   💾 Gallery written to {GALLERY_PATH}: {len(new_gallery)} template(s) for {new_gallery.n_users} user(s)")
+    print(f"      ({len(keep_users)} user(s) without images kept their templates)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Shared fixtures for the unit tests.
+
+The tests cover the pure NumPy/file-format parts of face_recognition_local
+and never import face_engine, so they run without dlib or face_recognition.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Modules import each other as top-level packages (config, face_recognition_local)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+@pytest.fixture
+def make_encodings(rng):
+    """Factory of unit-length float32 vectors, roughly like dlib face encodings"""
+    def make(n: int, dim: int = 128) -> np.ndarray:
+        vectors = rng.normal(size=(n, dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return make
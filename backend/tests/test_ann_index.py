@@ -0,0 +1,53 @@
+import numpy as np
+
+from face_recognition_local.ann_index import IVFIndex
+from face_recognition_local.gallery_index import GalleryIndex
+
+def build_gallery(make_encodings, n_users: int = 2000, nprobe: int = 8):
+    gallery = GalleryIndex(capacity=n_users)
+    gallery.add_many([f"u{i}" for i in range(n_users)], make_encodings(n_users))
+    # min_size keeps training out of the background thread; it is trained explicitly
+    ann = IVFIndex(gallery, n_lists=32, nprobe=nprobe, min_size=10 ** 9)
+    ann.train(seed=0)
+    gallery.attach_ann(ann)
+    return gallery, ann
+
+def probes(gallery, rng, n: int = 200, noise: float = 0.05) -> np.ndarray:
+    """Noisy copies of stored encodings, like a second photo of an enrolled user"""
+    rows = gallery._matrix[rng.choice(len(gallery), n, replace=False)]
+    return rows + rng.normal(scale=noise, size=rows.shape).astype(np.float32)
+
+def recall_at_1(gallery, ann, queries, nprobe=None) -> float:
+    hits = sum(
+        ann.search(query, 1, nprobe)[0][0] == gallery.exact_search(query, 1)[0][0]
+        for query in queries
+    )
+    return hits / len(queries)
+
+def test_recall_against_exact_search(make_encodings, rng):
+    gallery, ann = build_gallery(make_encodings)
+    assert ann.is_trained
+
+    assert recall_at_1(gallery, ann, probes(gallery, rng)) >= 0.95
+
+def test_scanning_every_list_is_exact(make_encodings, rng):
+    gallery, ann = build_gallery(make_encodings)
+    queries = probes(gallery, rng, n=50, noise=0.5)
+
+    for query in queries:
+        assert ann.search(query, 5, nprobe=32) == gallery.exact_search(query, 5)
+
+def test_rows_added_after_training_are_found(make_encodings, rng):
+    gallery, ann = build_gallery(make_encodings)
+    new = make_encodings(20)
+    gallery.add_many([f"new{i}" for i in range(20)], new)
+
+    for i, vector in enumerate(new):
+        assert ann.search(vector, 1)[0][0] == f"new{i}"
+
+def test_removed_rows_are_not_returned(make_encodings, rng):
+    gallery, ann = build_gallery(make_encodings)
+    target = gallery.get("u7")[0].copy()
+    gallery.remove("u7")
+
+    assert "u7" not in [user_id for user_id, _ in ann.search(target, 5, nprobe=32)]
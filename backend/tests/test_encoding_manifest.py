@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from face_recognition_local.gallery_rebuild import RECORD, EncodingManifest
+
+@pytest.fixture
+def results(make_encodings):
+    encodings = make_encodings(3)
+    return [("a" * 64, encodings[0]), ("b" * 64, None), ("c" * 64, encodings[1])], encodings
+
+def test_results_survive_a_restart(tmp_path, results):
+    records, encodings = results
+    manifest = EncodingManifest(str(tmp_path), "v1")
+    manifest.append(records[:2])
+    manifest.append(records[2:])
+    manifest.close()
+
+    resumed = EncodingManifest(str(tmp_path), "v1")
+
+    assert len(resumed) == 3
+    assert "b" * 64 in resumed
+    np.testing.assert_array_equal(resumed.get("a" * 64), encodings[0])
+    np.testing.assert_array_equal(resumed.get("c" * 64), encodings[1])
+    assert resumed.get("b" * 64) is None
+    assert resumed.get("d" * 64) is None
+    resumed.close()
+
+def test_appending_after_a_restart(tmp_path, results, make_encodings):
+    records, _ = results
+    manifest = EncodingManifest(str(tmp_path), "v1")
+    manifest.append(records)
+    manifest.close()
+
+    resumed = EncodingManifest(str(tmp_path), "v1")
+    extra = make_encodings(1)[0]
+    resumed.append([("d" * 64, extra)])
+    np.testing.assert_array_equal(resumed.get("d" * 64), extra)
+    resumed.close()
+
+    assert len(EncodingManifest(str(tmp_path), "v1")) == 4
+
+def test_torn_record_is_dropped(tmp_path, results):
+    records, encodings = results
+    manifest = EncodingManifest(str(tmp_path), "v1")
+    manifest.append(records)
+    manifest.close()
+    path = os.path.join(str(tmp_path), "encodings.bin")
+    with open(path, "ab") as f:
+        # A crash in the middle of the next append
+        f.write(b"x" * (RECORD.itemsize // 2))
+
+    resumed = EncodingManifest(str(tmp_path), "v1")
+
+    assert len(resumed) == 3
+    assert os.path.getsize(path) == 3 * RECORD.itemsize
+    np.testing.assert_array_equal(resumed.get("c" * 64), encodings[1])
+    resumed.close()
+
+@pytest.mark.parametrize("version, full", [("v2", False), ("v1", True)])
+def test_new_model_version_or_full_rebuild_starts_over(tmp_path, results, version, full):
+    records, _ = results
+    manifest = EncodingManifest(str(tmp_path), "v1")
+    manifest.append(records)
+    manifest.close()
+
+    resumed = EncodingManifest(str(tmp_path), version, full=full)
+
+    assert len(resumed) == 0
+    assert "a" * 64 not in resumed
+    resumed.close()
@@ -0,0 +1,56 @@
+import json
+
+import numpy as np
+import pytest
+
+from face_recognition_local.encoding_store import (
+    HEADER, decode_stored_encoding, decode_stored_encodings, is_binary_encoding, pack_encoding,
+    unpack_encoding, unpack_encodings
+)
+
+def test_round_trip(make_encodings):
+    encoding = make_encodings(1)[0]
+    record = pack_encoding(encoding)
+
+    assert len(record) == HEADER.size + 128 * 4
+    assert is_binary_encoding(record)
+    np.testing.assert_array_equal(unpack_encoding(record), encoding)
+
+def test_float64_is_stored_as_float32(rng):
+    encoding = rng.normal(size=128)
+    decoded = unpack_encoding(pack_encoding(encoding))
+
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, encoding, rtol=1e-6)
+
+def test_unpack_many(make_encodings):
+    encodings = make_encodings(5)
+    matrix = unpack_encodings([pack_encoding(encoding) for encoding in encodings])
+
+    assert matrix.shape == (5, 128)
+    np.testing.assert_array_equal(matrix, encodings)
+    assert unpack_encodings([]).shape == (0, 128)
+
+def test_legacy_text_and_binary_mixed(make_encodings):
+    encodings = make_encodings(3)
+    values = [
+        pack_encoding(encodings[0]),
+        json.dumps(encodings[1].tolist()),
+        json.dumps(encodings[2].tolist()).encode()
+    ]
+
+    np.testing.assert_allclose(decode_stored_encodings(values), encodings, rtol=1e-6)
+    np.testing.assert_allclose(decode_stored_encoding(values[1]), encodings[1], rtol=1e-6)
+
+@pytest.mark.parametrize("damage", [
+    lambda record: record[:-4],
+    lambda record: b"XXXX" + record[4:],
+    lambda record: record[:4] + bytes([99]) + record[5:]
+])
+def test_damaged_records_are_rejected(make_encodings, damage):
+    with pytest.raises(ValueError):
+        unpack_encoding(damage(pack_encoding(make_encodings(1)[0])))
+
+def test_unpack_many_rejects_wrong_dimension(make_encodings):
+    with pytest.raises(ValueError):
+        unpack_encodings([pack_encoding(make_encodings(1, dim=64)[0])])
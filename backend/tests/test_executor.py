@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from face_recognition_local import executor
+
+def ready():
+    """Stand-in for init_face_worker (spawned workers cannot be monkeypatched)"""
+
+def square(value: int) -> int:
+    return value * value
+
+@pytest.fixture
+def face_pool(monkeypatch):
+    """The shared face pool with two workers that skip loading the models"""
+    monkeypatch.setattr(executor, "FACE_WORKERS", 2)
+    monkeypatch.setattr(executor, "_executor", executor._spawn_pool(2, ready))
+    yield executor._executor
+    executor.shutdown_face_executor()
+
+def test_run_face_task_runs_in_another_process(face_pool):
+    async def run():
+        return await asyncio.gather(executor.run_face_task(square, 7), executor.run_face_task(os.getpid))
+
+    result, pid = asyncio.run(run())
+
+    assert result == 49
+    assert pid != os.getpid()
+
+def test_warm_up_starts_every_worker(face_pool):
+    pids = asyncio.run(executor.warm_up_face_executor())
+
+    assert len(pids) == 2
+    assert os.getpid() not in pids
+
+def test_shutdown_forgets_the_pool(face_pool):
+    executor.shutdown_face_executor()
+
+    assert executor._executor is None
+
+def test_event_loop_keeps_running_during_a_task(face_pool):
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await executor.run_face_task(os.getpid)  # Start the workers first
+        task = asyncio.create_task(ticker())
+        await executor.run_face_task(time.sleep, 0.3)
+        task.cancel()
+
+    asyncio.run(run())
+
+    assert ticks >= 10
+
+def test_init_face_worker_warms_up_the_models(monkeypatch, capsys):
+    calls = []
+    face_engine = types.ModuleType("face_recognition_local.face_engine")
+    face_engine.warm_up_face_models = lambda: calls.append(True) or 0.25
+    monkeypatch.setitem(sys.modules, "face_recognition", types.ModuleType("face_recognition"))
+    monkeypatch.setitem(sys.modules, "face_recognition_local.face_engine", face_engine)
+
+    executor.init_face_worker()
+
+    assert calls == [True]
+    assert "ready (warm-up 250 ms)" in capsys.readouterr().out
+
+def test_bounded_map_keeps_order_and_limit():
+    running, peak = 0, 0
+    lock = threading.Lock()
+
+    def work(value: int) -> int:
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.01)
+        with lock:
+            running -= 1
+        return value * 2
+
+    with ThreadPoolExecutor(8) as pool:
+        assert list(executor.bounded_map(pool, work, range(20), max_in_flight=3)) == [value * 2 for value in range(20)]
+
+    assert peak <= 3
+
+def test_bounded_map_cancels_pending_tasks_when_closed():
+    started = []
+
+    def work(value: int) -> int:
+        started.append(value)
+        time.sleep(0.05)
+        return value
+
+    with ThreadPoolExecutor(1) as pool:
+        results = executor.bounded_map(pool, work, range(100), max_in_flight=4)
+        assert next(results) == 0
+        results.close()
+
+    assert len(started) <= 5
@@ -0,0 +1,50 @@
+import numpy as np
+
+from face_recognition_local.gallery_index import GalleryIndex
+
+def test_removed_slots_are_reused(make_encodings):
+    gallery = GalleryIndex(capacity=4)
+    a, b, c = gallery.add_many(["a", "b", "c"], make_encodings(3))
+
+    assert gallery.remove("b") == 1
+    assert "b" not in gallery
+    assert len(gallery) == 2
+
+    slot = gallery.add("d", make_encodings(1)[0])
+    assert slot == b
+    assert len(gallery) == 3
+    assert gallery.slots_of("d") == [b]
+
+def test_growing_keeps_rows(make_encodings):
+    gallery = GalleryIndex(capacity=2)
+    vectors = make_encodings(5)
+    gallery.add_many([f"u{i}" for i in range(5)], vectors)
+
+    for i in range(5):
+        np.testing.assert_array_equal(gallery.get(f"u{i}"), vectors[i:i + 1])
+
+def test_unknown_user_is_infinitely_far(make_encodings):
+    gallery = GalleryIndex()
+    assert gallery.user_distance(make_encodings(1)[0], "nobody") == float("inf")
+
+def test_search_returns_distinct_users(make_encodings):
+    gallery = GalleryIndex()
+    base = make_encodings(1)[0]
+    # Alice owns the three rows closest to the query
+    gallery.add_many(["alice"] * 3 + ["bob"], np.stack([base, base * 0.99, base * 0.98, -base]))
+
+    result = gallery.exact_search(base, k=2)
+
+    assert [user_id for user_id, _ in result] == ["alice", "bob"]
+
+def test_distances_match_brute_force(make_encodings):
+    gallery = GalleryIndex()
+    vectors = make_encodings(50)
+    gallery.add_many([f"u{i}" for i in range(50)], vectors)
+    gallery.remove("u3")
+    query = make_encodings(1)[0]
+
+    distances = gallery.distances(query)
+
+    np.testing.assert_allclose(distances[gallery.live_slots()], np.linalg.norm(vectors - query, axis=1)[gallery.live_slots()], atol=1e-5)
+    assert distances[3] == np.inf
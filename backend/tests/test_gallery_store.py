@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+
+from face_recognition_local.gallery_store import MappedGalleryIndex
+
+def test_reopened_gallery_has_the_same_rows(tmp_path, make_encodings):
+    path = str(tmp_path / "gallery.bin")
+    encodings = make_encodings(3)
+    gallery = MappedGalleryIndex(path, capacity=2)
+    gallery.add_many(["alice", "bob", "carol"], encodings)
+    gallery.remove("bob")
+    gallery.close()
+
+    reopened = MappedGalleryIndex(path)
+
+    assert sorted(reopened.user_ids) == ["alice", "carol"]
+    np.testing.assert_array_equal(reopened.get("carol")[0], encodings[2])
+    reopened.close()
+
+def test_other_instance_sees_a_reused_slot(tmp_path, make_encodings):
+    path = str(tmp_path / "gallery.bin")
+    encodings = make_encodings(3)
+    writer = MappedGalleryIndex(path)
+    reader = MappedGalleryIndex(path)
+    writer.add_many(["alice", "bob"], encodings[:2])
+    writer.remove("alice")
+    slot = writer.add("carol", encodings[2])
+
+    assert reader.refresh()
+    assert slot == 0
+    assert sorted(reader.user_ids) == ["bob", "carol"]
+    assert reader.user_distance(encodings[2], "carol") < 1e-3
+    writer.close()
+    reader.close()
+
+def test_journal_is_written_before_the_row(tmp_path, make_encodings):
+    class SpyGallery(MappedGalleryIndex):
+        def _assign_slots(self, slots, user_ids):
+            super()._assign_slots(slots, user_ids)
+            with open(self.ids_path, encoding="utf-8") as f:
+                last_line = json.loads(f.read().splitlines()[-1])
+            rows_at_journal.append((last_line, self._matrix[slots[-1]].copy()))
+
+    rows_at_journal = []
+    encodings = make_encodings(2)
+    gallery = SpyGallery(str(tmp_path / "gallery.bin"))
+    gallery.add("alice", encodings[0])
+    gallery.remove("alice")
+    rows_at_journal.clear()
+
+    gallery.add("bob", encodings[1])
+
+    (line, row), = rows_at_journal
+    assert line == [0, "bob"]
+    assert not row.any()  # Freed row not yet overwritten
+    gallery.close()
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from face_recognition_local.gallery_index import GalleryIndex
+
+def test_template_cap_drops_oldest(make_encodings):
+    gallery = GalleryIndex()
+    vectors = make_encodings(5)
+    for vector in vectors:
+        gallery.add_template("alice", vector, max_templates=3)
+
+    np.testing.assert_array_equal(gallery.get("alice"), vectors[2:])
+    assert len(gallery) == 3
+
+def test_template_cap_applies_within_one_call(make_encodings):
+    gallery = GalleryIndex()
+    vectors = make_encodings(4)
+    gallery.add_templates(["alice", "bob", "alice", "alice"], vectors, max_templates=2)
+
+    np.testing.assert_array_equal(gallery.get("alice"), vectors[[2, 3]])
+    np.testing.assert_array_equal(gallery.get("bob"), vectors[[1]])
+
+def test_replace_users_swaps_all_templates(make_encodings):
+    gallery = GalleryIndex()
+    gallery.add_many(["alice", "alice", "bob"], make_encodings(3))
+    new = make_encodings(1)
+
+    gallery.replace_users(["alice"], new)
+
+    np.testing.assert_array_equal(gallery.get("alice"), new)
+    assert len(gallery.get("bob")) == 1
+
+@pytest.mark.parametrize("aggregation", ["min", "centroid", "both"])
+def test_user_distance_aggregation(make_encodings, aggregation):
+    gallery = GalleryIndex()
+    templates = make_encodings(3)
+    gallery.add_many(["alice"] * 3, templates)
+    gallery.add("bob", make_encodings(1)[0])
+    query = make_encodings(1)[0]
+
+    min_distance = np.linalg.norm(templates - query, axis=1).min()
+    centroid_distance = np.linalg.norm(templates.mean(axis=0) - query)
+    expected = {
+        "min": min_distance,
+        "centroid": centroid_distance,
+        "both": max(min_distance, centroid_distance)
+    }[aggregation]
+
+    assert gallery.user_distance(query, "alice", aggregation) == pytest.approx(expected, abs=1e-5)
+
+def test_user_distance_after_removing_a_template(make_encodings):
+    gallery = GalleryIndex()
+    templates = make_encodings(3)
+    slots = gallery.add_many(["alice"] * 3, templates)
+    gallery.remove_slots([slots[0]])
+    query = make_encodings(1)[0]
+
+    expected = np.linalg.norm(templates[1:].mean(axis=0) - query)
+    assert gallery.user_distance(query, "alice", "centroid") == pytest.approx(expected, abs=1e-5)
+
+@pytest.mark.parametrize("aggregation", ["min", "centroid", "both"])
+def test_search_matches_user_distance(make_encodings, aggregation):
+    gallery = GalleryIndex()
+    users = [f"u{i // 3}" for i in range(30)]
+    gallery.add_many(users, make_encodings(30))
+    query = make_encodings(1)[0]
+
+    expected = sorted((gallery.user_distance(query, user_id, aggregation), user_id) for user_id in set(users))[:3]
+    result = gallery.search(query, k=3, aggregation=aggregation)
+
+    assert [user_id for user_id, _ in result] == [user_id for _, user_id in expected]
+    assert [distance for _, distance in result] == pytest.approx([distance for distance, _ in expected], abs=1e-5)
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from config.database import Base, FaceData
+from face_recognition_local import gallery_watcher
+from face_recognition_local.gallery_watcher import GalleryWatcher
+from face_recognition_local.image_store import ImageStore
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """FaceData in a database of its own; records the ids of every query that reads encodings"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'faces.db'}")
+    Base.metadata.create_all(engine)
+    reads = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "face_data.face_encoding AS" in statement:
+            reads.append(tuple(parameters))
+
+    session = sessionmaker(bind=engine)
+    monkeypatch.setattr(gallery_watcher, "SessionLocal", session)
+    yield session, reads
+    engine.dispose()
+
+@pytest.fixture
+def watcher(tmp_path):
+    return GalleryWatcher(ImageStore(str(tmp_path / "faces")), mode="poll", state_path=str(tmp_path / "state.json"))
+
+def test_unchanged_table_reads_no_encodings(database, watcher):
+    session, reads = database
+    with session() as db:
+        db.add_all([FaceData(user_id=1, face_encoding=b"a" * 8), FaceData(user_id=2, face_encoding=b"b" * 8)])
+        db.commit()
+
+    assert watcher._poll_face_data() == {"1", "2"}
+    reads.clear()
+
+    assert watcher._poll_face_data() == set()
+    assert reads == []
+
+def test_only_new_rows_are_checksummed(database, watcher):
+    session, reads = database
+    with session() as db:
+        db.add(FaceData(user_id=1, face_encoding=b"a" * 8))
+        db.commit()
+        watcher._poll_face_data()
+        reads.clear()
+
+        db.add(FaceData(user_id=2, face_encoding=b"b" * 8))
+        db.commit()
+
+    assert watcher._poll_face_data() == {"2"}
+    assert reads == [(2,)]
+
+def test_same_size_edit_is_found_by_the_full_check(database, watcher, monkeypatch):
+    monkeypatch.setattr(gallery_watcher, "FULL_CHECK_POLLS", 2)
+    session, _ = database
+    with session() as db:
+        row = FaceData(user_id=1, face_encoding=b"a" * 8)
+        db.add(row)
+        db.commit()
+        watcher._poll_face_data()
+
+        row.face_encoding = b"c" * 8
+        db.commit()
+
+    assert watcher._poll_face_data() == set()
+    assert watcher._poll_face_data() == {"1"}
@@ -0,0 +1,80 @@
+from face_recognition_local.image_store import UserImageIndex
+
+def build_index(times):
+    index = UserImageIndex()
+    for created in times:
+        index.add(created, {"filename": f"{created:g}.jpg", "created": created})
+    return index
+
+def walk(index, limit, **filters):
+    """Follow next-page cursors to the end; return every item seen"""
+    items, after = [], None
+    while True:
+        page, total, after = index.page(after, limit, **filters)
+        items.extend(page)
+        if after is None:
+            return items, total
+
+def test_pages_are_newest_first_without_gaps_or_repeats():
+    times = [5.0, 1.0, 9.0, 3.0, 7.0, 2.0, 8.0]
+    index = build_index(times)
+
+    items, total = walk(index, limit=3)
+
+    assert total == len(times)
+    assert [item["created"] for item in items] == sorted(times, reverse=True)
+
+def test_cursor_is_the_last_item_of_the_page():
+    index = build_index([1.0, 2.0, 3.0, 4.0])
+
+    page, _, cursor = index.page(limit=2)
+
+    assert [item["created"] for item in page] == [4.0, 3.0]
+    assert cursor == (3.0, "3.jpg")
+    page, _, cursor = index.page(cursor, limit=2)
+    assert [item["created"] for item in page] == [2.0, 1.0]
+    assert cursor is None
+
+def test_items_with_the_same_time_are_paged_by_filename():
+    index = UserImageIndex()
+    for name in ["c.jpg", "a.jpg", "b.jpg"]:
+        index.add(10.0, {"filename": name, "created": 10.0})
+
+    items, _ = walk(index, limit=1)
+
+    assert [item["filename"] for item in items] == ["a.jpg", "b.jpg", "c.jpg"]
+
+def test_keyset_survives_inserts_between_pages():
+    index = build_index([1.0, 2.0, 3.0, 4.0])
+    page, _, cursor = index.page(limit=2)
+
+    # A newer image arrives while the client is paging
+    index.add(5.0, {"filename": "5.jpg", "created": 5.0})
+    page, _, _ = index.page(cursor, limit=2)
+
+    assert [item["created"] for item in page] == [2.0, 1.0]
+
+def test_since_and_until_filters():
+    index = build_index([1.0, 2.0, 3.0, 4.0, 5.0])
+
+    items, total = walk(index, limit=2, since=2.0, until=5.0)
+
+    assert total == 3
+    assert [item["created"] for item in items] == [4.0, 3.0, 2.0]
+
+def test_validators_change_only_with_new_images():
+    index = build_index([1.0, 2.0])
+    version, last_modified = index.version, index.last_modified
+
+    # Adding an image that is already listed keeps the ETag inputs
+    index.add(2.0, {"filename": "2.jpg", "created": 2.0})
+    assert (index.version, index.last_modified) == (version, last_modified)
+
+    index.add(3.0, {"filename": "3.jpg", "created": 3.0})
+    assert index.version == version + 1
+    assert index.last_modified == 3.0
+
+    # An older image changes the version but not Last-Modified
+    index.add(0.5, {"filename": "0.5.jpg", "created": 0.5})
+    assert index.version == version + 2
+    assert index.last_modified == 3.0
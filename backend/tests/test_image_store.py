@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from face_recognition_local import image_store as image_store_module
+from face_recognition_local.image_store import ImageStore
+from face_recognition_local.image_writer import ImageWriteBehind
+
+@pytest.fixture
+def writer(monkeypatch):
+    """A writer of its own that gives up on the first failure"""
+    writer = ImageWriteBehind(max_retries=0)
+    monkeypatch.setattr(image_store_module, "image_writer", writer)
+    yield writer
+    writer.stop()
+
+def test_image_is_taken_back_when_its_blob_cannot_be_written(tmp_path, writer):
+    store = ImageStore(str(tmp_path))
+    (tmp_path / "blobs").write_bytes(b"")  # A file where the directory should be
+    index = store.image_index("alice")
+
+    entry = asyncio.run(store.put("alice", b"\xff\xd8image"))
+    assert store.entries("alice") == [entry]
+    writer.stop()
+
+    assert store.entries("alice") == []
+    assert len(index) == 0
+    assert store.saved == 0
+    assert not (tmp_path / "manifests").exists()
+
+def test_images_saved_by_another_process_are_merged(tmp_path, writer):
+    other, store = ImageStore(str(tmp_path)), ImageStore(str(tmp_path))
+    assert store.entries("alice") == []
+    index = store.image_index("alice")
+
+    entry = asyncio.run(other.put("alice", b"\xff\xd8image"))
+    writer.stop()
+
+    assert store.entries("alice") == [entry]
+    assert store.image_index("alice") is index
+    assert [item["filename"] for item in index.page()[0]] == [entry["filename"]]
+
+def test_rewritten_manifest_is_read_again(tmp_path, writer):
+    store = ImageStore(str(tmp_path))
+    first = asyncio.run(store.put("alice", b"\xff\xd8first"))
+    asyncio.run(store.put("alice", b"\xff\xd8second"))
+    writer.stop()
+    assert len(store.entries("alice")) == 2
+
+    # Rewritten by another tool with only the first line
+    manifest = tmp_path / "manifests" / "alice.jsonl"
+    replacement = tmp_path / "manifest.tmp"
+    replacement.write_bytes(manifest.read_bytes().splitlines(keepends=True)[0])
+    replacement.replace(manifest)
+
+    assert store.entries("alice") == [first]
@@ -0,0 +1,49 @@
+import asyncio
+
+from face_recognition_local import image_writer as image_writer_module
+from face_recognition_local.image_writer import ImageWriteBehind, WriteJob
+
+def test_files_are_in_place_before_appends(tmp_path, monkeypatch):
+    calls = []
+    replace, open_for_append = image_writer_module.os.replace, image_writer_module._open_for_append
+    monkeypatch.setattr(image_writer_module.os, "replace", lambda *args: calls.append("replace") or replace(*args))
+    monkeypatch.setattr(image_writer_module, "_open_for_append", lambda path: calls.append("append") or open_for_append(path))
+    blob = WriteJob(str(tmp_path / "blobs" / "a.jpg"), b"image", "create")
+    line = WriteJob(str(tmp_path / "manifest.jsonl"), b"{}\n", "append", after=blob)
+
+    # The append is first in the batch but written last
+    assert ImageWriteBehind()._write_batch([line, blob]) == []
+
+    assert calls == ["replace", "append"]
+    assert blob.succeeded and line.succeeded
+    assert (tmp_path / "manifest.jsonl").read_bytes() == b"{}\n"
+
+def test_failed_write_is_reported_and_skips_its_append(tmp_path):
+    (tmp_path / "blobs").write_bytes(b"")  # A file where the directory should be
+    failures = []
+    writer = ImageWriteBehind(max_retries=1)
+    blob = writer.submit(str(tmp_path / "blobs" / "a.jpg"), b"image", "create", on_failure=lambda: failures.append("blob"))
+    writer.submit(str(tmp_path / "manifest.jsonl"), b"{}\n", "append", on_failure=lambda: failures.append("line"), after=blob)
+    writer.stop()
+
+    assert failures == ["blob", "line"]
+    assert writer.failed == 2
+    assert not (tmp_path / "manifest.jsonl").exists()
+
+def test_inline_write_when_the_queue_is_full(tmp_path, monkeypatch):
+    writer = ImageWriteBehind(max_queue=1)
+    monkeypatch.setattr(writer, "start", lambda: None)  # Nothing drains the queue
+    writer.submit(str(tmp_path / "queued.jpg"), b"queued")
+    (tmp_path / "blobs").write_bytes(b"")  # A file where the directory should be
+    failures = []
+
+    async def run():
+        written = await writer.write(str(tmp_path / "inline.jpg"), b"inline")
+        failed = await writer.write(str(tmp_path / "blobs" / "a.jpg"), b"x", on_failure=lambda: failures.append(True))
+        return written, failed
+
+    written, failed = asyncio.run(run())
+
+    assert written.succeeded and (tmp_path / "inline.jpg").read_bytes() == b"inline"
+    assert failed.succeeded is False and failures == [True]
+    assert writer.inline_writes == 2
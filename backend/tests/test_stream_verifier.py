@@ -0,0 +1,62 @@
+import asyncio
+import importlib
+import sys
+import types
+
+import numpy as np
+import pytest
+
+class FakeGallery:
+    """Every frame is at the same distance from the user"""
+
+    def __init__(self, distance: float):
+        self.distance = distance
+
+    def user_distance(self, encoding, user_id, aggregation="min"):
+        return self.distance
+
+@pytest.fixture
+def stream_verifier(monkeypatch):
+    """stream_verifier with the face models replaced by one fixed encoding (full-frame detections only)"""
+    async def encode_face_cached(frame, detector=None):
+        return np.zeros(128, dtype=np.float32), (0, 10, 10, 0)
+
+    face_engine = types.ModuleType("face_recognition_local.face_engine")
+    face_engine.FaceBox = tuple
+    face_engine.encode_face_profiled = None
+    encoding_cache = types.ModuleType("face_recognition_local.encoding_cache")
+    encoding_cache.encode_face_cached = encode_face_cached
+    monkeypatch.setitem(sys.modules, "face_recognition_local.face_engine", face_engine)
+    monkeypatch.setitem(sys.modules, "face_recognition_local.encoding_cache", encoding_cache)
+    monkeypatch.delitem(sys.modules, "face_recognition_local.stream_verifier", raising=False)
+    yield importlib.import_module("face_recognition_local.stream_verifier")
+    sys.modules.pop("face_recognition_local.stream_verifier", None)
+
+def run_session(session, frames: int) -> bool:
+    async def run():
+        task = asyncio.create_task(session.run(no_progress))
+        for _ in range(frames):
+            session.submit(b"frame")
+            await asyncio.sleep(0.01)
+        session.close()
+        return await task
+
+    async def no_progress(message):
+        pass
+
+    return asyncio.run(run())
+
+@pytest.mark.parametrize("required_matches", [0, -1])
+def test_session_requires_at_least_one_match(stream_verifier, required_matches):
+    with pytest.raises(ValueError):
+        stream_verifier.StreamVerifier(FakeGallery(1.0), "owner", 0.6, required_matches=required_matches)
+
+def test_non_matching_frames_do_not_unlock(stream_verifier):
+    session = stream_verifier.StreamVerifier(FakeGallery(1.0), "owner", 0.6, max_frames=3, max_in_flight=1, redetect_interval=0)
+
+    assert run_session(session, 3) is False
+
+def test_matching_frame_unlocks(stream_verifier):
+    session = stream_verifier.StreamVerifier(FakeGallery(0.3), "owner", 0.6, max_in_flight=1, redetect_interval=0)
+
+    assert run_session(session, 1) is True
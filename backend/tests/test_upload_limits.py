@@ -0,0 +1,84 @@
+import pickle
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+from face_recognition_local import upload_limits
+from face_recognition_local.upload_limits import (
+    UploadRejected, check_image_data, check_image_size, decode_scale_flag, read_image_size
+)
+
+def encoded(extension: str, width: int, height: int) -> bytes:
+    ok, data = cv2.imencode(extension, np.zeros((height, width, 3), dtype=np.uint8))
+    assert ok
+    return data.tobytes()
+
+@pytest.mark.parametrize("extension", [".jpg", ".png", ".bmp"])
+def test_size_from_header(extension):
+    assert read_image_size(encoded(extension, 320, 240)) == (320, 240)
+
+def test_progressive_jpeg():
+    ok, data = cv2.imencode(".jpg", np.zeros((48, 64, 3), dtype=np.uint8), [cv2.IMWRITE_JPEG_PROGRESSIVE, 1])
+    assert ok
+    assert read_image_size(data.tobytes()) == (64, 48)
+
+def test_jpeg_frame_header_after_large_segment():
+    data = encoded(".jpg", 640, 480)
+    # An APP1 (EXIF-like) segment of 60 KB between SOI and the rest of the file
+    app1 = b"\xff\xe1" + struct.pack(">H", 60000 + 2) + bytes(60000)
+    assert read_image_size(data[:2] + app1 + data[2:]) == (640, 480)
+
+def test_jpeg_with_fill_bytes():
+    data = encoded(".jpg", 100, 50)
+    assert read_image_size(data[:2] + b"\xff\xff" + data[2:]) == (100, 50)
+
+@pytest.mark.parametrize("extension", [".jpg", ".png", ".bmp"])
+def test_truncated_header_needs_more_bytes(extension):
+    assert read_image_size(encoded(extension, 32, 32)[:12]) is None
+
+def test_top_down_bmp_has_positive_height():
+    data = bytearray(encoded(".bmp", 30, 20))
+    struct.pack_into("<i", data, 22, -20)
+    assert read_image_size(bytes(data)) == (30, 20)
+
+def test_unknown_format():
+    assert read_image_size(b"GIF89a" + bytes(32)) is None
+    assert read_image_size(b"") is None
+
+def test_pixel_limit(monkeypatch):
+    monkeypatch.setattr(upload_limits, "MAX_IMAGE_PIXELS", 1000)
+
+    check_image_size((40, 25))
+    check_image_size(None)
+    with pytest.raises(UploadRejected) as error:
+        check_image_size((40, 26))
+    assert error.value.status_code == 413
+
+def test_rejection_keeps_its_status_code_across_processes():
+    error = pickle.loads(pickle.dumps(UploadRejected("Too large", status_code=400)))
+
+    assert str(error) == "Too large"
+    assert error.status_code == 400
+
+def test_byte_limit(monkeypatch):
+    data = encoded(".png", 16, 16)
+    monkeypatch.setattr(upload_limits, "MAX_UPLOAD_BYTES", len(data))
+    assert check_image_data(data) == (16, 16)
+
+    monkeypatch.setattr(upload_limits, "MAX_UPLOAD_BYTES", len(data) - 1)
+    with pytest.raises(UploadRejected):
+        check_image_data(data)
+
+@pytest.mark.parametrize("size, factor", [
+    ((2000, 2000), 1),
+    ((2001, 2000), 2),
+    ((4000, 4000), 2),
+    ((8000, 8000), 4),
+    ((20000, 20000), 8),
+    (None, 1)
+])
+def test_decode_scale(monkeypatch, size, factor):
+    monkeypatch.setattr(upload_limits, "DECODE_MAX_PIXELS", 4000000)
+    assert decode_scale_flag(size)[1] == factor